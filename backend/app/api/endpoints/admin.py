@@ -1,17 +1,27 @@
+import csv
+import io
+import json
 import logging
 import uuid
 import os
-import shutil
 from pathlib import Path
+import anyio
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import text
 
 from app.api.deps import get_db, get_current_user
-from app.core.security import get_password_hash
+from app.api.endpoints.public_view import export_feedback_rows
+from app.core.security import get_password_hash, hash_passwords
 from app.models.user import User
+from app.core.config import settings
+from app.services import jobs, media_gc, room_jobs, room_stats, room_transfer, schema_pool, suggest
+from app.services.search_cache import search_cache
+from app.db.tenancy import _TENANT_RE, SHARED_SCHEMA, shared_mode
+from app.services.local_media import save_upload, remove_files
 from app.schemas.user import UserResponse, RoomCreate, RoomResponse
 from pydantic import BaseModel as _BM
 
@@ -23,7 +33,18 @@ ROOMS_TABLE = "wiki_rooms"
 LOGOS_DIR = Path(__file__).resolve().parents[3] / "media" / "logos"
 
 
-DEFAULT_LOGO_PATH = LOGOS_DIR / "default_logo"
+DEFAULT_LOGO_STEM = "default_logo"
+# Room logos are saved as "{room}-{hash}{ext}" next to it, so match the whole
+# stem and reserve it as a room name.
+DEFAULT_LOGO_PREFIX = f"{DEFAULT_LOGO_STEM}-"
+LOGO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".svg", ".webp", ".gif")
+
+
+def _logo_ext(file: UploadFile) -> str:
+    ext = Path(file.filename or "logo.png").suffix.lower()
+    if ext not in LOGO_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only image files allowed")
+    return ext
 
 
 async def _ensure_tables(db: AsyncSession):
@@ -53,6 +74,14 @@ async def _ensure_tables(db: AsyncSession):
         "  PRIMARY KEY (user_id, room_name)"
         ")"
     ))
+    # Admin user directory: substring search on email, filter by membership
+    await db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)"
+    ))
+    await db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_user_rooms_room_role ON user_rooms (room_name, role)"
+    ))
     # Feedback table (public schema)
     await db.execute(text(
         "CREATE TABLE IF NOT EXISTS feedback ("
@@ -64,14 +93,37 @@ async def _ensure_tables(db: AsyncSession):
         "  created_at TIMESTAMPTZ NOT NULL DEFAULT now()"
         ")"
     ))
+    # Keyset pagination and export read a room's feedback newest first
     await db.execute(text(
-        "CREATE INDEX IF NOT EXISTS idx_feedback_room ON feedback (room_name)"
+        "CREATE INDEX IF NOT EXISTS idx_feedback_room_created ON feedback (room_name, created_at DESC, id DESC)"
+    ))
+    await db.execute(text("DROP INDEX IF EXISTS idx_feedback_room"))
+    # Per-room totals, kept up to date by feedback ingestion
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS feedback_counters ("
+        "  room_name VARCHAR(100) PRIMARY KEY, "
+        "  count BIGINT NOT NULL DEFAULT 0, "
+        "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
     ))
     await db.commit()
 
 
 # ── Rooms ────────────────────────────────────────────────────────────
 
+async def _require_room_role(db: AsyncSession, user: User, room_name: str, roles: tuple[str, ...], detail: str):
+    """Pass superusers and members holding one of ``roles`` in the room; 403 otherwise."""
+    if user.is_superuser:
+        return
+    result = await db.execute(
+        text("SELECT role FROM user_rooms WHERE user_id = :uid AND room_name = :rn"),
+        {"uid": user.id, "rn": room_name},
+    )
+    row = result.fetchone()
+    if not row or row[0] not in roles:
+        raise HTTPException(status_code=403, detail=detail)
+
+
 @router.get("/rooms")
 async def list_rooms(
     db: AsyncSession = Depends(get_db),
@@ -80,12 +132,11 @@ async def list_rooms(
     # Tables initialized at startup (lifespan)
     result = await db.execute(text(
         f"SELECT r.name, r.display_name, r.public_slug, r.logo_url, r.welcome_page_id, "
-        f"COALESCE(f.cnt, 0) as feedback_count, "
+        f"COALESCE(f.count, 0) as feedback_count, "
         f"COALESCE(r.public_title, '') as public_title, "
         f"COALESCE(r.public_subtitle, '') as public_subtitle "
         f"FROM {ROOMS_TABLE} r "
-        f"LEFT JOIN (SELECT room_name, COUNT(*) as cnt FROM feedback GROUP BY room_name) f "
-        f"ON r.name = f.room_name "
+        f"LEFT JOIN feedback_counters f ON r.name = f.room_name "
         f"ORDER BY r.name"
     ))
     rows = result.fetchall()
@@ -99,9 +150,14 @@ async def create_room(
     current_user: User = Depends(get_current_user),
 ):
     # Tables initialized at startup (lifespan)
+    if not _TENANT_RE.match(room.name) or room.name in ("public", SHARED_SCHEMA, DEFAULT_LOGO_STEM) \
+            or room.name.startswith((schema_pool.SPARE_PREFIX, room_jobs.TOMBSTONE_PREFIX)):
+        raise HTTPException(status_code=400, detail="Invalid room name")
     result = await db.execute(text(f"SELECT name FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room.name})
     if result.fetchone():
         raise HTTPException(status_code=400, detail="Room already exists")
+    if await jobs.active_job(db, room_jobs.KIND_DROP_ROOM, room.name):
+        raise HTTPException(status_code=409, detail="A room with this name is still being deleted")
 
     slug = str(uuid.uuid4())[:8]
     await db.execute(
@@ -112,11 +168,13 @@ async def create_room(
         text("INSERT INTO user_rooms (user_id, room_name, role) VALUES (:uid, :rn, 'Owner')"),
         {"uid": current_user.id, "rn": room.name},
     )
-    
-    # Create isolated schema and pages table for the new room
-    await db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{room.name}"'))
-    await db.execute(text(f'CREATE TABLE IF NOT EXISTS "{room.name}".pages (LIKE public.pages INCLUDING ALL)'))
-    
+
+    # Isolated schema for the new room: a pre-built spare if one is ready.
+    # With shared tables there is nothing to create.
+    if not shared_mode() and not await schema_pool.claim(db, room.name):
+        logger.info("Schema pool empty, creating schema for room %s in place", room.name)
+        await schema_pool.create_room_schema(db, room.name)
+
     await db.commit()
     return {"name": room.name, "display_name": room.display_name, "public_slug": slug, "logo_url": None}
 
@@ -172,25 +230,25 @@ async def update_room(
             "welcome_page_id": r[4], "public_title": r[5], "public_subtitle": r[6]}
 
 
-@router.delete("/rooms/{room_name}")
+@router.delete("/rooms/{room_name}", status_code=202)
 async def delete_room(
     room_name: str,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    if not current_user.is_superuser:
-        result = await db.execute(
-            text("SELECT role FROM user_rooms WHERE user_id = :uid AND room_name = :rn"),
-            {"uid": current_user.id, "rn": room_name},
-        )
-        row = result.fetchone()
-        if not row or row[0] != "Owner":
-            raise HTTPException(status_code=403, detail="Only Owner can delete room")
+    """Remove the room at once and drop its schema in a background job."""
+    await _require_room_role(db, current_user, room_name, ("Owner",), "Only Owner can delete room")
+    if not _TENANT_RE.match(room_name):
+        raise HTTPException(status_code=400, detail="Invalid room name")
     await db.execute(text(f"DELETE FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room_name})
     await db.execute(text("DELETE FROM user_rooms WHERE room_name = :rn"), {"rn": room_name})
-    await db.execute(text(f'DROP SCHEMA IF EXISTS "{room_name}" CASCADE'))
+    await room_stats.forget_room(db, room_name)
+    try:
+        job = await room_jobs.start_drop_room(db, room_name, current_user.id)
+    except jobs.JobInProgress:
+        raise HTTPException(status_code=409, detail="Room is already being deleted")
     await db.commit()
-    return {"detail": "Room deleted"}
+    return {"detail": "Room deletion started", "job": job}
 
 
 @router.post("/rooms/{room_name}/toggle-public")
@@ -225,60 +283,98 @@ async def upload_room_logo(
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Superuser required")
 
-    result = await db.execute(text(f"SELECT name FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room_name})
-    if not result.fetchone():
+    result = await db.execute(text(f"SELECT logo_url FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room_name})
+    row = result.fetchone()
+    if not row:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    ext = Path(file.filename or "logo.png").suffix.lower()
-    if ext not in (".png", ".jpg", ".jpeg", ".svg", ".webp", ".gif"):
-        raise HTTPException(status_code=400, detail="Only image files allowed")
-
-    LOGOS_DIR.mkdir(parents=True, exist_ok=True)
-    filename = f"{room_name}{ext}"
-    filepath = LOGOS_DIR / filename
-
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-
-    logo_url = f"/media/logos/{filename}"
+    saved = await save_upload(file, LOGOS_DIR, room_name, _logo_ext(file), settings.LOGO_MAX_BYTES)
+    logo_url = f"/media/logos/{saved.name}"
     await db.execute(
         text(f"UPDATE {ROOMS_TABLE} SET logo_url = :url WHERE name = :n"),
         {"url": logo_url, "n": room_name},
     )
     await db.commit()
+    previous = row[0] or ""
+    if previous.startswith("/media/logos/") and previous != logo_url:
+        await remove_files(LOGOS_DIR, [previous.rsplit("/", 1)[1]])
     return {"logo_url": logo_url}
 
 
 # ── Users ────────────────────────────────────────────────────────────
 
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+ROLES = ("Owner", "Admin", "Editor", "Viewer")
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
 @router.get("/users-with-rooms")
 async def users_with_rooms(
+    q: str | None = None,
+    room: str | None = None,
+    role: str | None = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    # Tables initialized at startup (lifespan)
-    result = await db.execute(text("SELECT id, email, is_active, is_superuser, created_at FROM users ORDER BY id"))
-    users_rows = result.fetchall()
-
-    rooms_result = await db.execute(text("SELECT user_id, room_name, role FROM user_rooms ORDER BY user_id"))
-    room_rows = rooms_result.fetchall()
-
-    user_rooms_map: dict[int, list[dict]] = {}
-    for r in room_rows:
-        user_rooms_map.setdefault(r[0], []).append({"room": r[1], "role": r[2]})
-
-    return [
-        {
-            "id": u[0],
-            "email": u[1],
-            "is_active": u[2],
-            "is_superuser": u[3],
-            "created_at": u[4].isoformat() if u[4] else None,
-            "rooms": user_rooms_map.get(u[0], []),
-        }
-        for u in users_rows
-    ]
+    """One page of users with their room memberships.
 
+    ``q`` matches anywhere in the email (trigram index); ``room`` and
+    ``role`` keep users with such a membership. Rooms are aggregated for
+    the returned page only, in the same query.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    # Tables initialized at startup (lifespan)
+    if role is not None and role not in ROLES:
+        raise HTTPException(status_code=400, detail="Unknown role")
+    conditions, params = [], {}
+    if q and q.strip():
+        conditions.append("u.email ILIKE :pattern")
+        params["pattern"] = _like_pattern(q.strip().lower())
+    if room or role:
+        membership = ["ur.user_id = u.id"]
+        if room:
+            membership.append("ur.room_name = :room")
+            params["room"] = room
+        if role:
+            membership.append("ur.role = :role")
+            params["role"] = role
+        conditions.append(f"EXISTS (SELECT 1 FROM user_rooms ur WHERE {' AND '.join(membership)})")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    total = (await db.execute(text(f"SELECT COUNT(*) FROM users u {where}"), params)).scalar()
+    result = await db.execute(text(
+        "SELECT u.id, u.email, u.is_active, u.is_superuser, u.created_at, "
+        "  COALESCE((SELECT json_agg(json_build_object('room', ur.room_name, 'role', ur.role) "
+        "            ORDER BY ur.room_name) "
+        "            FROM user_rooms ur WHERE ur.user_id = u.id), '[]') AS rooms "
+        f"FROM users u {where}"
+        "ORDER BY u.id LIMIT :limit OFFSET :offset"
+    ), {**params, "limit": page_size, "offset": (page - 1) * page_size})
+
+    return {
+        "items": [
+            {
+                "id": u[0],
+                "email": u[1],
+                "is_active": u[2],
+                "is_superuser": u[3],
+                "created_at": u[4].isoformat() if u[4] else None,
+                "rooms": json.loads(u[5]) if isinstance(u[5], str) else u[5],
+            }
+            for u in result
+        ],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+    }
 
 
 class _CreateUser(_BM):
@@ -355,6 +451,45 @@ class _UserRoomsUpdate(_BM):
     rooms: list[dict]
 
 
+async def _apply_memberships(db: AsyncSession, user_ids: list[int], rooms: list[tuple[str, str]],
+                             replace: bool) -> dict:
+    """Give every user in ``user_ids`` every ``(room, role)`` in ``rooms``.
+
+    Set-based and diffing: new memberships are inserted, ones with another
+    role updated, unchanged rows left alone. With ``replace``, memberships
+    of these users in rooms not listed are removed. Commit is up to the caller.
+    """
+    result = await db.execute(text(
+        "INSERT INTO user_rooms (user_id, room_name, role) "
+        "SELECT u.user_id, r.room_name, r.role "
+        "FROM unnest(CAST(:uids AS INTEGER[])) AS u(user_id) "
+        "CROSS JOIN unnest(CAST(:rooms AS VARCHAR[]), CAST(:roles AS VARCHAR[])) AS r(room_name, role) "
+        "ON CONFLICT (user_id, room_name) DO UPDATE SET role = EXCLUDED.role "
+        "WHERE user_rooms.role IS DISTINCT FROM EXCLUDED.role "
+        "RETURNING (xmax = 0) AS inserted"
+    ), {"uids": user_ids, "rooms": [r for r, _ in rooms], "roles": [role for _, role in rooms]})
+    changed = [row[0] for row in result]
+    removed = 0
+    if replace:
+        result = await db.execute(text(
+            "DELETE FROM user_rooms WHERE user_id = ANY(:uids) AND room_name <> ALL(CAST(:rooms AS VARCHAR[]))"
+        ), {"uids": user_ids, "rooms": [r for r, _ in rooms]})
+        removed = result.rowcount
+    return {"added": sum(changed), "updated": len(changed) - sum(changed), "removed": removed}
+
+
+def _membership_pairs(items: list[dict]) -> list[tuple[str, str]]:
+    """``[{room, role}]`` to unique ``(room, role)`` pairs; unknown roles become Viewer."""
+    pairs: dict[str, str] = {}
+    for item in items:
+        room = item.get("room")
+        if not room:
+            raise HTTPException(status_code=400, detail="Each room entry needs a 'room'")
+        role = item.get("role", "Viewer")
+        pairs[room] = role if role in ROLES else "Viewer"
+    return list(pairs.items())
+
+
 @router.put("/users/{user_id}/rooms")
 async def update_user_rooms(
     user_id: int,
@@ -365,19 +500,142 @@ async def update_user_rooms(
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Superuser required")
     # Tables initialized at startup (lifespan)
-    await db.execute(text("DELETE FROM user_rooms WHERE user_id = :uid"), {"uid": user_id})
-    for item in data.rooms:
-        role = item.get("role", "Viewer")
-        if role not in ("Owner", "Admin", "Editor", "Viewer"):
-            role = "Viewer"
-        await db.execute(
-            text("INSERT INTO user_rooms (user_id, room_name, role) VALUES (:uid, :rn, :role) ON CONFLICT DO NOTHING"),
-            {"uid": user_id, "rn": item["room"], "role": role},
-        )
+    await _apply_memberships(db, [user_id], _membership_pairs(data.rooms), replace=True)
     await db.commit()
     return {"detail": "Rooms updated"}
 
 
+# ── Bulk provisioning ────────────────────────────────────────────────
+
+BULK_MAX_USERS = 1000
+BULK_MAX_MEMBERSHIPS = 100_000
+
+
+class _BulkUser(_BM):
+    email: str
+    password: str
+    rooms: list[dict] = []
+
+
+class _BulkUsers(_BM):
+    users: list[_BulkUser]
+
+
+class _BulkMemberships(_BM):
+    user_ids: list[int]
+    rooms: list[dict]
+    # true: these users end up with exactly these rooms; false: only add/update
+    replace: bool = False
+
+
+def _parse_users_csv(body: str) -> list[_BulkUser]:
+    """CSV with a header: ``email,password[,rooms]``; rooms as ``room:Role;room2:Role``."""
+    reader = csv.DictReader(io.StringIO(body.lstrip("\ufeff")))
+    if not reader.fieldnames or not {"email", "password"} <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV needs 'email' and 'password' columns")
+    users = []
+    for row in reader:
+        rooms = []
+        for entry in (row.get("rooms") or "").split(";"):
+            if entry.strip():
+                room, _, role = entry.strip().partition(":")
+                rooms.append({"room": room.strip(), "role": role.strip() or "Viewer"})
+        users.append(_BulkUser(email=row["email"] or "", password=row["password"] or "", rooms=rooms))
+    return users
+
+
+async def _create_users(db: AsyncSession, users: list[_BulkUser]) -> dict:
+    if len(users) > BULK_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_USERS} users per request")
+    skipped, wanted = [], {}
+    for u in users:
+        email = u.email.lower().strip()
+        if "@" not in email or not u.password:
+            skipped.append({"email": email, "reason": "invalid email or empty password"})
+        elif email in wanted:
+            skipped.append({"email": email, "reason": "duplicate in batch"})
+        else:
+            wanted[email] = u
+
+    existing = await db.execute(text("SELECT email FROM users WHERE email = ANY(:emails)"),
+                                {"emails": list(wanted)})
+    for (email,) in existing:
+        del wanted[email]
+        skipped.append({"email": email, "reason": "already registered"})
+
+    emails = list(wanted)
+    hashes = await hash_passwords([wanted[e].password for e in emails])
+    result = await db.execute(text(
+        "INSERT INTO users (email, hashed_password, is_active, is_superuser) "
+        "SELECT e, h, true, false FROM unnest(CAST(:emails AS VARCHAR[]), CAST(:hashes AS VARCHAR[])) AS t(e, h) "
+        "ON CONFLICT (email) DO NOTHING RETURNING id, email"
+    ), {"emails": emails, "hashes": hashes})
+    created = [{"id": row[0], "email": row[1]} for row in result]
+
+    # Users with the same room set share one set-based statement.
+    by_rooms: dict[tuple, list[int]] = {}
+    for user in created:
+        pairs = tuple(sorted(_membership_pairs(wanted[user["email"]].rooms)))
+        if pairs:
+            by_rooms.setdefault(pairs, []).append(user["id"])
+    for pairs, user_ids in by_rooms.items():
+        await _apply_memberships(db, user_ids, list(pairs), replace=False)
+    await db.commit()
+    return {"created": created, "skipped": skipped}
+
+
+@router.post("/users/bulk")
+async def bulk_create_users(
+    data: _BulkUsers,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Create up to 1000 users (optionally with rooms); existing emails are skipped."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    return await _create_users(db, data.users)
+
+
+@router.post("/users/bulk-csv")
+async def bulk_create_users_csv(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Same as ``/users/bulk`` from a CSV file."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    try:
+        body = (await file.read()).decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+    return await _create_users(db, _parse_users_csv(body))
+
+
+@router.post("/memberships/bulk")
+async def bulk_update_memberships(
+    data: _BulkMemberships,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Assign every listed user to every listed room in one statement."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    user_ids = sorted(set(data.user_ids))
+    pairs = _membership_pairs(data.rooms)
+    if not user_ids or (not pairs and not data.replace):
+        raise HTTPException(status_code=400, detail="Nothing to assign")
+    if len(user_ids) * max(len(pairs), 1) > BULK_MAX_MEMBERSHIPS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_MEMBERSHIPS} memberships per request")
+    result = await db.execute(text("SELECT id FROM users WHERE id = ANY(:ids)"), {"ids": user_ids})
+    missing = set(user_ids) - {row[0] for row in result}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Unknown users: {sorted(missing)}")
+    counts = await _apply_memberships(db, user_ids, pairs, replace=data.replace)
+    await db.commit()
+    return counts
+
+
 # ── My rooms ─────────────────────────────────────────────────────────
 
 @router.get("/my-rooms")
@@ -427,13 +685,24 @@ async def my_role(
 
 # ── Default logo ─────────────────────────────────────────────────────
 
+_default_logo_cache: tuple[int, str | None] | None = None
+
+
 def _find_default_logo() -> str | None:
-    """Find the default logo file in the logos directory."""
-    for ext in (".png", ".jpg", ".jpeg", ".svg", ".webp", ".gif"):
-        p = LOGOS_DIR / f"default_logo{ext}"
-        if p.exists():
-            return f"/media/logos/default_logo{ext}"
-    return None
+    """URL of the default logo; the directory is rescanned only when it changes."""
+    global _default_logo_cache
+    try:
+        mtime = LOGOS_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _default_logo_cache is None or _default_logo_cache[0] != mtime:
+        entries = [
+            entry for entry in os.scandir(LOGOS_DIR)
+            if entry.name.startswith(DEFAULT_LOGO_PREFIX) and Path(entry.name).suffix.lower() in LOGO_EXTENSIONS
+        ]
+        newest = max(entries, key=lambda e: e.stat().st_mtime, default=None)
+        _default_logo_cache = (mtime, f"/media/logos/{newest.name}" if newest else None)
+    return _default_logo_cache[1]
 
 
 @router.get("/default-logo")
@@ -452,22 +721,177 @@ async def upload_default_logo(
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Superuser required")
 
-    ext = Path(file.filename or "logo.png").suffix.lower()
-    if ext not in (".png", ".jpg", ".jpeg", ".svg", ".webp", ".gif"):
-        raise HTTPException(status_code=400, detail="Only image files allowed")
-
-    LOGOS_DIR.mkdir(parents=True, exist_ok=True)
+    saved = await save_upload(file, LOGOS_DIR, DEFAULT_LOGO_STEM, _logo_ext(file), settings.LOGO_MAX_BYTES)
 
     # Remove old default logos
-    for old_ext in (".png", ".jpg", ".jpeg", ".svg", ".webp", ".gif"):
-        old = LOGOS_DIR / f"default_logo{old_ext}"
-        if old.exists():
-            old.unlink()
-
-    filename = f"default_logo{ext}"
-    filepath = LOGOS_DIR / filename
-    with open(filepath, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    names = await anyio.to_thread.run_sync(os.listdir, LOGOS_DIR)
+    await remove_files(LOGOS_DIR, [n for n in names if n.startswith(DEFAULT_LOGO_PREFIX) and n != saved.name])
 
+    filename = saved.name
     logo_url = f"/media/logos/{filename}"
     return {"logo_url": logo_url}
+
+
+# --- Orphaned media collection ---
+
+class _MediaGcStart(_BM):
+    grace_hours: int | None = None
+    dry_run: bool = False
+
+
+@router.post("/media-gc", status_code=202)
+async def start_media_gc(
+    data: _MediaGcStart,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Queue a collection run; a background worker carries it out."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    grace_hours = settings.MEDIA_GC_GRACE_HOURS if data.grace_hours is None else data.grace_hours
+    if grace_hours < 1:
+        raise HTTPException(status_code=400, detail="grace_hours must be at least 1")
+    try:
+        return await media_gc.start_run(db, current_user.id, grace_hours, data.dry_run)
+    except media_gc.RunInProgress:
+        raise HTTPException(status_code=409, detail="A media GC run is already in progress")
+
+
+@router.get("/media-gc")
+async def list_media_gc_runs(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Recent runs with their phase and counters, newest first."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    return await media_gc.list_runs(db)
+
+
+@router.get("/media-gc/{run_id}")
+async def get_media_gc_run(
+    run_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    run = await media_gc.get_run(db, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+
+@router.post("/media-gc/{run_id}/cancel")
+async def cancel_media_gc_run(
+    run_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    if not await media_gc.cancel_run(db, run_id):
+        raise HTTPException(status_code=409, detail="Run is not in progress")
+    return {"detail": "Run cancelled"}
+
+
+# --- Room statistics ---
+
+@router.get("/room-stats")
+async def list_room_stats(
+    days: int = Query(30, ge=1, le=room_stats.ACTIVITY_DAYS),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Size of every room and its edits and feedback over the last ``days`` days.
+
+    Read from the summary tables, so the cost does not grow with room size.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Superuser required")
+    return await room_stats.list_room_stats(db, days)
+
+
+@router.get("/rooms/{room_name}/stats")
+async def get_room_stats(
+    room_name: str,
+    days: int = Query(30, ge=1, le=room_stats.ACTIVITY_DAYS),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Totals of one room and its activity per day, oldest day first."""
+    await _require_room_role(db, current_user, room_name, ("Owner", "Admin"),
+                             "Only Owner or Admin can view room stats")
+    exists = await db.execute(text(f"SELECT 1 FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room_name})
+    if room_name != "public" and not exists.first():
+        raise HTTPException(status_code=404, detail="Room not found")
+    return await room_stats.get_room_stats(db, room_name, days)
+
+
+# --- Room export / import ---
+
+@router.get("/rooms/{room_name}/export")
+async def export_room(
+    room_name: str,
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|zip)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """All pages and versions of a room as NDJSON or ZIP, streamed from a server-side cursor."""
+    await _require_room_role(db, current_user, room_name, ("Owner",), "Only Owner can export room")
+    room = await room_transfer.get_room(db, room_name)
+    if not room or not _TENANT_RE.match(room_name):
+        raise HTTPException(status_code=404, detail="Room not found")
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "application/zip"
+    return StreamingResponse(
+        room_transfer.export_room(room, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="room-{room_name}.{fmt}"'},
+    )
+
+
+@router.get("/rooms/{room_name}/feedback/export")
+async def export_feedback(
+    room_name: str,
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """All feedback of a room as CSV or NDJSON, streamed without loading it into memory."""
+    await _require_room_role(db, current_user, room_name, ("Owner", "Admin"),
+                             "Only Owner or Admin can export feedback")
+    exists = await db.execute(text(f"SELECT 1 FROM {ROOMS_TABLE} WHERE name = :n"), {"n": room_name})
+    if not exists.first():
+        raise HTTPException(status_code=404, detail="Room not found")
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_feedback_rows(room_name, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="feedback-{room_name}.{fmt}"'},
+    )
+
+
+@router.post("/rooms/{room_name}/import")
+async def import_room(
+    room_name: str,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Load an export (NDJSON or ZIP) into an empty room in one transaction."""
+    await _require_room_role(db, current_user, room_name, ("Owner",), "Only Owner can import into room")
+    if not _TENANT_RE.match(room_name) or not await room_transfer.get_room(db, room_name):
+        raise HTTPException(status_code=404, detail="Room not found")
+    try:
+        result = await room_transfer.import_room(db, room_name, file.file)
+    except room_transfer.RoomNotEmpty:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Импорт возможен только в пустую комнату")
+    except room_transfer.InvalidArchive as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    search_cache.bump(room_name)
+    suggest.invalidate(room_name)
+    logger.info("Imported room %s: %s", room_name, result)
+    return result
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_db, get_current_user
+from app.models.user import User
+from app.services import jobs, room_jobs  # noqa: F401  room_jobs registers the job kinds
+
+router = APIRouter()
+
+
+def _check_owner(job: dict | None, user: User) -> dict:
+    """Users see their own jobs; superusers see all."""
+    if not job or (not user.is_superuser and job["created_by"] != user.id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/")
+async def list_jobs(
+    tenant: str | None = None,
+    status: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Recent jobs, newest first: all for a superuser, otherwise the caller's own."""
+    return await jobs.list_jobs(db, None if user.is_superuser else user.id, tenant, status, limit)
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Status and progress (``{"done": n, "total": m}``) of one job."""
+    return _check_owner(await jobs.get_job(db, job_id), user)
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    _check_owner(await jobs.get_job(db, job_id), user)
+    if not await jobs.cancel_job(db, job_id):
+        raise HTTPException(status_code=409, detail="Job cannot be cancelled in its current state")
+    return {"detail": "Job cancelled"}
+
+
+@router.post("/{job_id}/retry")
+async def retry_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Run a failed job again; it resumes from its saved progress."""
+    _check_owner(await jobs.get_job(db, job_id), user)
+    try:
+        job = await jobs.retry_job(db, job_id)
+    except jobs.JobInProgress:
+        raise HTTPException(status_code=409, detail="Another job for the same target is active")
+    if job is None:
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+    return job
@@ -1,19 +1,424 @@
+import os
 import uuid
-from fastapi import APIRouter
-from app.services.storage import generate_presigned_upload_url, generate_presigned_download_url, ensure_bucket
+from typing import List, Optional
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.api.deps import get_db, get_current_user
+from app.core.static_files import file_response
+from app.models.user import User
+from app.services import cas, derivatives, storage, uploads
+from app.services.local_storage import ChecksumMismatch, InvalidKey, LocalStorageBackend, TooLarge
+from app.services.storage import generate_presigned_upload_url, generate_presigned_download_url, get_storage
 
 router = APIRouter()
 
+# boto3 is synchronous: storage calls that go over the network run in the
+# threadpool so a slow MinIO never blocks the event loop. Presigning is local
+# and cheap, so it runs inline.
+
+MAX_BATCH = 200
+
+
+class DownloadUrlsRequest(BaseModel):
+    object_keys: List[str]
+
+
+class UploadUrlsRequest(BaseModel):
+    filenames: List[str]
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(gt=0, le=uploads.MAX_UPLOAD_SIZE)
+    content_type: Optional[str] = None
+
+
+class CasCheckRequest(BaseModel):
+    sha256: str
+    size: int = Field(ge=0)
+    content_type: Optional[str] = None
+
+
+class VariantsRequest(BaseModel):
+    object_keys: List[str]
+
+
+class CasCommitRequest(BaseModel):
+    sha256: str
+
+
+class PartUrlsRequest(BaseModel):
+    part_numbers: List[int]
+
+
+class PartReport(BaseModel):
+    etag: str
+    size: Optional[int] = None
+
+
+def _download_url(object_key: str) -> str:
+    if cas.is_cas_key(object_key):
+        return cas.download_url(object_key)
+    return generate_presigned_download_url(object_key)
+
+
+def _check_batch(items: list):
+    if len(items) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} items per request")
+
+
 @router.post("/upload-url")
 async def get_upload_url(filename: str):
     """Generate a presigned URL for uploading a file to MinIO S3."""
-    ensure_bucket()
+    await run_in_threadpool(get_storage().ensure_ready)  # no-op once verified at startup
     object_key = f"uploads/{uuid.uuid4()}/{filename}"
     url = generate_presigned_upload_url(object_key)
     return {"upload_url": url, "object_key": object_key}
 
+@router.post("/upload-urls")
+async def get_upload_urls(data: UploadUrlsRequest, current_user: User = Depends(get_current_user)):
+    """Generate presigned upload URLs for several files in one request."""
+    _check_batch(data.filenames)
+    await run_in_threadpool(get_storage().ensure_ready)
+    uploads = []
+    for filename in data.filenames:
+        object_key = f"uploads/{uuid.uuid4()}/{filename}"
+        uploads.append({
+            "filename": filename,
+            "object_key": object_key,
+            "upload_url": generate_presigned_upload_url(object_key),
+        })
+    return {"uploads": uploads}
+
 @router.get("/download-url")
 async def get_download_url(object_key: str):
     """Generate a presigned URL for downloading a file from MinIO S3."""
-    url = generate_presigned_download_url(object_key)
+    url = _download_url(object_key)
     return {"download_url": url}
+
+@router.post("/download-urls")
+async def get_download_urls(data: DownloadUrlsRequest):
+    """Presigned download URLs for many objects, e.g. all images of a page."""
+    _check_batch(data.object_keys)
+    return {"urls": {key: _download_url(key) for key in dict.fromkeys(data.object_keys)}}
+
+
+# --- Multipart upload sessions ---
+#
+# POST   /uploads                      start, returns part_size/part_count
+# POST   /uploads/{id}/part-urls       presigned PUT URLs for a batch of parts
+# PUT    /uploads/{id}/parts/{n}       report a finished part (ETag from MinIO)
+# GET    /uploads/{id}                 session state and finished parts, to resume
+# POST   /uploads/{id}/complete        assemble the object
+# DELETE /uploads/{id}                 abort
+
+def _session_out(session: dict, parts: list[dict]) -> dict:
+    return {
+        "session_id": session["id"],
+        "object_key": session["object_key"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "part_size": session["part_size"],
+        "part_count": session["part_count"],
+        "status": session["status"],
+        "parts": parts,
+    }
+
+
+async def _load_session(db: AsyncSession, session_id: str, user: User, active: bool = True) -> dict:
+    session = await uploads.get_session(db, session_id)
+    if not session or (session["created_by"] != user.id and not user.is_superuser):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if active and session["status"] != uploads.STATUS_ACTIVE:
+        raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}")
+    return session
+
+
+@router.post("/uploads", status_code=201)
+async def create_upload_session(
+    data: UploadSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Start a resumable multipart upload for a large file."""
+    if not get_storage().supports_multipart:
+        raise HTTPException(status_code=501, detail="Multipart uploads need S3 storage")
+    await run_in_threadpool(get_storage().ensure_ready)
+    object_key = f"uploads/{uuid.uuid4()}/{data.filename}"
+    upload_id = await run_in_threadpool(storage.create_multipart_upload, object_key, data.content_type)
+    part_size, part_count = uploads.plan_parts(data.size)
+    session_id = str(uuid.uuid4())
+    await db.execute(text(
+        "INSERT INTO public.upload_sessions "
+        "(id, object_key, upload_id, filename, content_type, size, part_size, part_count, created_by) "
+        "VALUES (:id, :key, :upload_id, :filename, :ct, :size, :part_size, :part_count, :uid)"
+    ), {
+        "id": session_id, "key": object_key, "upload_id": upload_id, "filename": data.filename,
+        "ct": data.content_type, "size": data.size, "part_size": part_size,
+        "part_count": part_count, "uid": current_user.id,
+    })
+    await db.commit()
+    return {
+        "session_id": session_id,
+        "object_key": object_key,
+        "part_size": part_size,
+        "part_count": part_count,
+    }
+
+
+@router.get("/uploads/{session_id}")
+async def get_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    session = await _load_session(db, session_id, current_user, active=False)
+    return _session_out(session, await uploads.get_parts(db, session_id))
+
+
+@router.post("/uploads/{session_id}/part-urls")
+async def get_part_urls(
+    session_id: str,
+    data: PartUrlsRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Presigned PUT URLs for a batch of parts; the client reads each part's ETag header."""
+    _check_batch(data.part_numbers)
+    session = await _load_session(db, session_id, current_user)
+    bad = [n for n in data.part_numbers if not 1 <= n <= session["part_count"]]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"Invalid part numbers: {bad}")
+    return {"urls": {
+        str(n): storage.generate_presigned_part_url(session["object_key"], session["upload_id"], n)
+        for n in dict.fromkeys(data.part_numbers)
+    }}
+
+
+@router.put("/uploads/{session_id}/parts/{part_number}")
+async def report_part(
+    session_id: str,
+    part_number: int,
+    data: PartReport,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    session = await _load_session(db, session_id, current_user)
+    if not 1 <= part_number <= session["part_count"]:
+        raise HTTPException(status_code=400, detail="Invalid part number")
+    await uploads.record_part(db, session_id, part_number, data.etag, data.size)
+    await db.commit()
+    return {"ok": True}
+
+
+@router.post("/uploads/{session_id}/complete")
+async def complete_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Assemble the object from its parts.
+
+    The part list comes from S3 itself, so completion works even when some
+    part reports were lost; reports only drive resuming.
+    """
+    session = await _load_session(db, session_id, current_user)
+    parts = await run_in_threadpool(storage.list_uploaded_parts, session["object_key"], session["upload_id"])
+    present = {p["PartNumber"] for p in parts}
+    missing = [n for n in range(1, session["part_count"] + 1) if n not in present]
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing_parts": missing[:MAX_BATCH]})
+    parts = [p for p in parts if p["PartNumber"] <= session["part_count"]]
+    await run_in_threadpool(storage.complete_multipart_upload, session["object_key"], session["upload_id"], parts)
+    await uploads.touch(db, session_id, uploads.STATUS_COMPLETED)
+    await db.commit()
+    return {
+        "object_key": session["object_key"],
+        "download_url": generate_presigned_download_url(session["object_key"]),
+    }
+
+
+@router.delete("/uploads/{session_id}")
+async def abort_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    session = await _load_session(db, session_id, current_user)
+    await run_in_threadpool(storage.abort_multipart_upload, session["object_key"], session["upload_id"])
+    await uploads.touch(db, session_id, uploads.STATUS_ABORTED)
+    await db.commit()
+    return {"ok": True}
+
+
+# --- Content-addressed uploads ---
+#
+# The client hashes the file first. If the object is already stored (by any
+# room) it gets the existing key back and uploads nothing; otherwise it PUTs
+# to the returned URL with the returned headers and then calls /cas/commit.
+
+def _check_hash(sha256: str) -> str:
+    sha256 = sha256.lower()
+    if not cas.is_sha256(sha256):
+        raise HTTPException(status_code=400, detail="sha256 must be 64 hex characters")
+    return sha256
+
+
+@router.post("/cas/check")
+async def cas_check(
+    data: CasCheckRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    sha256 = _check_hash(data.sha256)
+    key = cas.object_key(sha256)
+    obj = await cas.get_object(db, sha256)
+    if obj and obj["status"] == cas.STATUS_READY:
+        return {"exists": True, "object_key": key, "download_url": cas.download_url(key)}
+    if obj is None:
+        await db.execute(text(
+            "INSERT INTO public.media_objects (sha256, size, content_type) VALUES (:h, :size, :ct) "
+            "ON CONFLICT (sha256) DO NOTHING"
+        ), {"h": sha256, "size": data.size, "ct": data.content_type})
+        await db.commit()
+    await run_in_threadpool(get_storage().ensure_ready)
+    upload_url, headers = cas.upload_url(sha256)
+    return {"exists": False, "object_key": key, "upload_url": upload_url, "headers": headers}
+
+
+@router.post("/cas/commit")
+async def cas_commit(
+    data: CasCommitRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Mark an uploaded object as available once S3 confirms it holds it."""
+    sha256 = _check_hash(data.sha256)
+    key = cas.object_key(sha256)
+    if not await cas.get_object(db, sha256):
+        raise HTTPException(status_code=404, detail="Unknown object, call /cas/check first")
+    head = await run_in_threadpool(get_storage().stat, key)
+    if head is None:
+        raise HTTPException(status_code=409, detail="Object has not been uploaded")
+    # The checksum header is signed into the upload URL, so S3 already refused
+    # mismatching bodies; this catches objects written some other way.
+    stored = head["checksum_sha256"]
+    if stored and stored != cas.checksum(sha256):
+        raise HTTPException(status_code=409, detail="Stored object does not match its hash")
+    # Pages may already reference the object; recount instead of trusting the row.
+    await db.execute(text(
+        "UPDATE public.media_objects SET status = :ready, size = :size, "
+        "refcount = (SELECT count(*) FROM public.media_refs WHERE sha256 = :h) "
+        "WHERE sha256 = :h"
+    ), {"ready": cas.STATUS_READY, "size": head["size"], "h": sha256})
+    if (head["content_type"] or "").startswith("image/"):
+        await derivatives.enqueue(db, [key])
+    await db.commit()
+    return {"object_key": key, "download_url": cas.download_url(key)}
+
+
+# --- Image variants ---
+
+async def _variants(db: AsyncSession, object_keys: list[str]) -> dict[str, dict]:
+    """Variants with download URLs; stored images seen for the first time are queued."""
+    found = await derivatives.get_variants(db, object_keys)
+    unknown = [key for key in object_keys if key not in found and derivatives.is_derivable_key(key)]
+    unknown = await derivatives.existing_sources(db, unknown) if unknown else []
+    if unknown:
+        await derivatives.enqueue(db, unknown)
+        await db.commit()
+    out = {}
+    for key in object_keys:
+        entry = found.get(key) or {"status": derivatives.STATUS_PENDING if key in unknown else "unknown",
+                                   "width": None, "height": None, "variants": []}
+        for v in entry["variants"]:
+            v["url"] = _download_url(v["object_key"])
+        out[key] = entry
+    return out
+
+
+@router.get("/variants")
+async def get_variants(
+    object_key: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Resized/WebP variants of an uploaded image, generated in the background."""
+    return (await _variants(db, [object_key]))[object_key]
+
+
+@router.post("/variants")
+async def get_variants_batch(
+    data: VariantsRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _check_batch(data.object_keys)
+    return {"variants": await _variants(db, list(dict.fromkeys(data.object_keys)))}
+
+
+# --- Files of the local storage backend ---
+#
+# With STORAGE_BACKEND=local, presigned URLs point here instead of at MinIO.
+# They are served from the API's origin, usually the frontend's too, so an
+# uploaded HTML or SVG file must never run as a page of the app: only raster
+# images are shown inline, everything else is a download, and the browser
+# may neither sniff a type nor run scripts in the response.
+
+INLINE_CONTENT_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif"})
+
+def _local_storage() -> LocalStorageBackend:
+    backend = get_storage()
+    if not isinstance(backend, LocalStorageBackend):
+        raise HTTPException(status_code=404, detail="Not found")
+    return backend
+
+
+def _verified(backend: LocalStorageBackend, method: str, object_key: str, request: Request) -> dict[str, str]:
+    try:
+        backend.path(object_key)
+    except InvalidKey:
+        raise HTTPException(status_code=404, detail="Not found")
+    params = backend.verify(method, object_key, dict(request.query_params))
+    if params is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    return params
+
+
+@router.api_route("/files/{object_key:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_local_file(object_key: str, request: Request):
+    backend = _local_storage()
+    params = _verified(backend, "GET", object_key, request)
+    path = backend.path(object_key)
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    meta = await anyio.to_thread.run_sync(backend.read_meta, object_key)
+    cache_control = params.get("cc") or meta.get("cache_control") or "private, max-age=3600"
+    content_type = meta.get("content_type")
+    response = file_response(path, stat_result, request.scope, cache_control, media_type=content_type)
+    response.headers["x-content-type-options"] = "nosniff"
+    response.headers["content-security-policy"] = "sandbox"
+    if (content_type or "").split(";")[0].strip().lower() not in INLINE_CONTENT_TYPES:
+        response.headers["content-disposition"] = "attachment"
+    return response
+
+
+@router.put("/files/{object_key:path}", include_in_schema=False)
+async def put_local_file(object_key: str, request: Request):
+    backend = _local_storage()
+    params = _verified(backend, "PUT", object_key, request)
+    try:
+        await backend.write_stream(object_key, request.stream(), request.headers.get("content-type"),
+                                   expected_sha256=params.get("sha256"))
+    except ChecksumMismatch:
+        raise HTTPException(status_code=400, detail="Body does not match the signed checksum")
+    except TooLarge:
+        raise HTTPException(status_code=413, detail="Object too large")
+    return Response(status_code=200)
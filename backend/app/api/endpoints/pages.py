@@ -1,5 +1,7 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import text
@@ -10,20 +12,52 @@ from app.api.deps import get_db, get_current_user, get_current_user_optional
 from app.models.page import Page, PageVersion
 from app.models.user import User
 from app.schemas.page import PageTreeItem, PageCreate, PageResponse, PageVersionResponse
-from app.schemas.page_update import PageContentUpdate
+from app.schemas.page_update import PageClone, PageContentUpdate
+from app.core.config import settings
+from app.db.tenancy import current_room
+from app.services import jobs, page_clone, room_jobs, room_stats, suggest
+from app.services.indexing import enqueue_page_event, EVENT_CHANGED, EVENT_MOVED, EVENT_DELETED
+from app.services.search_cache import search_cache
 from sqlalchemy_utils import Ltree
 
 router = APIRouter()
 
 
+def _tenant(request: Request) -> str:
+    return getattr(request.state, "tenant_id", "public")
+
+
+def _after_page_saved(request: Request, page: Page, path_changed: bool = False):
+    """Bring in-process caches in line with a committed page write.
+
+    Derived data and search indexes are updated by the indexing worker from
+    the page event enqueued in the write's transaction.
+    """
+    tenant_id = _tenant(request)
+    search_cache.bump(tenant_id)
+    if path_changed:
+        suggest.invalidate(tenant_id)  # the move rewrote the whole subtree's paths
+    else:
+        suggest.note_page_saved(tenant_id, page.id, page.title, page.slug, str(page.path))
+
+
+def _after_page_deleted(request: Request, page_id: int):
+    tenant_id = _tenant(request)
+    search_cache.bump(tenant_id)
+    suggest.note_page_deleted(tenant_id, page_id)
+
+
 async def _check_role(db: AsyncSession, user: User | None, request: Request, min_role: str):
     """Check user has minimum role in current tenant. Roles: Owner > Admin > Editor > Viewer"""
+    await _check_room_role(db, user, _tenant(request), min_role)
+
+
+async def _check_room_role(db: AsyncSession, user: User | None, tenant_id: str, min_role: str):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication required")
     if user.is_superuser:
         return  # superuser bypasses all checks
 
-    tenant_id = getattr(request.state, "tenant_id", "public")
     if tenant_id == "public":
         return  # public space is open to all authenticated users
 
@@ -45,6 +79,8 @@ async def _check_role(db: AsyncSession, user: User | None, request: Request, min
 
 async def _ensure_columns(db: AsyncSession):
     """Ensure metadata columns exist (for existing installations)."""
+    if current_room(db) not in (None, "public"):
+        return  # shared tables are created complete; ALTER would lock every room
     for col, col_type in [
         ("created_at", "TIMESTAMPTZ DEFAULT NOW()"),
         ("updated_at", "TIMESTAMPTZ DEFAULT NOW()"),
@@ -165,12 +201,17 @@ async def create_page(
     )
     db.add(page)
     try:
+        await db.flush()
+        await enqueue_page_event(db, _tenant(request), page.id, EVENT_CHANGED)
+        await room_stats.record_page_write(db, _tenant(request), pages=1,
+                                           bytes_delta=room_stats.content_bytes(page.content))
         await db.commit()
     except IntegrityError:
         await db.rollback()
         raise HTTPException(status_code=400, detail="Страница с таким URL (slug) уже существует")
 
     page.path = str(page.path)
+    _after_page_saved(request, page)
     return page
 
 
@@ -208,17 +249,41 @@ async def update_page(
         new_ltree_path = new_path_str.replace("-", "_")
 
         if new_ltree_path != old_path_str:
+            if new_ltree_path.startswith(old_path_str + "."):
+                raise HTTPException(status_code=400, detail="Нельзя переместить страницу внутрь неё самой")
             # Check for collision
             collision = await db.execute(select(Page).filter(Page.path == new_ltree_path))
             if collision.scalars().first():
                 raise HTTPException(status_code=400, detail="Страница с таким URL или путем уже существует")
-            
+            path_changed = True
+
+    # Large subtrees are re-pathed by a background job; the page keeps its
+    # old path and slug until the job's last step sets both.
+    move_job = None
+    if path_changed:
+        with db.no_autoflush:
+            descendants = await db.execute(text(
+                "SELECT count(*) FROM (SELECT 1 FROM pages WHERE path <@ CAST(:old AS ltree) AND id <> :pid "
+                "LIMIT :limit) s"
+            ), {"old": old_path_str, "pid": page_id, "limit": settings.PAGE_MOVE_INLINE_LIMIT + 1})
+        if descendants.scalar() > settings.PAGE_MOVE_INLINE_LIMIT:
+            if new_slug != page.slug:
+                taken = await db.execute(select(Page.id).filter(Page.slug == new_slug, Page.id != page_id))
+                if taken.first():
+                    raise HTTPException(status_code=400, detail="Страница с таким URL (slug) уже существует")
+            try:
+                move_job = await room_jobs.start_move_subtree(
+                    db, _tenant(request), page_id, old_path_str, new_ltree_path, new_slug, user.id)
+            except jobs.JobInProgress:
+                raise HTTPException(status_code=409, detail="Страница уже перемещается")
+        else:
             page.slug = new_slug
             page.path = Ltree(new_ltree_path)
-            path_changed = True
 
     # Save version before update only if content or title is changing
-    if data.content is not None or data.title is not None:
+    versioned = data.content is not None or data.title is not None
+    bytes_delta = 0
+    if versioned:
         version = PageVersion(
             page_id=page.id,
             title=page.title,
@@ -229,6 +294,7 @@ async def update_page(
 
     # Update page attributes
     if data.content is not None:
+        bytes_delta = room_stats.content_bytes(data.content) - room_stats.content_bytes(page.content)
         page.content = data.content
     if data.title is not None:
         page.title = data.title
@@ -237,7 +303,21 @@ async def update_page(
     page.updated_at = datetime.now(timezone.utc)
 
     # Perform updates
-    await db.flush() # ensure page changes are in transaction
+    try:
+        await db.flush()  # ensure page changes are in transaction
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Страница с таким URL (slug) уже существует")
+    await room_stats.record_page_write(db, _tenant(request), bytes_delta=bytes_delta, versions=int(versioned))
+
+    if move_job:
+        await enqueue_page_event(db, _tenant(request), page_id, EVENT_CHANGED)
+        await db.commit()
+        page.path = str(page.path)
+        _after_page_saved(request, page)
+        return JSONResponse(status_code=202, content=jsonable_encoder({
+            "page": PageResponse.model_validate(page), "job": move_job,
+        }))
 
     if path_changed:
         # Update descendants
@@ -247,11 +327,51 @@ async def update_page(
             WHERE path <@ (:old_path::text)::ltree AND id != :page_id
         """), {"new_path": new_ltree_path, "old_path": old_path_str, "page_id": page_id})
 
+    await enqueue_page_event(db, _tenant(request), page_id, EVENT_MOVED if path_changed else EVENT_CHANGED)
     await db.commit()
     page.path = str(page.path)
+    _after_page_saved(request, page, path_changed)
     return page
 
 
+@router.post("/{page_id}/clone", status_code=201)
+async def clone_page(
+    page_id: int,
+    data: PageClone,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Copy a page and its whole subtree, optionally into another room."""
+    tenant_id = _tenant(request)
+    target = data.target_room or tenant_id
+    await _check_role(db, user, request, "Viewer")
+    await _check_room_role(db, user, target, "Editor")
+
+    result = await db.execute(select(Page).filter(Page.id == page_id))
+    page = result.scalars().first()
+    if not page:
+        raise HTTPException(status_code=404, detail="Page not found")
+    if target != tenant_id:
+        room = await db.execute(text("SELECT 1 FROM wiki_rooms WHERE name = :n"), {"n": target})
+        if target != "public" and not room.first():
+            raise HTTPException(status_code=404, detail="Room not found")
+    source = {"id": page.id, "slug": page.slug, "title": page.title, "path": str(page.path)}
+    try:
+        copy = await page_clone.clone_subtree(db, tenant_id, source, target, data.parent_path,
+                                              data.slug, data.title, user.email)
+        await db.commit()
+    except page_clone.CloneError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Раздел изменился во время копирования, повторите попытку")
+    search_cache.bump(target)
+    suggest.invalidate(target)
+    return copy
+
+
 @router.delete("/{page_id}")
 async def delete_page(
     page_id: int,
@@ -266,7 +386,11 @@ async def delete_page(
     if not page:
         raise HTTPException(status_code=404, detail="Page not found")
     await db.delete(page)
+    await enqueue_page_event(db, _tenant(request), page_id, EVENT_DELETED)
+    await room_stats.record_page_write(db, _tenant(request), pages=-1,
+                                       bytes_delta=-room_stats.content_bytes(page.content))
     await db.commit()
+    _after_page_deleted(request, page_id)
     return {"detail": "Page deleted"}
 
 
@@ -1,13 +1,21 @@
 """Public read-only access to a room's wiki by its public_slug — no auth required."""
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
 from sqlalchemy.future import select
-from sqlalchemy import text, func
-from pydantic import BaseModel
+from sqlalchemy import text
+from pydantic import BaseModel, Field, field_validator
 
 from app.db.session import async_session_maker
 from app.db.tenancy import set_tenant_schema
 from app.models.page import Page
+from app.services import feedback_ingest
+from app.services.rate_limit import client_ip, retry_after
 
 router = APIRouter()
 
@@ -97,80 +105,145 @@ async def public_room_page(slug: str, page_id: int):
 
 # ── Feedback ─────────────────────────────────────────────────────────
 
+# The table is created at startup with the admin tables.
 FEEDBACK_TABLE = "feedback"
-
-async def _ensure_feedback_table(session: AsyncSession):
-    """Create feedback table if it does not exist."""
-    await session.execute(text(
-        f"CREATE TABLE IF NOT EXISTS {FEEDBACK_TABLE} ("
-        "id SERIAL PRIMARY KEY, "
-        "room_name VARCHAR(100) NOT NULL, "
-        "text TEXT NOT NULL, "
-        "author_name VARCHAR(200) NOT NULL DEFAULT '', "
-        "author_org VARCHAR(200) NOT NULL DEFAULT '', "
-        "created_at TIMESTAMPTZ NOT NULL DEFAULT now()"
-        ")"
-    ))
-    # Index for fast count queries
-    await session.execute(text(
-        f"CREATE INDEX IF NOT EXISTS idx_feedback_room ON {FEEDBACK_TABLE} (room_name)"
-    ))
-    await session.commit()
+FEEDBACK_MAX_TEXT = 5000
+FEEDBACK_MAX_AUTHOR = 200  # author_name / author_org are VARCHAR(200)
 
 
 class FeedbackCreate(BaseModel):
-    text: str
-    author_name: str = ""
-    author_org: str = ""
+    text: str = Field(max_length=FEEDBACK_MAX_TEXT)
+    author_name: str = Field("", max_length=FEEDBACK_MAX_AUTHOR)
+    author_org: str = Field("", max_length=FEEDBACK_MAX_AUTHOR)
+
+    @field_validator("text", "author_name", "author_org", mode="before")
+    @classmethod
+    def strip_nul(cls, v):
+        # Postgres text cannot hold NUL characters.
+        return v.replace("\x00", "") if isinstance(v, str) else v
+
+
+def _rate_limited(wait: float):
+    raise HTTPException(status_code=429, detail="Too many feedback submissions",
+                        headers={"Retry-After": retry_after(wait)})
 
 
-@router.post("/{slug}/feedback")
-async def submit_feedback(slug: str, data: FeedbackCreate):
-    """Submit feedback for a public room (no auth required)."""
+@router.post("/{slug}/feedback", status_code=202)
+async def submit_feedback(slug: str, data: FeedbackCreate, request: Request):
+    """Submit feedback for a public room (no auth required).
+
+    The message is buffered and written in a batch shortly after, hence 202.
+    """
+    ip = client_ip(request.client.host if request.client else None,
+                   ", ".join(request.headers.getlist("x-forwarded-for")), feedback_ingest.trusted_proxies)
+    if wait := feedback_ingest.ip_limiter.acquire(ip):
+        _rate_limited(wait)
     room = await _resolve_room(slug)
     room_name = room["name"]
+    if wait := feedback_ingest.room_limiter.acquire(room_name):
+        _rate_limited(wait)
+
+    try:
+        await feedback_ingest.buffer.add(room_name, data.text, data.author_name, data.author_org)
+    except feedback_ingest.BufferFull:
+        raise HTTPException(status_code=503, detail="Feedback is temporarily unavailable",
+                            headers={"Retry-After": "5"})
+    return {"ok": True}
 
-    async with async_session_maker() as session:
-        await _ensure_feedback_table(session)
-        await session.execute(
-            text(
-                f"INSERT INTO {FEEDBACK_TABLE} (room_name, text, author_name, author_org) "
-                "VALUES (:rn, :txt, :name, :org)"
-            ),
-            {"rn": room_name, "txt": data.text, "name": data.author_name, "org": data.author_org},
-        )
-        await session.commit()
 
-    return {"ok": True}
+FEEDBACK_PAGE_SIZE = 50
+FEEDBACK_MAX_PAGE_SIZE = 200
+EXPORT_BATCH = 500
+_FEEDBACK_COLUMNS = "id, text, author_name, author_org, created_at"
+
+
+def _feedback_out(r) -> dict:
+    return {
+        "id": r[0],
+        "text": r[1],
+        "author_name": r[2],
+        "author_org": r[3],
+        "created_at": r[4].isoformat() if r[4] else None,
+    }
+
+
+def _encode_cursor(created_at: datetime, feedback_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{feedback_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, feedback_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(feedback_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/{slug}/feedback")
-async def list_feedback(slug: str):
-    """List all feedback for a public room (no auth — admin checks on frontend)."""
+async def list_feedback(
+    slug: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(FEEDBACK_PAGE_SIZE, ge=1, le=FEEDBACK_MAX_PAGE_SIZE),
+):
+    """One page of feedback, newest first (no auth — admin checks on frontend).
+
+    Pages are keyed on ``(created_at, id)``; pass ``next_cursor`` from the
+    previous response to get the next one. It is null on the last page.
+    """
     room = await _resolve_room(slug)
     room_name = room["name"]
 
+    params = {"rn": room_name, "n": limit + 1}
+    after = ""
+    if cursor:
+        params["ts"], params["id"] = _decode_cursor(cursor)
+        after = "AND (created_at, id) < (:ts, :id) "
     async with async_session_maker() as session:
-        await _ensure_feedback_table(session)
         result = await session.execute(
             text(
-                f"SELECT id, text, author_name, author_org, created_at "
-                f"FROM {FEEDBACK_TABLE} WHERE room_name = :rn ORDER BY created_at DESC"
+                f"SELECT {_FEEDBACK_COLUMNS} FROM {FEEDBACK_TABLE} WHERE room_name = :rn {after}"
+                f"ORDER BY created_at DESC, id DESC LIMIT :n"
             ),
-            {"rn": room_name},
+            params,
         )
         rows = result.fetchall()
 
-    return [
-        {
-            "id": r[0],
-            "text": r[1],
-            "author_name": r[2],
-            "author_org": r[3],
-            "created_at": r[4].isoformat() if r[4] else None,
-        }
-        for r in rows
-    ]
+    next_cursor = _encode_cursor(rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+    return {"items": [_feedback_out(r) for r in rows[:limit]], "next_cursor": next_cursor}
+
+
+async def export_feedback_rows(room_name: str, fmt: str):
+    """Yield a CSV or NDJSON export of the room's feedback batch by batch from a server-side cursor.
+
+    Served by the admin router, which checks the caller's role in the room.
+    """
+    if fmt == "csv":
+        yield "\ufeff"  # BOM, so spreadsheet apps detect UTF-8
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["id", "created_at", "author_name", "author_org", "text"])
+        yield buf.getvalue()
+    async with async_session_maker() as session:
+        result = await session.stream(
+            text(
+                f"SELECT {_FEEDBACK_COLUMNS} FROM {FEEDBACK_TABLE} WHERE room_name = :rn "
+                f"ORDER BY created_at DESC, id DESC"
+            ).execution_options(yield_per=EXPORT_BATCH),
+            {"rn": room_name},
+        )
+        async for rows in result.partitions():
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                for r in rows:
+                    item = _feedback_out(r)
+                    writer.writerow([item["id"], item["created_at"], item["author_name"],
+                                     item["author_org"], item["text"]])
+                yield buf.getvalue()
+            else:
+                yield "".join(json.dumps(_feedback_out(r), ensure_ascii=False) + "\n" for r in rows)
 
 
 @router.get("/{slug}/feedback/count")
@@ -180,11 +253,10 @@ async def feedback_count(slug: str):
     room_name = room["name"]
 
     async with async_session_maker() as session:
-        await _ensure_feedback_table(session)
         result = await session.execute(
-            text(f"SELECT COUNT(*) FROM {FEEDBACK_TABLE} WHERE room_name = :rn"),
+            text("SELECT count FROM feedback_counters WHERE room_name = :rn"),
             {"rn": room_name},
         )
-        count = result.scalar()
+        count = result.scalar() or 0
 
     return {"count": count}
@@ -1,12 +1,42 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.api.deps import get_db
-from app.services.search import search_pages
+from app.api.deps import get_db, require_superuser
+from app.models.user import User
+from app.services.search import get_search_backend
+from app.services.search_cache import search_cache, normalize_query
+from app.services import suggest as suggest_service
 
 router = APIRouter()
 
+PAGE_SIZE = 20
+
 @router.get("/")
-async def search(q: str = Query(..., min_length=1), db: AsyncSession = Depends(get_db)):
-    """Search pages using PostgreSQL Full-Text Search."""
-    results = await search_pages(db, q)
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    db: AsyncSession = Depends(get_db),
+):
+    """Search pages with the configured search backend."""
+    tenant_id = getattr(request.state, "tenant_id", "public")
+    results = search_cache.get(tenant_id, q, page)
+    if results is None:
+        version = search_cache.version(tenant_id)
+        results = await get_search_backend().search(
+            db, tenant_id, normalize_query(q), limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE
+        )
+        search_cache.put(tenant_id, q, page, version, results)
+    return {"results": results, "total": len(results)}
+
+@router.get("/cache-stats")
+async def cache_stats(current_user: User = Depends(require_superuser)):
+    """Hit/miss counters and size of this worker's search result cache."""
+    return search_cache.stats()
+
+@router.get("/suggest")
+async def suggest(request: Request, q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Title/slug suggestions for search-as-you-type, served from memory."""
+    tenant_id = getattr(request.state, "tenant_id", "public")
+    index = await suggest_service.get_index(tenant_id)
+    results = index.suggest(q, limit)
     return {"results": results, "total": len(results)}
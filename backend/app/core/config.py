@@ -3,11 +3,85 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Wiki"
     DATABASE_URL: str
-    MINIO_ENDPOINT: str
-    MINIO_ACCESS_KEY: str
-    MINIO_SECRET_KEY: str
+    # Media storage: "s3" (MinIO) or "local" (files under STORAGE_LOCAL_DIR,
+    # default backend/storage, served by the API itself)
+    STORAGE_BACKEND: str = "s3"
+    STORAGE_LOCAL_DIR: str = ""
+    # Prefix for API-served media URLs when the frontend runs on another origin
+    PUBLIC_BASE_URL: str = ""
+    MINIO_ENDPOINT: str = ""
+    MINIO_ACCESS_KEY: str = ""
+    MINIO_SECRET_KEY: str = ""
     SECRET_KEY: str
+    S3_MAX_POOL_CONNECTIONS: int = 40
+    # Object storage calls: timeouts in seconds, attempts per call, and the
+    # circuit breaker (opens after this many failed calls in a row)
+    S3_CONNECT_TIMEOUT: float = 2.0
+    S3_READ_TIMEOUT: float = 10.0
+    S3_MAX_ATTEMPTS: int = 3
+    S3_BREAKER_THRESHOLD: int = 5
+    S3_BREAKER_RESET_SECONDS: int = 30
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Threads used to hash passwords in bulk user imports
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Search result cache (per worker process)
+    SEARCH_CACHE_MAX_ENTRIES: int = 5000
+    SEARCH_CACHE_TENANT_MAX_BYTES: int = 2 * 1024 * 1024
+    SEARCH_CACHE_TTL: int = 60
+
+    # Search backend: "postgres" (SQL over the pages table) or "bm25"
+    # (embedded engine, index files under SEARCH_INDEX_DIR)
+    SEARCH_BACKEND: str = "postgres"
+    SEARCH_INDEX_DIR: str = ""
+
+    # Run background loops (indexing, ...) inside each API process; set to
+    # false when they run separately via `python -m app.worker`
+    BACKGROUND_WORKERS_IN_PROCESS: bool = True
+
+    # Multipart uploads: sessions idle longer than this are aborted
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+
+    # Logos are stored on local disk under /media
+    LOGO_MAX_BYTES: int = 2 * 1024 * 1024
+
+    # Image derivatives: decoding runs in this many worker processes
+    IMAGE_WORKERS: int = 2
+    IMAGE_MAX_SOURCE_BYTES: int = 40 * 1024 * 1024
+    IMAGE_MAX_PIXELS: int = 50_000_000
+
+    # Public feedback is buffered per process and written in batches of up to
+    # FEEDBACK_FLUSH_SIZE rows or every FEEDBACK_FLUSH_INTERVAL seconds.
+    # Token buckets (tokens per second, burst) limit submissions per client
+    # IP and per room.
+    FEEDBACK_FLUSH_SIZE: int = 200
+    FEEDBACK_FLUSH_INTERVAL: float = 1.0
+    FEEDBACK_BUFFER_MAX_ROWS: int = 10_000
+    FEEDBACK_IP_RATE: float = 0.2
+    FEEDBACK_IP_BURST: int = 5
+    FEEDBACK_ROOM_RATE: float = 20.0
+    FEEDBACK_ROOM_BURST: int = 100
+    # Reverse proxies (comma-separated IPs or CIDRs) whose X-Forwarded-For is
+    # believed when telling clients apart; other peers are taken as they are.
+    TRUSTED_PROXIES: str = "127.0.0.1"
+
+    # Orphaned media collection: objects younger than the grace period are
+    # kept; runs are queued every MEDIA_GC_INTERVAL_HOURS (0 = only on demand)
+    MEDIA_GC_GRACE_HOURS: int = 72
+    MEDIA_GC_INTERVAL_HOURS: int = 0
+
+    # Room page storage: "schema" (a schema per room) or "shared" (partitioned
+    # tables with row-level security; see python -m app.migrate_tenancy)
+    TENANCY_MODE: str = "schema"
+    TENANCY_PARTITIONS: int = 16
+
+    # Spare room schemas kept ready so room creation only renames one (0 = off)
+    SCHEMA_POOL_SIZE: int = 3
+
+    # Moving a page with more descendants than this runs as a background job,
+    # re-pathing PAGE_MOVE_BATCH pages per transaction
+    PAGE_MOVE_INLINE_LIMIT: int = 200
+    PAGE_MOVE_BATCH: int = 500
     
     class Config:
         env_file = ".env"
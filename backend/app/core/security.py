@@ -1,9 +1,15 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any, Union
 from jose import jwt
 from app.core.config import settings
 import bcrypt
 
+# bcrypt releases the GIL while hashing, so threads hash in parallel. A
+# dedicated pool keeps bulk imports from starving the request threadpool.
+_hash_pool: ThreadPoolExecutor | None = None
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(
@@ -17,6 +23,16 @@ def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash many passwords at once on ``PASSWORD_HASH_WORKERS`` threads."""
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                        thread_name_prefix="bcrypt")
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(_hash_pool, get_password_hash, p) for p in passwords))
+
+
 def create_access_token(
     subject: Union[str, Any], expires_delta: timedelta = None
 ) -> str:
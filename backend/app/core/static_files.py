@@ -0,0 +1,114 @@
+"""StaticFiles for ``/media`` with long-lived caching and byte ranges.
+
+Files whose name carries a content hash (``<stem>-<16 hex>.<ext>``, see
+``app.services.local_media``) never change, so browsers and proxies may keep
+them forever. Other files get a short max-age and are revalidated by ETag.
+Starlette 0.37's FileResponse has no Range support, so single byte ranges
+are served here (multi-range requests get the whole file, which RFC 9110
+allows). :func:`file_response` is shared with the local storage backend.
+"""
+import os
+import re
+from email.utils import parsedate
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=300"
+
+_HASHED_NAME_RE = re.compile(r"-[0-9a-f]{16}\.[A-Za-z0-9]+$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(value: str, size: int) -> tuple[int, int] | None | bool:
+    """Return ``(start, end)`` inclusive, None to ignore the header, False if unsatisfiable."""
+    match = _RANGE_RE.match(value.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.groups()
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return response_headers["etag"] in [tag.strip(" W/") for tag in if_none_match.split(",")]
+    since = parsedate(request_headers.get("if-modified-since", ""))
+    modified = parsedate(response_headers["last-modified"])
+    return since is not None and modified is not None and since >= modified
+
+
+class RangeFileResponse(FileResponse):
+    """206 response carrying one byte range of a file."""
+
+    def __init__(self, path, start: int, end: int, stat_result: os.stat_result, headers=None, media_type=None):
+        super().__init__(path, status_code=206, headers=headers, media_type=media_type, stat_result=stat_result)
+        self.start, self.end = start, end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:  # file shrank underneath us
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(full_path, stat_result: os.stat_result, scope: Scope, cache_control: str,
+                  media_type: str | None = None, status_code: int = 200) -> Response:
+    """FileResponse with conditional requests and single byte ranges.
+
+    Full responses go through Starlette's FileResponse, which hands the path
+    to the server (``http.response.pathsend``) for zero-copy sending when the
+    server supports it.
+    """
+    request_headers = Headers(scope=scope)
+    headers = {"cache-control": cache_control, "accept-ranges": "bytes"}
+
+    response = FileResponse(full_path, status_code=status_code, headers=headers,
+                            media_type=media_type, stat_result=stat_result)
+    if _is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+
+    range_header = request_headers.get("range")
+    if status_code != 200 or not range_header:
+        return response
+    if_range = request_headers.get("if-range")
+    if if_range and if_range not in (response.headers["etag"], response.headers["last-modified"]):
+        return response
+    byte_range = _parse_range(range_header, stat_result.st_size)
+    if byte_range is None:
+        return response
+    if byte_range is False:
+        return Response(status_code=416, headers={"content-range": f"bytes */{stat_result.st_size}"})
+    return RangeFileResponse(full_path, *byte_range, stat_result=stat_result, headers=headers, media_type=media_type)
+
+
+class MediaFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        cache_control = IMMUTABLE if _HASHED_NAME_RE.search(str(full_path)) else REVALIDATE
+        return file_response(full_path, stat_result, scope, cache_control, status_code=status_code)
@@ -3,4 +3,12 @@ from app.models.user import User  # noqa
 from app.models.page import Page  # noqa
 from app.models.shared_link import SharedLink  # noqa
 from app.models.slug_redirect import SlugRedirect  # noqa
-from app.models.feedback import Feedback  # noqa
+from app.models.feedback import Feedback, FeedbackCounter  # noqa
+from app.models.page_event import PageEvent, FailedPageEvent  # noqa
+from app.models.upload_session import UploadSession, UploadPart  # noqa
+from app.models.media_object import MediaObject, MediaRef  # noqa
+from app.models.image_variant import ImageSource, ImageVariant  # noqa
+from app.models.media_gc import MediaGcRun, MediaGcRef  # noqa
+from app.models.spare_schema import SpareSchema  # noqa
+from app.models.job import Job  # noqa
+from app.models.room_stats import RoomStats, RoomActivity  # noqa
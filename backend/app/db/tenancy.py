@@ -1,10 +1,69 @@
+"""Per-room isolation of page data.
+
+Two layouts, chosen by ``TENANCY_MODE``:
+
+* ``schema`` (default): every room has its own schema with its own
+  ``pages``, ``page_versions`` and ``page_derived``; ``search_path`` picks it.
+* ``shared``: rooms share hash-partitioned tables in the ``rooms`` schema,
+  keyed by ``room_name``. Row-level security policies only expose rows
+  whose ``room_name`` equals the transaction's ``app.room`` setting, and
+  new rows get it as their default. Rooms that still have their own schema
+  (not yet migrated by ``python -m app.migrate_tenancy``) keep using it.
+
+Either way queries use unqualified table names after :func:`set_tenant_schema`.
+"""
 import re
-from sqlalchemy import text
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.db.session import engine
 from sqlalchemy.ext.asyncio import AsyncSession
 
 _TENANT_RE = re.compile(r'^[a-zA-Z0-9_]+$')
 
+TENANCY_SCHEMA = "schema"
+TENANCY_SHARED = "shared"
+SHARED_SCHEMA = "rooms"
+
+# Session.info key holding the transaction-local settings to re-apply.
+_ROOM_SETTINGS = "wiki.room_settings"
+_APPLY_SETTINGS = (
+    "SELECT set_config('search_path', :path, true), set_config('app.room', :room, true), "
+    "set_config('app.all_rooms', :all_rooms, true)"
+)
+
+
+def shared_mode() -> bool:
+    return settings.TENANCY_MODE == TENANCY_SHARED
+
+
+@event.listens_for(Session, "after_begin")
+def _reapply_room_settings(session, transaction, connection):
+    """``set_config(..., true)`` lasts one transaction; restore it in every new one."""
+    values = session.info.get(_ROOM_SETTINGS)
+    if values:
+        connection.execute(text(_APPLY_SETTINGS), values)
+
+PAGE_DERIVED_DDL = (
+    'CREATE TABLE IF NOT EXISTS "{schema}".page_derived ('
+    "  page_id INTEGER PRIMARY KEY, "
+    "  plain_text TEXT NOT NULL DEFAULT '', "
+    "  outline JSONB NOT NULL DEFAULT '[]', "
+    "  links JSONB NOT NULL DEFAULT '[]', "
+    "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+    ")"
+)
+
+
+def tenant_tables_ddl(schema: str) -> list[str]:
+    """Statements creating every per-room table in ``schema``; all are idempotent."""
+    return [
+        f'CREATE TABLE IF NOT EXISTS "{schema}".pages (LIKE public.pages INCLUDING ALL)',
+        f'CREATE TABLE IF NOT EXISTS "{schema}".page_versions (LIKE public.page_versions INCLUDING ALL)',
+        PAGE_DERIVED_DDL.format(schema=schema),
+    ]
+
+
 async def create_tenant_schema(tenant_id: str):
     """Creates a new isolated schema for a tenant."""
     if not _TENANT_RE.match(tenant_id):
@@ -12,7 +71,37 @@ async def create_tenant_schema(tenant_id: str):
     async with engine.begin() as conn:
         await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{tenant_id}"'))
 
-async def set_tenant_schema(session: AsyncSession, tenant_id: str):
+def current_room(session: AsyncSession) -> str | None:
+    """Room whose shared-table rows this session sees; None outside shared mode."""
+    values = session.info.get(_ROOM_SETTINGS)
+    return values["room"] if values and values["all_rooms"] == "off" else None
+
+
+async def _use_room_settings(session: AsyncSession, values: dict):
+    session.info[_ROOM_SETTINGS] = values
+    await session.execute(text(_APPLY_SETTINGS), values)
+
+
+async def use_all_rooms(session: AsyncSession):
+    """Let this session read and write rows of every room in the shared tables.
+
+    For maintenance that spans rooms (media GC, migration); a no-op in schema mode.
+    """
+    if not shared_mode():
+        return
+    await _use_room_settings(session, {"path": f"{SHARED_SCHEMA}, public", "room": "", "all_rooms": "on"})
+
+
+async def tenant_exists(session: AsyncSession, tenant_id: str) -> bool:
+    """Whether a room (still) has page data to work on."""
+    sql = "SELECT to_regclass(:pages) IS NOT NULL"
+    if shared_mode():
+        sql += " OR EXISTS (SELECT 1 FROM public.wiki_rooms WHERE name = :t)"
+    result = await session.execute(text(sql), {"pages": f'"{tenant_id}".pages', "t": tenant_id})
+    return result.scalar()
+
+
+async def set_tenant_schema(session: AsyncSession, tenant_id: str) -> bool:
     """Sets the search_path for the current database session to the tenant's schema.
     
     The tenant schema is listed first so tenant-specific tables (pages, page_versions)
@@ -20,12 +109,36 @@ async def set_tenant_schema(session: AsyncSession, tenant_id: str):
     in public remain accessible.
     
     IMPORTANT: We also ensure the tenant has its own 'pages' table so queries
-    never accidentally fall through to 'public.pages'.
+    never accidentally fall through to 'public.pages'. Rooms created from the
+    schema pool already have all their tables, so the common case is a single
+    round trip that only reads the catalog; the DDL (and its locks) runs only
+    for rooms that are missing a table.
+
+    In shared mode the settings are transaction-local and re-applied at the
+    start of each transaction of this session. The path still lists the
+    room's own schema first, so unmigrated rooms keep working, and a room
+    migrated under a running request resolves to the shared tables, never to
+    ``public``.
+
+    Returns True when the room uses its own schema.
     """
     if not _TENANT_RE.match(tenant_id):
         raise ValueError(f"Invalid tenant_id: {tenant_id}")
-    await session.execute(text(f'SET search_path TO "{tenant_id}", public'))
+    if shared_mode():
+        values = {"path": f'"{tenant_id}", {SHARED_SCHEMA}, public', "room": tenant_id, "all_rooms": "off"}
+        session.info[_ROOM_SETTINGS] = values
+        result = await session.execute(text(
+            f"{_APPLY_SETTINGS}, to_regclass(:pages) IS NOT NULL"
+        ), {**values, "pages": f'"{tenant_id}".pages'})
+        return result.one()[3]
+    result = await session.execute(text(
+        "SELECT set_config('search_path', :path, false), "
+        "to_regclass(:pages) IS NOT NULL AND to_regclass(:versions) IS NOT NULL"
+    ), {"path": f'"{tenant_id}", public',
+        "pages": f'"{tenant_id}".pages', "versions": f'"{tenant_id}".page_versions'})
+    if result.one()[1]:
+        return True
     # Ensure tenant has its own pages table to prevent cross-tenant data leaks
     await session.execute(text(f'CREATE TABLE IF NOT EXISTS "{tenant_id}".pages (LIKE public.pages INCLUDING ALL)'))
     await session.execute(text(f'CREATE TABLE IF NOT EXISTS "{tenant_id}".page_versions (LIKE public.page_versions INCLUDING ALL)'))
-
+    return True
@@ -1,13 +1,17 @@
+import asyncio
 import logging
 from pathlib import Path
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from app.middleware.tenant import TenantMiddleware
+from app.middleware.gzip import GZipExceptMediaMiddleware
+from app.middleware.body_limit import MULTIPART_OVERHEAD, BodySizeLimitMiddleware
+from app.core.config import settings
+from app.core.static_files import MediaFiles
+from app.services import storage
 
 # --- Logging ---
 logging.basicConfig(
@@ -31,18 +35,64 @@ async def _init_admin_tables():
     logger.info("Admin tables initialized")
 
 
+async def _init_service_tables():
+    from app.db.session import async_session_maker
+    from app.services import cas, derivatives, indexing, jobs, media_gc, room_stats, schema_pool, shared_tenancy, uploads
+    async with async_session_maker() as session:
+        await indexing.ensure_tables(session)
+        await uploads.ensure_tables(session)
+        await cas.ensure_tables(session)
+        await derivatives.ensure_tables(session)
+        await media_gc.ensure_tables(session)
+        await schema_pool.ensure_tables(session)
+        await jobs.ensure_tables(session)
+        await shared_tenancy.check_app_role(session)
+        await shared_tenancy.ensure_tables(session)
+        await room_stats.ensure_tables(session)
+
+
+async def _init_storage():
+    """Build the shared S3 client and verify the bucket once, off the event loop."""
+    from starlette.concurrency import run_in_threadpool
+    from app.services.storage import init_storage
+    await run_in_threadpool(init_storage)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Wiki API...")
     await _init_admin_tables()
+    await _init_service_tables()
+    await _init_storage()
+
+    stop = asyncio.Event()
+    from app.services import feedback_ingest
+    # The feedback buffer lives in this process, so its flusher always runs here.
+    workers = [asyncio.create_task(feedback_ingest.run_flusher(stop))]
+    if settings.BACKGROUND_WORKERS_IN_PROCESS:
+        from app.services import derivatives, indexing, jobs, media_gc, room_stats, schema_pool, uploads
+        workers.append(asyncio.create_task(indexing.run_worker(stop)))
+        workers.append(asyncio.create_task(uploads.run_gc_loop(stop)))
+        workers.append(asyncio.create_task(derivatives.run_worker(stop)))
+        workers.append(asyncio.create_task(media_gc.run_worker(stop)))
+        workers.append(asyncio.create_task(feedback_ingest.run_reconcile_loop(stop)))
+        workers.append(asyncio.create_task(schema_pool.run_pool_loop(stop)))
+        workers.append(asyncio.create_task(jobs.run_worker(stop)))
+        workers.append(asyncio.create_task(room_stats.run_reconcile_loop(stop)))
     yield
     logger.info("Shutting down Wiki API...")
+    stop.set()
+    await asyncio.gather(*workers, return_exceptions=True)
 
 
 app = FastAPI(title="Wiki API", lifespan=lifespan)
 
 app.add_middleware(TenantMiddleware)
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app.add_middleware(GZipExceptMediaMiddleware, minimum_size=500)
+app.add_middleware(BodySizeLimitMiddleware, limits=[
+    (r"/api/v1/admin/rooms/[^/]+/logo", settings.LOGO_MAX_BYTES + MULTIPART_OVERHEAD),
+    (r"/api/v1/admin/default-logo", settings.LOGO_MAX_BYTES + MULTIPART_OVERHEAD),
+])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -57,18 +107,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Static files for uploaded media (logos etc.)
-app.mount("/media", StaticFiles(directory=str(MEDIA_DIR)), name="media")
+# Static files for uploaded media (logos etc.); content-hashed names are cached forever
+app.mount("/media", MediaFiles(directory=str(MEDIA_DIR)), name="media")
 
-from app.api.endpoints import auth, pages, media, search, shared_links, redirects, admin, public_view
+from app.api.endpoints import auth, pages, media, search, shared_links, redirects, admin, public_view, jobs
 
 @app.get("/", include_in_schema=False)
 async def root():
     return RedirectResponse(url="/docs")
 
+@app.exception_handler(storage.StorageUnavailable)
+async def storage_unavailable_handler(request: Request, exc: storage.StorageUnavailable):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return JSONResponse(status_code=503, content={"detail": "Media storage is temporarily unavailable"},
+                        headers=headers)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    """Always 200 while the API serves requests; a storage outage only degrades it."""
+    storage_health = storage.health()
+    status = "ok" if storage_health["state"] == storage.CircuitBreaker.CLOSED else "degraded"
+    return {"status": status, "storage": storage_health}
 
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(pages.router, prefix="/api/v1/pages", tags=["pages"])
@@ -78,3 +137,4 @@ app.include_router(shared_links.router, prefix="/api/v1/shared", tags=["shared"]
 app.include_router(redirects.router, prefix="/api/v1/redirects", tags=["redirects"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["admin"])
 app.include_router(public_view.router, prefix="/api/v1/public", tags=["public"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
@@ -0,0 +1,58 @@
+import re
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import Message, Receive, Scope, Send
+
+# Room for multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Refuse oversized request bodies on upload endpoints before they are read.
+
+    FastAPI parses multipart forms, spooling files to disk, before the
+    endpoint runs, so a size check in the endpoint only happens once the
+    whole upload has arrived. Here a request whose Content-Length exceeds the
+    limit of its path gets 413 straight away; a body without one (chunked)
+    is cut off with 413 as soon as it grows past the limit.
+    """
+
+    def __init__(self, app, limits: list[tuple[str, int]]):
+        self.app = app
+        self.limits = [(re.compile(pattern), max_bytes) for pattern, max_bytes in limits]
+
+    def _limit(self, path: str) -> int | None:
+        for pattern, max_bytes in self.limits:
+            if pattern.fullmatch(path):
+                return max_bytes
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self._limit(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than {limit // 1024} KB"
+        length = Headers(scope=scope).get("content-length")
+        if length is not None:
+            if not length.isdigit() or int(length) > limit:
+                await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,21 @@
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+
+
+class GZipExceptMediaMiddleware(GZipMiddleware):
+    """GZip API responses but not media files.
+
+    Media is mostly already-compressed images, and compressing a 206 partial
+    response would break the byte offsets the client asked for.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, compresslevel: int = 9,
+                 skip_prefixes: tuple[str, ...] = ("/media/", "/api/v1/media/files/")):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,35 @@
+"""Move rooms that still have their own schema into the shared tables.
+
+Requires ``TENANCY_MODE=shared`` (set it for the API first, so new rooms
+stop getting schemas). Rooms are migrated one transaction each, in batches;
+the command can be interrupted and run again::
+
+    python -m app.migrate_tenancy [--batch 50] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.services import shared_tenancy
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("wiki.migrate_tenancy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=50, help="rooms per batch")
+    parser.add_argument("--dry-run", action="store_true", help="only count rooms left to migrate")
+    args = parser.parse_args()
+    stats = asyncio.run(shared_tenancy.migrate_rooms(args.batch, args.dry_run))
+    logger.info("Done: %s", stats)
+    if stats["skipped"]:
+        logger.warning("%d busy rooms were skipped; run the command again", stats["skipped"])
+
+
+if __name__ == "__main__":
+    main()
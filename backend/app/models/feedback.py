@@ -1,5 +1,5 @@
 """Feedback model — stores public feedback messages for rooms."""
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Index, Integer, BigInteger, String, Text, DateTime
 from sqlalchemy.sql import func
 
 from app.db.base import Base
@@ -14,3 +14,16 @@ class Feedback(Base):
     author_name = Column(String(200), nullable=False, default="")
     author_org = Column(String(200), nullable=False, default="")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("idx_feedback_room_created", "room_name", created_at.desc(), id.desc()),
+    )
+
+
+class FeedbackCounter(Base):
+    """Number of feedback messages per room, maintained on insert."""
+    __tablename__ = "feedback_counters"
+
+    room_name = Column(String(100), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
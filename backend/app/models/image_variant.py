@@ -0,0 +1,30 @@
+"""Source images queued for derivatives and the variants generated for them."""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class ImageSource(Base):
+    __tablename__ = "image_sources"
+
+    object_key = Column(String, primary_key=True)
+    status = Column(String(20), nullable=False, default="pending")
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ImageVariant(Base):
+    __tablename__ = "image_variants"
+
+    object_key = Column(String, ForeignKey("image_sources.object_key", ondelete="CASCADE"), primary_key=True)
+    variant = Column(String(20), primary_key=True)
+    format = Column(String(10), primary_key=True)
+    variant_key = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
@@ -0,0 +1,31 @@
+"""Durable background jobs (room deletion, large subtree moves)."""
+from sqlalchemy import Column, Integer, String, DateTime, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status", "status", "id"),
+        Index("ux_jobs_active_target", "kind", "target", unique=True,
+              postgresql_where=text("status IN ('pending', 'running')")),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(40), nullable=False)
+    tenant = Column(String, nullable=True)
+    target = Column(String, nullable=False)
+    params = Column(JSONB, nullable=False, server_default="{}")
+    status = Column(String(20), nullable=False, server_default="pending")
+    progress = Column(JSONB, nullable=False, server_default="{}")
+    result = Column(JSONB, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    created_by = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,31 @@
+"""Orphaned media collection runs and the object roots each run found in use."""
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class MediaGcRun(Base):
+    __tablename__ = "media_gc_runs"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(20), nullable=False, default="pending")
+    phase = Column(String(20), nullable=False, default="scan")
+    dry_run = Column(Boolean, nullable=False, default=False)
+    grace_hours = Column(Integer, nullable=False)
+    cursor = Column(JSONB, nullable=False, server_default="{}")
+    stats = Column(JSONB, nullable=False, server_default="{}")
+    error = Column(String, nullable=True)
+    created_by = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class MediaGcRef(Base):
+    __tablename__ = "media_gc_refs"
+
+    run_id = Column(Integer, ForeignKey("media_gc_runs.id", ondelete="CASCADE"), primary_key=True)
+    root = Column(String, primary_key=True)
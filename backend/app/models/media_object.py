@@ -0,0 +1,25 @@
+"""Content-addressed media objects and the pages that reference them."""
+from sqlalchemy import Column, BigInteger, Integer, String, DateTime
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class MediaObject(Base):
+    __tablename__ = "media_objects"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=True)
+    status = Column(String(20), nullable=False, default="pending")
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_unref_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class MediaRef(Base):
+    __tablename__ = "media_refs"
+
+    tenant = Column(String(100), primary_key=True)
+    page_id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), primary_key=True, index=True)
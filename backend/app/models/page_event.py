@@ -0,0 +1,29 @@
+"""Outbox of page changes waiting for the indexing worker."""
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class PageEvent(Base):
+    __tablename__ = "page_events"
+
+    id = Column(BigInteger, primary_key=True)
+    tenant = Column(String(100), nullable=False)
+    page_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class FailedPageEvent(Base):
+    """Page event that kept failing and was taken out of the queue."""
+    __tablename__ = "page_events_failed"
+
+    id = Column(BigInteger, primary_key=True)
+    tenant = Column(String(100), nullable=False)
+    page_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False)
+    error = Column(Text, nullable=False, server_default="")
+    failed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,25 @@
+"""Running per-room totals and daily activity, see app.services.room_stats."""
+from sqlalchemy import Column, BigInteger, Date, Integer, String, DateTime, text
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class RoomStats(Base):
+    __tablename__ = "room_stats"
+
+    room_name = Column(String, primary_key=True)
+    pages = Column(BigInteger, nullable=False, server_default=text("0"))
+    content_bytes = Column(BigInteger, nullable=False, server_default=text("0"))
+    versions = Column(BigInteger, nullable=False, server_default=text("0"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    reconciled_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class RoomActivity(Base):
+    __tablename__ = "room_activity"
+
+    room_name = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    edits = Column(Integer, nullable=False, server_default=text("0"))
+    feedback = Column(Integer, nullable=False, server_default=text("0"))
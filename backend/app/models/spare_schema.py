@@ -0,0 +1,13 @@
+"""Spare room schemas provisioned ahead of time by the schema pool."""
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+
+from app.db.base import Base
+
+
+class SpareSchema(Base):
+    __tablename__ = "spare_schemas"
+
+    name = Column(String, primary_key=True)
+    signature = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
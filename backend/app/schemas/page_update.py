@@ -7,3 +7,11 @@ class PageContentUpdate(BaseModel):
     title: Optional[str] = None
     slug: Optional[str] = None
     parent_path: Optional[str] = None
+
+
+class PageClone(BaseModel):
+    # None keeps the source's parent (top level when copying to another room); "" is the top level.
+    parent_path: Optional[str] = None
+    slug: Optional[str] = None
+    title: Optional[str] = None
+    target_room: Optional[str] = None
@@ -0,0 +1,517 @@
+"""Embedded BM25 search engine.
+
+Every tenant has its own index directory under ``settings.SEARCH_INDEX_DIR``::
+
+    <tenant>/manifest.json     live segments and their tombstoned page ids
+    <tenant>/buffer.log        JSON lines of writes not yet flushed to a segment
+    <tenant>/seg_000001/       immutable segment
+        lexicon.json           term -> [offset, doc_freq] into postings.bin
+        postings.bin           uint32 (doc_ord, term_freq) pairs, memory-mapped
+        docs.json              page ids, lengths and stored fields
+        text.bin               plain text of every document, memory-mapped
+
+Page writes are appended to the buffer log and kept in memory until
+``FLUSH_DOCS`` of them accumulate; they are then written out as a new
+segment, and segments are merged once there are more than ``MAX_SEGMENTS``.
+Writers hold an exclusive ``flock`` on the tenant directory so several worker
+processes can share one index; readers notice foreign changes by the manifest
+mtime and the log size.
+
+A rebuild reads the pages table first and writes the index afterwards. Writes
+made in between are also appended to the build's ``<token>.pending`` file,
+which becomes the new index's buffer log, so they survive the rebuild.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.services.content import html_to_text
+from app.services.search import SearchBackend
+
+logger = logging.getLogger("wiki.bm25")
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+FLUSH_DOCS = 200
+MAX_SEGMENTS = 8
+MAX_PREFIX_EXPANSIONS = 32
+HEADLINE_CHARS = 150
+PENDING_SUFFIX = ".pending"
+STALE_PENDING_SECONDS = 3600  # left behind by a build that crashed
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(value: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(value.casefold().replace("ё", "е")) if len(w) > 1 or w.isdigit()]
+
+
+def _doc_terms(title: str, body: str) -> Counter:
+    terms = Counter(tokenize(body))
+    for term in tokenize(title):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+
+def _map_file(path: Path) -> mmap.mmap | None:
+    if path.stat().st_size == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment:
+    """Read-only view of one on-disk segment."""
+
+    def __init__(self, path: Path):
+        self.name = path.name
+        with open(path / "lexicon.json", encoding="utf-8") as f:
+            self.lexicon: dict[str, list[int]] = json.load(f)
+        with open(path / "docs.json", encoding="utf-8") as f:
+            docs = json.load(f)
+        self.ids: list[int] = docs["ids"]
+        self.lens: list[int] = docs["lens"]
+        self.titles: list[str] = docs["titles"]
+        self.slugs: list[str] = docs["slugs"]
+        self.paths: list[str] = docs["paths"]
+        self.text_offsets: list[int] = docs["text_offsets"]
+        self.terms = sorted(self.lexicon)
+        self.ord_of = {page_id: i for i, page_id in enumerate(self.ids)}
+        self._postings_map = _map_file(path / "postings.bin")
+        self._text_map = _map_file(path / "text.bin")
+        self.postings = memoryview(self._postings_map).cast("I") if self._postings_map else memoryview(array("I"))
+
+    def doc_freq(self, term: str) -> int:
+        entry = self.lexicon.get(term)
+        return entry[1] if entry else 0
+
+    def term_postings(self, term: str):
+        entry = self.lexicon.get(term)
+        if not entry:
+            return
+        start, count = entry
+        chunk = self.postings[start:start + 2 * count]
+        for i in range(0, len(chunk), 2):
+            yield chunk[i], chunk[i + 1]
+
+    def text(self, ord_: int) -> str:
+        if self._text_map is None:
+            return ""
+        return self._text_map[self.text_offsets[ord_]:self.text_offsets[ord_ + 1]].decode("utf-8")
+
+    def doc(self, ord_: int) -> dict:
+        return {
+            "id": self.ids[ord_],
+            "title": self.titles[ord_],
+            "slug": self.slugs[ord_],
+            "path": self.paths[ord_],
+            "text": self.text(ord_),
+        }
+
+    def close(self):
+        try:
+            self.postings.release()
+            for m in (self._postings_map, self._text_map):
+                if m is not None:
+                    m.close()
+        except BufferError:
+            pass  # a concurrent reader still holds a slice; GC unmaps it later
+
+    @staticmethod
+    def write(path: Path, docs: list[dict]):
+        """Write ``docs`` (id, title, slug, path, text) as a new segment."""
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        inverted: dict[str, list[tuple[int, int]]] = {}
+        lens, text_offsets = [], [0]
+        with open(tmp / "text.bin", "wb") as text_file:
+            for ord_, doc in enumerate(docs):
+                terms = _doc_terms(doc["title"], doc["text"])
+                lens.append(sum(terms.values()))
+                for term, tf in terms.items():
+                    inverted.setdefault(term, []).append((ord_, tf))
+                encoded = doc["text"].encode("utf-8")
+                text_file.write(encoded)
+                text_offsets.append(text_offsets[-1] + len(encoded))
+
+        postings = array("I")
+        lexicon = {}
+        for term in sorted(inverted):
+            lexicon[term] = [len(postings), len(inverted[term])]
+            for ord_, tf in inverted[term]:
+                postings.append(ord_)
+                postings.append(tf)
+        with open(tmp / "postings.bin", "wb") as f:
+            postings.tofile(f)
+        with open(tmp / "lexicon.json", "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+        with open(tmp / "docs.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": [d["id"] for d in docs],
+                "lens": lens,
+                "titles": [d["title"] for d in docs],
+                "slugs": [d["slug"] for d in docs],
+                "paths": [d["path"] for d in docs],
+                "text_offsets": text_offsets,
+            }, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+class TenantIndex:
+    """All segments plus the write buffer of one tenant."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.RLock()
+        self._segments: list[Segment] = []
+        self._tombstones: dict[str, set[int]] = {}
+        self._next_seg = 1
+        self._manifest_stamp = None
+        self._buffer: dict[int, dict | None] = {}
+        self._buffer_terms: dict[int, Counter] = {}
+        self._log_offset = 0
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.root / "manifest.json"
+
+    @property
+    def _log_path(self) -> Path:
+        return self.root / "buffer.log"
+
+    def exists(self) -> bool:
+        return self._manifest_path.exists()
+
+    @contextmanager
+    def _flock(self, exclusive: bool):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ── Loading ──────────────────────────────────────────────────────
+
+    def _load_manifest(self):
+        for seg in self._segments:
+            seg.close()
+        with open(self._manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._segments = [Segment(self.root / name) for name in manifest["segments"]]
+        self._tombstones = {k: set(v) for k, v in manifest["tombstones"].items()}
+        self._next_seg = manifest["next_seg"]
+        self._manifest_stamp = self._stamp()
+        self._buffer.clear()
+        self._buffer_terms.clear()
+        self._log_offset = 0
+
+    def _apply(self, entry: dict):
+        page_id = entry["id"]
+        if entry["op"] == "put":
+            doc = {k: entry[k] for k in ("id", "title", "slug", "path", "text")}
+            self._buffer[page_id] = doc
+            self._buffer_terms[page_id] = _doc_terms(doc["title"], doc["text"])
+        else:
+            self._buffer[page_id] = None
+            self._buffer_terms.pop(page_id, None)
+
+    def _replay_log(self):
+        if not self._log_path.exists():
+            return
+        size = self._log_path.stat().st_size
+        if size < self._log_offset:
+            # Truncated by another process after a flush.
+            self._load_manifest()
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line, pick it up next time
+                self._apply(json.loads(line))
+                self._log_offset += len(line)
+
+    def _stamp(self) -> tuple[int, int]:
+        # The manifest is always replaced, never rewritten in place, so a new
+        # inode means another process published new segments.
+        st = self._manifest_path.stat()
+        return st.st_ino, st.st_mtime_ns
+
+    def _sync(self):
+        if self._stamp() != self._manifest_stamp:
+            self._load_manifest()
+        self._replay_log()
+
+    def refresh(self):
+        """Pick up segments and buffered writes from other processes."""
+        with self._lock, self._flock(exclusive=False):
+            if self.exists():
+                self._sync()
+
+    # ── Writing ──────────────────────────────────────────────────────
+
+    def _write_manifest(self, segments: list[str], tombstones: dict[str, set[int]]):
+        tmp = self._manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "segments": segments,
+                "tombstones": {k: sorted(v) for k, v in tombstones.items() if v},
+                "next_seg": self._next_seg,
+            }, f)
+        os.replace(tmp, self._manifest_path)
+
+    def _new_segment_name(self) -> str:
+        name = f"seg_{self._next_seg:06d}"
+        self._next_seg += 1
+        return name
+
+    def begin_build(self) -> Path:
+        """Start collecting writes for a build; call before reading its documents."""
+        with self._lock, self._flock(exclusive=True):
+            cutoff = time.time() - STALE_PENDING_SECONDS
+            for stale in self.root.glob("*" + PENDING_SUFFIX):
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink(missing_ok=True)
+            pending = self.root / f"{uuid.uuid4().hex}{PENDING_SUFFIX}"
+            pending.touch()
+            return pending
+
+    def build(self, docs: list[dict], pending: Path | None = None):
+        """Replace the whole index with ``docs`` plus the writes collected in ``pending``."""
+        with self._lock, self._flock(exclusive=True):
+            if self.exists():
+                self._load_manifest()
+            old = [seg.name for seg in self._segments]
+            name = self._new_segment_name()
+            Segment.write(self.root / name, docs)
+            self._write_manifest([name], {})
+            self._log_path.write_bytes(pending.read_bytes() if pending else b"")
+            if pending:
+                pending.unlink()
+            self._load_manifest()
+            self._remove_segments(old)
+
+    def write(self, entry: dict):
+        """Apply one page write; without an index or a build to collect it, it is dropped."""
+        if not self.root.exists():
+            return  # built from the database on first search
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock, self._flock(exclusive=True):
+            for pending in self.root.glob("*" + PENDING_SUFFIX):
+                with open(pending, "ab") as f:
+                    f.write(line)
+            if not self.exists():
+                return
+            self._sync()
+            with open(self._log_path, "ab") as f:
+                f.write(line)
+            self._apply(entry)
+            self._log_offset += len(line)
+            if len(self._buffer) >= FLUSH_DOCS:
+                self._flush()
+
+    def _flush(self):
+        live = [doc for doc in self._buffer.values() if doc is not None]
+        tombstones = {k: set(v) for k, v in self._tombstones.items()}
+        for seg in self._segments:
+            shadowed = {page_id for page_id in self._buffer if page_id in seg.ord_of}
+            if shadowed:
+                tombstones.setdefault(seg.name, set()).update(shadowed)
+        segments = [seg.name for seg in self._segments]
+        if live:
+            name = self._new_segment_name()
+            Segment.write(self.root / name, live)
+            segments.append(name)
+
+        obsolete: list[str] = []
+        if len(segments) > MAX_SEGMENTS:
+            docs = []
+            for seg in self._segments:
+                dead = tombstones.get(seg.name, set())
+                docs.extend(seg.doc(i) for i, page_id in enumerate(seg.ids) if page_id not in dead)
+            docs.extend(live)
+            obsolete = segments
+            name = self._new_segment_name()
+            Segment.write(self.root / name, docs)
+            segments, tombstones = [name], {}
+
+        self._write_manifest(segments, tombstones)
+        self._log_path.write_bytes(b"")
+        self._load_manifest()
+        self._remove_segments(obsolete)
+        logger.info("Flushed search index %s (%d segments)", self.root.name, len(segments))
+
+    def _remove_segments(self, names: list[str]):
+        # Processes that still have these mapped keep reading them until they
+        # reload; unlinking doesn't invalidate existing mappings.
+        for name in names:
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    # ── Searching ────────────────────────────────────────────────────
+
+    def _expand(self, token: str) -> set[str]:
+        """Exact term plus up to MAX_PREFIX_EXPANSIONS terms starting with it."""
+        found = {token}
+        for seg in self._segments:
+            i = bisect_left(seg.terms, token)
+            while i < len(seg.terms) and seg.terms[i].startswith(token) and len(found) < MAX_PREFIX_EXPANSIONS:
+                found.add(seg.terms[i])
+                i += 1
+        for terms in self._buffer_terms.values():
+            for term in terms:
+                if len(found) >= MAX_PREFIX_EXPANSIONS:
+                    break
+                if term.startswith(token):
+                    found.add(term)
+        return found
+
+    def search(self, query: str, limit: int, offset: int) -> list[dict]:
+        self.refresh()
+        with self._lock:
+            tokens = list(dict.fromkeys(tokenize(query)))
+            if not tokens:
+                return []
+            n_docs = sum(len(seg.ids) for seg in self._segments) + len(self._buffer_terms)
+            total_len = sum(sum(seg.lens) for seg in self._segments)
+            total_len += sum(sum(t.values()) for t in self._buffer_terms.values())
+            avgdl = total_len / n_docs if n_docs else 1.0
+
+            scores: dict[int, float] = {}
+            located: dict[int, tuple[Segment | None, int]] = {}
+            for token in tokens:
+                for term in self._expand(token):
+                    df = sum(seg.doc_freq(term) for seg in self._segments)
+                    df += sum(1 for t in self._buffer_terms.values() if term in t)
+                    if not df:
+                        continue
+                    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                    # Prefix expansions count less than the exact word.
+                    weight = idf if term == token else idf * 0.5
+
+                    for seg in self._segments:
+                        dead = self._tombstones.get(seg.name, ())
+                        for ord_, tf in seg.term_postings(term):
+                            page_id = seg.ids[ord_]
+                            if page_id in dead or page_id in self._buffer:
+                                continue
+                            norm = K1 * (1 - B + B * seg.lens[ord_] / avgdl)
+                            scores[page_id] = scores.get(page_id, 0.0) + weight * tf * (K1 + 1) / (tf + norm)
+                            located[page_id] = (seg, ord_)
+                    for page_id, terms in self._buffer_terms.items():
+                        tf = terms.get(term)
+                        if tf:
+                            norm = K1 * (1 - B + B * sum(terms.values()) / avgdl)
+                            scores[page_id] = scores.get(page_id, 0.0) + weight * tf * (K1 + 1) / (tf + norm)
+                            located[page_id] = (None, page_id)
+
+            ranked = sorted(scores.items(), key=lambda s: (-s[1], s[0]))[offset:offset + limit]
+            results = []
+            for page_id, score in ranked:
+                seg, ref = located[page_id]
+                doc = seg.doc(ref) if seg is not None else self._buffer[ref]
+                results.append({
+                    "id": doc["id"],
+                    "title": doc["title"],
+                    "slug": doc["slug"],
+                    "path": doc["path"],
+                    "rank": round(score, 4),
+                    "headline": _headline(doc["text"], tokens),
+                })
+            return results
+
+
+def _headline(body: str, tokens: list[str]) -> str:
+    if not body:
+        return ""
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(tokens, key=len, reverse=True)), re.IGNORECASE)
+    match = pattern.search(body)
+    if not match:
+        return ""
+    start = max(0, match.start() - 60)
+    snippet = body[start:start + HEADLINE_CHARS].replace("\n", " ")
+    return pattern.sub(lambda m: f"<mark>{m.group()}</mark>", snippet)
+
+
+class BM25SearchBackend(SearchBackend):
+    """In-process BM25 engine with per-tenant segments on local disk."""
+
+    needs_page_data = True
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._indexes: dict[str, TenantIndex] = {}
+        self._build_locks: dict[str, asyncio.Lock] = {}
+
+    def _index(self, tenant_id: str) -> TenantIndex:
+        index = self._indexes.get(tenant_id)
+        if index is None:
+            index = self._indexes[tenant_id] = TenantIndex(self.root / tenant_id)
+        return index
+
+    async def _ensure_built(self, db: AsyncSession, tenant_id: str) -> TenantIndex:
+        index = self._index(tenant_id)
+        if index.exists():
+            return index
+        async with self._build_locks.setdefault(tenant_id, asyncio.Lock()):
+            if not index.exists():
+                await self.rebuild(db, tenant_id)
+        return index
+
+    async def rebuild(self, db: AsyncSession, tenant_id: str):
+        """Re-create a tenant's index from its pages table."""
+        index = self._index(tenant_id)
+        pending = await asyncio.to_thread(index.begin_build)
+        try:
+            result = await db.execute(text("SELECT id, title, slug, path::text, content FROM pages ORDER BY id"))
+            docs = [
+                {"id": r[0], "title": r[1], "slug": r[2], "path": r[3], "text": html_to_text(r[4])}
+                for r in result
+            ]
+            await asyncio.to_thread(index.build, docs, pending)
+        finally:
+            pending.unlink(missing_ok=True)
+        logger.info("Built BM25 index for %s (%d pages)", tenant_id, len(docs))
+
+    async def search(self, db, tenant_id, query, limit=20, offset=0):
+        index = await self._ensure_built(db, tenant_id)
+        return await asyncio.to_thread(index.search, query, limit, offset)
+
+    async def index_page(self, tenant_id, page_id, title, slug, path, content):
+        index = self._index(tenant_id)
+        if not index.root.exists():
+            return  # built from the database on first search
+        entry = {"op": "put", "id": page_id, "title": title, "slug": slug, "path": path,
+                 "text": html_to_text(content)}
+        await asyncio.to_thread(index.write, entry)
+
+    async def remove_page(self, tenant_id, page_id):
+        await asyncio.to_thread(self._index(tenant_id).write, {"op": "del", "id": page_id})
+
+
+def create_backend() -> BM25SearchBackend:
+    root = Path(settings.SEARCH_INDEX_DIR) if settings.SEARCH_INDEX_DIR else (
+        Path(__file__).resolve().parents[2] / "search_index"
+    )
+    return BM25SearchBackend(root)
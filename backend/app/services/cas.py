@@ -0,0 +1,141 @@
+"""Content-addressed media storage.
+
+Objects are stored once per SHA-256 under ``cas/<aa>/<sha256>``, whichever
+room uploads them. ``public.media_objects`` records each object and how many
+pages point at it; ``public.media_refs`` holds the (room, page, hash) edges
+and is kept in sync by the indexing worker from saved page content, so
+reference counts never depend on the client calling back.
+
+The uploader presigns with ``x-amz-checksum-sha256`` as a signed header, so
+storage rejects a body whose hash differs from the one the key was derived from.
+Unreferenced objects are not deleted here; ``last_unref_at`` tells orphan
+collection how long they have been unused.
+"""
+import base64
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.storage import get_storage
+
+KEY_PREFIX = "cas/"
+# Content never changes under a key, so URLs are signed for a week and kept
+# stable for a day, and browsers may cache the bytes for as long as they like.
+DOWNLOAD_EXPIRES = 7 * 24 * 3600
+DOWNLOAD_WINDOW = 24 * 3600
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_KEY_IN_CONTENT_RE = re.compile(r"cas/[0-9a-f]{2}/([0-9a-f]{64})")
+
+
+def is_sha256(value: str) -> bool:
+    return bool(_SHA256_RE.match(value))
+
+
+def object_key(sha256: str) -> str:
+    return f"{KEY_PREFIX}{sha256[:2]}/{sha256}"
+
+
+def referenced_hashes(html: str | None) -> set[str]:
+    """Hashes of CAS objects a page links to (image sources, attachments)."""
+    return set(_KEY_IN_CONTENT_RE.findall(html or ""))
+
+
+def checksum(sha256: str) -> str:
+    """The hash in the base64 form S3 uses for ``x-amz-checksum-sha256``."""
+    return base64.b64encode(bytes.fromhex(sha256)).decode()
+
+
+def upload_url(sha256: str, expires: int = 3600) -> tuple[str, dict[str, str]]:
+    """Presigned PUT URL plus the headers the client must send with it."""
+    headers = {"x-amz-checksum-sha256": checksum(sha256)}
+    return get_storage().presign_put(object_key(sha256), expires, headers=headers), headers
+
+
+def is_cas_key(key: str) -> bool:
+    """True for CAS objects and anything derived from them (e.g. image variants)."""
+    return key.startswith(KEY_PREFIX) and _KEY_IN_CONTENT_RE.match(key) is not None
+
+
+def download_url(key: str) -> str:
+    """Long-lived, cache-friendly URL for an immutable object under ``cas/``."""
+    return get_storage().presign_get(key, DOWNLOAD_EXPIRES, cache_control=CACHE_CONTROL, window=DOWNLOAD_WINDOW)
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.media_objects ("
+        "  sha256 VARCHAR(64) PRIMARY KEY, "
+        "  size BIGINT NOT NULL, "
+        "  content_type VARCHAR, "
+        "  status VARCHAR(20) NOT NULL DEFAULT 'pending', "
+        "  refcount INTEGER NOT NULL DEFAULT 0, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  last_unref_at TIMESTAMPTZ"
+        ")"
+    ))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.media_refs ("
+        "  tenant VARCHAR(100) NOT NULL, "
+        "  page_id INTEGER NOT NULL, "
+        "  sha256 VARCHAR(64) NOT NULL, "
+        "  PRIMARY KEY (tenant, page_id, sha256)"
+        ")"
+    ))
+    await db.execute(text("CREATE INDEX IF NOT EXISTS ix_media_refs_sha256 ON public.media_refs (sha256)"))
+    await db.commit()
+
+
+async def get_object(db: AsyncSession, sha256: str) -> dict | None:
+    result = await db.execute(text(
+        "SELECT sha256, size, content_type, status, refcount FROM public.media_objects WHERE sha256 = :h"
+    ), {"h": sha256})
+    row = result.mappings().first()
+    return dict(row) if row else None
+
+
+async def _adjust_refcounts(db: AsyncSession, hashes: list[str], delta: int):
+    if not hashes:
+        return
+    await db.execute(text(
+        "UPDATE public.media_objects SET refcount = GREATEST(refcount + :d, 0), "
+        "last_unref_at = CASE WHEN refcount + :d <= 0 THEN now() ELSE NULL END "
+        "WHERE sha256 = ANY(:hashes)"
+    ), {"d": delta, "hashes": hashes})
+
+
+async def sync_page_refs(db: AsyncSession, tenant: str, page_id: int, hashes: set[str]):
+    """Make the page's reference edges match ``hashes``, adjusting counts by the difference."""
+    result = await db.execute(text(
+        "SELECT sha256 FROM public.media_refs WHERE tenant = :t AND page_id = :pid"
+    ), {"t": tenant, "pid": page_id})
+    current = {row[0] for row in result}
+    added, removed = sorted(hashes - current), sorted(current - hashes)
+    if added:
+        await db.execute(text(
+            "INSERT INTO public.media_refs (tenant, page_id, sha256) "
+            "SELECT :t, :pid, unnest(CAST(:hashes AS VARCHAR[])) ON CONFLICT DO NOTHING"
+        ), {"t": tenant, "pid": page_id, "hashes": added})
+        await _adjust_refcounts(db, added, 1)
+    if removed:
+        await db.execute(text(
+            "DELETE FROM public.media_refs WHERE tenant = :t AND page_id = :pid AND sha256 = ANY(:hashes)"
+        ), {"t": tenant, "pid": page_id, "hashes": removed})
+        await _adjust_refcounts(db, removed, -1)
+
+
+async def drop_tenant_refs(db: AsyncSession, tenant: str):
+    """Release every reference held by a room that is being deleted."""
+    result = await db.execute(text(
+        "DELETE FROM public.media_refs WHERE tenant = :t RETURNING sha256"
+    ), {"t": tenant})
+    counts: dict[str, int] = {}
+    for (sha256,) in result:
+        counts[sha256] = counts.get(sha256, 0) + 1
+    for n in set(counts.values()):
+        await _adjust_refcounts(db, [h for h, c in counts.items() if c == n], -n)
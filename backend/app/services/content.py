@@ -0,0 +1,86 @@
+"""Helpers for deriving plain data from stored page content (Tiptap HTML)."""
+from html.parser import HTMLParser
+
+_SKIP_TAGS = {"script", "style"}
+_BLOCK_TAGS = {
+    "p", "div", "br", "li", "tr", "td", "th", "pre", "blockquote",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html: str | None) -> str:
+    """Strip markup and collapse whitespace, keeping line breaks between blocks."""
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class _StructureExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.outline: list[dict] = []
+        self.links: list[dict] = []
+        self._heading: dict | None = None
+        self._link: dict | None = None
+
+    def handle_starttag(self, tag, attrs):
+        if len(tag) == 2 and tag[0] == "h" and tag[1] in "123456":
+            self._heading = {"level": int(tag[1]), "text": ""}
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self._link = {"href": href, "text": ""}
+
+    def handle_endtag(self, tag):
+        if self._heading is not None and tag == f"h{self._heading['level']}":
+            self._heading["text"] = " ".join(self._heading["text"].split())
+            if self._heading["text"]:
+                self.outline.append(self._heading)
+            self._heading = None
+        elif tag == "a" and self._link is not None:
+            self._link["text"] = " ".join(self._link["text"].split())
+            self.links.append(self._link)
+            self._link = None
+
+    def handle_data(self, data):
+        if self._heading is not None:
+            self._heading["text"] += data
+        if self._link is not None:
+            self._link["text"] += data
+
+
+def extract_structure(html: str | None) -> tuple[list[dict], list[dict]]:
+    """Return the heading outline ({level, text}) and links ({href, text}) of a page."""
+    if not html:
+        return [], []
+    parser = _StructureExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.outline, parser.links
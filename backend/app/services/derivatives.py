@@ -0,0 +1,288 @@
+"""Background generation of resized image variants.
+
+Sources are queued in ``public.image_sources`` (at CAS commit, or lazily the
+first time someone asks for an image's variants). The worker claims a few at
+a time, downloads the original, and decodes and re-encodes it in a small
+process pool. Pillow holds the GIL for much of that work, so doing it in the
+API process would stall request handling.
+
+Variants are stored next to the original as ``<key>.<variant>.<ext>`` and
+listed in ``public.image_variants``. They never change once written, so they
+carry the same immutable Cache-Control as CAS objects.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.services import cas, imaging, storage
+
+logger = logging.getLogger("wiki.derivatives")
+
+POLL_INTERVAL = 2.0
+MAX_ATTEMPTS = 3
+# A claim older than this belongs to a worker that died mid-job.
+CLAIM_TIMEOUT_MINUTES = 10
+KEY_PREFIXES = ("uploads/", cas.KEY_PREFIX)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_READY = "ready"
+STATUS_UNSUPPORTED = "unsupported"
+STATUS_FAILED = "failed"
+
+_EXTENSIONS = {"webp": "webp", "png": "png", "jpeg": "jpg"}
+_CONTENT_TYPES = {"webp": "image/webp", "png": "image/png", "jpeg": "image/jpeg"}
+_VARIANT_SUFFIXES = tuple(f".{name}.{ext}" for name, _ in imaging.SIZES for ext in _EXTENSIONS.values())
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=100,
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def variant_key(source_key: str, variant: str, fmt: str) -> str:
+    return f"{source_key}.{variant}.{_EXTENSIONS[fmt]}"
+
+
+def is_derivable_key(key: str) -> bool:
+    """Only keys the media API hands out can be queued, and never a variant itself."""
+    return key.startswith(KEY_PREFIXES) and not key.endswith(_VARIANT_SUFFIXES)
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.image_sources ("
+        "  object_key VARCHAR PRIMARY KEY, "
+        "  status VARCHAR(20) NOT NULL DEFAULT 'pending', "
+        "  width INTEGER, "
+        "  height INTEGER, "
+        "  attempts INTEGER NOT NULL DEFAULT 0, "
+        "  error VARCHAR, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+    await db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_image_sources_status ON public.image_sources (status, updated_at)"
+    ))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.image_variants ("
+        "  object_key VARCHAR NOT NULL REFERENCES public.image_sources(object_key) ON DELETE CASCADE, "
+        "  variant VARCHAR(20) NOT NULL, "
+        "  format VARCHAR(10) NOT NULL, "
+        "  variant_key VARCHAR NOT NULL, "
+        "  width INTEGER NOT NULL, "
+        "  height INTEGER NOT NULL, "
+        "  size INTEGER NOT NULL, "
+        "  PRIMARY KEY (object_key, variant, format)"
+        ")"
+    ))
+    await db.commit()
+
+
+async def enqueue(db: AsyncSession, object_keys: list[str]):
+    """Queue sources that are not known yet; commit is up to the caller."""
+    if object_keys:
+        await db.execute(text(
+            "INSERT INTO public.image_sources (object_key) "
+            "SELECT unnest(CAST(:keys AS VARCHAR[])) ON CONFLICT DO NOTHING"
+        ), {"keys": object_keys})
+
+
+async def existing_sources(db: AsyncSession, object_keys: list[str]) -> list[str]:
+    """The keys among ``object_keys`` whose original is really stored.
+
+    CAS objects are looked up in ``media_objects``; plain uploads are checked
+    in storage. Callers use this before :func:`enqueue` so that asking for
+    variants of made-up keys cannot fill the queue.
+    """
+    hashes = {}
+    for key in object_keys:
+        sha256 = key.rsplit("/", 1)[-1]
+        if cas.is_sha256(sha256) and key == cas.object_key(sha256):
+            hashes[sha256] = key
+    found = set()
+    if hashes:
+        result = await db.execute(text(
+            "SELECT sha256 FROM public.media_objects WHERE sha256 = ANY(:h) AND status = :ready"
+        ), {"h": list(hashes), "ready": cas.STATUS_READY})
+        found.update(hashes[h] for h in result.scalars())
+    others = [key for key in object_keys if not key.startswith(cas.KEY_PREFIX)]
+    if others:
+        backend = storage.get_storage()
+        found.update(await asyncio.to_thread(lambda: [key for key in others if backend.stat(key)]))
+    return [key for key in object_keys if key in found]
+
+
+async def get_variants(db: AsyncSession, object_keys: list[str]) -> dict[str, dict]:
+    """Status and variants per source key; unknown keys are missing from the result."""
+    result = await db.execute(text(
+        "SELECT s.object_key, s.status, s.width, s.height, "
+        "v.variant, v.format, v.variant_key, v.width, v.height, v.size "
+        "FROM public.image_sources s LEFT JOIN public.image_variants v ON v.object_key = s.object_key "
+        "WHERE s.object_key = ANY(:keys) ORDER BY s.object_key, v.width, v.format"
+    ), {"keys": object_keys})
+    out: dict[str, dict] = {}
+    for key, status, width, height, variant, fmt, vkey, vwidth, vheight, vsize in result:
+        entry = out.setdefault(key, {"status": status, "width": width, "height": height, "variants": []})
+        if variant is not None:
+            entry["variants"].append({
+                "variant": variant, "format": fmt, "object_key": vkey,
+                "width": vwidth, "height": vheight, "size": vsize,
+            })
+    return out
+
+
+async def _claim(limit: int) -> list[str]:
+    async with async_session_maker() as db:
+        result = await db.execute(text(
+            "UPDATE public.image_sources SET status = :processing, attempts = attempts + 1, updated_at = now() "
+            "WHERE object_key IN ("
+            "  SELECT object_key FROM public.image_sources "
+            "  WHERE status = :pending "
+            "     OR (status = :processing AND attempts < :max "
+            "         AND updated_at < now() - make_interval(mins => :timeout)) "
+            "  ORDER BY updated_at LIMIT :n FOR UPDATE SKIP LOCKED"
+            ") RETURNING object_key"
+        ), {"processing": STATUS_PROCESSING, "pending": STATUS_PENDING,
+            "max": MAX_ATTEMPTS, "timeout": CLAIM_TIMEOUT_MINUTES, "n": limit})
+        keys = [row[0] for row in result]
+        await db.commit()
+    return keys
+
+
+async def _finish(object_key: str, status: str, size: tuple[int, int] | None = None,
+                  variants: list[dict] = (), error: str | None = None):
+    async with async_session_maker() as db:
+        for v in variants:
+            await db.execute(text(
+                "INSERT INTO public.image_variants "
+                "(object_key, variant, format, variant_key, width, height, size) "
+                "VALUES (:key, :variant, :format, :vkey, :w, :h, :size) "
+                "ON CONFLICT (object_key, variant, format) DO UPDATE SET variant_key = EXCLUDED.variant_key, "
+                "width = EXCLUDED.width, height = EXCLUDED.height, size = EXCLUDED.size"
+            ), {"key": object_key, "variant": v["variant"], "format": v["format"], "vkey": v["object_key"],
+                "w": v["width"], "h": v["height"], "size": v["size"]})
+        await db.execute(text(
+            "UPDATE public.image_sources SET status = :status, width = :w, height = :h, error = :error, "
+            "updated_at = now() WHERE object_key = :key"
+        ), {"status": status, "w": size[0] if size else None, "h": size[1] if size else None,
+            "error": error, "key": object_key})
+        await db.commit()
+
+
+async def _retry_or_fail(object_key: str, error: str):
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.image_sources SET error = :error, updated_at = now(), "
+            "status = CASE WHEN attempts >= :max THEN :failed ELSE :pending END "
+            "WHERE object_key = :key"
+        ), {"error": error[:500], "max": MAX_ATTEMPTS, "failed": STATUS_FAILED,
+            "pending": STATUS_PENDING, "key": object_key})
+        await db.commit()
+
+
+async def _release(object_key: str):
+    """Put a source back in the queue without spending one of its attempts."""
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.image_sources SET status = :pending, attempts = GREATEST(attempts - 1, 0), "
+            "updated_at = now() WHERE object_key = :key"
+        ), {"pending": STATUS_PENDING, "key": object_key})
+        await db.commit()
+
+
+async def process_source(object_key: str):
+    """Generate and store all variants of one source image."""
+    store = storage.get_storage()
+    data = await asyncio.to_thread(store.get, object_key, settings.IMAGE_MAX_SOURCE_BYTES)
+    if data is None:
+        await _finish(object_key, STATUS_UNSUPPORTED, error="missing or too large")
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        size, rendered = await loop.run_in_executor(
+            _get_pool(), imaging.render_variants, data, settings.IMAGE_MAX_PIXELS,
+        )
+    except imaging.UnsupportedImage as e:
+        await _finish(object_key, STATUS_UNSUPPORTED, error=str(e)[:500])
+        return
+    del data  # don't hold the original while uploading
+
+    variants = []
+    for v in rendered:
+        key = variant_key(object_key, v["variant"], v["format"])
+        await asyncio.to_thread(store.put, key, v["body"], _CONTENT_TYPES[v["format"]], cas.CACHE_CONTROL)
+        variants.append({"variant": v["variant"], "format": v["format"], "object_key": key,
+                         "width": v["width"], "height": v["height"], "size": len(v["body"])})
+    await _finish(object_key, STATUS_READY, size, variants)
+
+
+async def _process_guarded(object_key: str):
+    try:
+        await process_source(object_key)
+    except storage.StorageUnavailable:
+        # Not the image's fault; retry once storage is back.
+        await _release(object_key)
+    except BrokenProcessPool:
+        # A worker process died (e.g. OOM on a hostile image); start a fresh pool.
+        logger.error("Image worker pool broke while processing %s", object_key)
+        shutdown_pool()
+        await _retry_or_fail(object_key, "image worker crashed")
+    except Exception as e:
+        logger.exception("Derivatives failed for %s", object_key)
+        await _retry_or_fail(object_key, repr(e))
+
+
+async def run_worker(stop: asyncio.Event | None = None):
+    """Process queued images until ``stop`` is set.
+
+    At most ``2 * IMAGE_WORKERS`` sources are in flight, which bounds both
+    CPU (the pool) and memory (originals held while they wait for it).
+    """
+    stop = stop or asyncio.Event()
+    batch = settings.IMAGE_WORKERS * 2
+    logger.info("Image derivative worker started")
+    try:
+        while not stop.is_set():
+            if not storage.breaker.available:
+                keys = []
+            else:
+                try:
+                    keys = await _claim(batch)
+                except Exception:
+                    logger.exception("Claiming images failed, retrying")
+                    keys = []
+            if keys:
+                await asyncio.gather(*(_process_guarded(key) for key in keys))
+            if len(keys) < batch:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        shutdown_pool()
+    logger.info("Image derivative worker stopped")
@@ -0,0 +1,210 @@
+"""Buffered ingestion of public feedback.
+
+Feedback comes from an unauthenticated endpoint, so a busy public room would
+otherwise cost one tiny transaction per message. Submissions are queued in
+memory and written by :func:`run_flusher` with a single multi-row INSERT
+once ``FEEDBACK_FLUSH_SIZE`` rows are waiting or ``FEEDBACK_FLUSH_INTERVAL``
+seconds have passed, and once more on shutdown. ``created_at`` is taken at
+submission, so ordering does not depend on when a batch lands.
+
+Rows still in the buffer are lost if the process is killed without a
+graceful shutdown; at most one interval's worth per worker.
+
+A batch the database refuses is written again row by row, and rows it
+refuses on their own merits (data or constraint errors) are logged and
+dropped, so one bad message cannot hold up every room's feedback. Any other
+error (the database is down) puts the remaining rows back in the queue.
+
+Each batch also bumps ``feedback_counters`` in the same transaction, so room
+totals are read from there instead of counting rows, and adds to the rooms'
+daily feedback in ``room_activity``. A periodic
+:func:`reconcile_counters` repairs any drift (rows deleted by hand, counters
+lost in a restore).
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.services import room_stats
+from app.services.rate_limit import TokenBucketLimiter, parse_networks
+
+logger = logging.getLogger("wiki.feedback")
+
+RECONCILE_INTERVAL = 3600
+
+ip_limiter = TokenBucketLimiter(settings.FEEDBACK_IP_RATE, settings.FEEDBACK_IP_BURST)
+room_limiter = TokenBucketLimiter(settings.FEEDBACK_ROOM_RATE, settings.FEEDBACK_ROOM_BURST)
+trusted_proxies = parse_networks(settings.TRUSTED_PROXIES)
+
+
+class BufferFull(Exception):
+    pass
+
+
+class FeedbackBuffer:
+    def __init__(self, flush_size: int, max_rows: int):
+        self.flush_size = flush_size
+        self.max_rows = max_rows
+        self._rows: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.running = False
+        self.flushed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def add(self, room_name: str, text_: str, author_name: str, author_org: str):
+        """Queue one message; raises BufferFull while the database cannot keep up."""
+        if len(self._rows) >= self.max_rows:
+            raise BufferFull()
+        self._rows.append({
+            "room_name": room_name, "text": text_, "author_name": author_name,
+            "author_org": author_org, "created_at": datetime.now(timezone.utc),
+        })
+        if not self.running:
+            # No flusher in this process (e.g. tests without lifespan): write through.
+            await self.flush()
+        elif len(self._rows) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far; returns how many rows were written.
+
+        If the batch fails, rows are written one at a time and the ones the
+        database rejects as invalid are dropped. On any other error the rows
+        not yet written stay queued and the error is raised.
+        """
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                async with async_session_maker() as session:
+                    await _insert(session, rows)
+                    await session.commit()
+            except (DataError, IntegrityError):
+                written = await self._insert_one_by_one(rows)
+            except Exception:
+                self._rows[:0] = rows
+                raise
+            else:
+                written = len(rows)
+            self.flushed += written
+            return written
+
+    async def _insert_one_by_one(self, rows: list[dict]) -> int:
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                async with async_session_maker() as session:
+                    await _insert(session, [row])
+                    await session.commit()
+            except (DataError, IntegrityError) as e:
+                self.dropped += 1
+                logger.error("Dropping feedback for room %s the database refused: %s", row["room_name"], e)
+                continue
+            except Exception:
+                self._rows[:0] = rows[i:]
+                self.flushed += written
+                raise
+            written += 1
+        return written
+
+    async def run(self, stop: asyncio.Event, interval: float):
+        self.running = True
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("Flushing %d feedback rows failed, will retry", len(self._rows))
+        finally:
+            self.running = False
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Dropping %d feedback rows on shutdown", len(self._rows))
+
+
+async def _insert(session, rows: list[dict]):
+    await session.execute(text(
+        "INSERT INTO feedback (room_name, text, author_name, author_org, created_at) "
+        "SELECT * FROM unnest(CAST(:rooms AS VARCHAR[]), CAST(:texts AS TEXT[]), "
+        "CAST(:names AS VARCHAR[]), CAST(:orgs AS VARCHAR[]), CAST(:created AS TIMESTAMPTZ[]))"
+    ), {
+        "rooms": [r["room_name"] for r in rows],
+        "texts": [r["text"] for r in rows],
+        "names": [r["author_name"] for r in rows],
+        "orgs": [r["author_org"] for r in rows],
+        "created": [r["created_at"] for r in rows],
+    })
+    per_room = Counter(r["room_name"] for r in rows)
+    await session.execute(text(
+        "INSERT INTO feedback_counters (room_name, count) "
+        "SELECT * FROM unnest(CAST(:rooms AS VARCHAR[]), CAST(:counts AS BIGINT[])) "
+        "ON CONFLICT (room_name) DO UPDATE SET count = feedback_counters.count + EXCLUDED.count, "
+        "updated_at = now()"
+    ), {"rooms": list(per_room), "counts": list(per_room.values())})
+    await room_stats.record_feedback(session, Counter((r["room_name"], r["created_at"].date()) for r in rows))
+
+
+async def reconcile_counters() -> int:
+    """Recount feedback per room and fix counters that drifted. Returns how many were fixed.
+
+    The counters table is locked first, so batches that commit during the
+    recount wait and then add on top of the corrected value.
+    """
+    async with async_session_maker() as session:
+        await session.execute(text("LOCK TABLE feedback_counters IN SHARE ROW EXCLUSIVE MODE"))
+        result = await session.execute(text(
+            "WITH actual AS ("
+            "  SELECT room_name, COUNT(*) AS n FROM feedback GROUP BY room_name"
+            "), merged AS ("
+            "  SELECT COALESCE(a.room_name, c.room_name) AS room_name, COALESCE(a.n, 0) AS n "
+            "  FROM actual a FULL JOIN feedback_counters c ON c.room_name = a.room_name "
+            "  WHERE c.count IS DISTINCT FROM COALESCE(a.n, 0)"
+            ") "
+            "INSERT INTO feedback_counters (room_name, count) SELECT room_name, n FROM merged "
+            "ON CONFLICT (room_name) DO UPDATE SET count = EXCLUDED.count, updated_at = now() "
+            "RETURNING room_name"
+        ))
+        fixed = len(result.fetchall())
+        await session.commit()
+    if fixed:
+        logger.warning("Reconciled feedback counters of %d rooms", fixed)
+    return fixed
+
+
+buffer = FeedbackBuffer(settings.FEEDBACK_FLUSH_SIZE, settings.FEEDBACK_BUFFER_MAX_ROWS)
+
+
+async def run_flusher(stop: asyncio.Event):
+    """Flush the buffer on size or time until ``stop`` is set, then once more."""
+    await buffer.run(stop, settings.FEEDBACK_FLUSH_INTERVAL)
+
+
+async def run_reconcile_loop(stop: asyncio.Event | None = None, interval: float = RECONCILE_INTERVAL):
+    """Reconcile counters now and every ``interval`` seconds until ``stop`` is set."""
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await reconcile_counters()
+        except Exception:
+            logger.exception("Feedback counter reconciliation failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,77 @@
+"""Image resizing for media derivatives.
+
+Runs inside worker processes (see ``derivatives``), so it imports nothing
+from the app: the function takes bytes and returns bytes and stays cheap to
+load in a freshly spawned interpreter.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+# (variant name, longest side in pixels); None keeps the original size.
+SIZES = (("thumb", 320), ("medium", 1280), ("full", None))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "webp":
+        image.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+    elif fmt == "png":
+        image.save(buf, "PNG", optimize=True)
+    else:
+        if image.mode not in ("RGB", "L"):
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+            image = background
+        image.save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def render_variants(data: bytes, max_pixels: int) -> tuple[tuple[int, int], list[dict]]:
+    """Decode an image and produce its variants.
+
+    Returns the original ``(width, height)`` and a list of
+    ``{variant, format, width, height, body}``. Every size gets a WebP and a
+    fallback in the source's family (PNG for PNG sources, which are usually
+    screenshots, JPEG otherwise). Sizes that would upscale are skipped; the
+    full-size variant is WebP only.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        image.load()
+    except (OSError, Image.DecompressionBombError, SyntaxError) as e:
+        raise UnsupportedImage(str(e)) from e
+
+    image = ImageOps.exif_transpose(image)  # screenshots from phones carry rotation in EXIF
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode == "P" else "RGB")
+    fallback = "png" if source_format == "PNG" else "jpeg"
+
+    width, height = image.size
+    variants = []
+    for name, longest in SIZES:
+        if longest is None:
+            resized, formats = image, ("webp",)
+        elif max(width, height) <= longest:
+            continue
+        else:
+            resized = image.copy()
+            resized.thumbnail((longest, longest), Image.LANCZOS)
+            formats = ("webp", fallback)
+        for fmt in formats:
+            variants.append({
+                "variant": name,
+                "format": fmt,
+                "width": resized.width,
+                "height": resized.height,
+                "body": _encode(resized, fmt),
+            })
+    return (width, height), variants
@@ -0,0 +1,212 @@
+"""Post-commit indexing pipeline for derived page data.
+
+Page writes insert a row into ``public.page_events`` inside their own
+transaction, so an event exists exactly when the write committed. Workers
+claim batches with ``FOR UPDATE SKIP LOCKED``, coalesce them per page and
+recompute everything derived from page content:
+
+* ``page_derived`` of the room (plain text, heading outline, links)
+* the search backend's own index, if it keeps one
+* references to content-addressed media (``public.media_refs``)
+
+Claimed events are deleted in the same transaction that writes the derived
+rows, so a crashed worker simply leaves them for the next one. Events of a
+room whose processing fails are requeued with ``attempts`` raised by one;
+after ``MAX_ATTEMPTS`` they move to ``public.page_events_failed`` instead, so
+a page that can never be indexed does not circle through the queue forever.
+"""
+import asyncio
+import json
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session_maker
+from app.db.tenancy import _TENANT_RE, PAGE_DERIVED_DDL, set_tenant_schema, tenant_exists
+from app.services import cas
+from app.services.content import html_to_text, extract_structure
+from app.services.search import get_search_backend
+
+logger = logging.getLogger("wiki.indexing")
+
+BATCH_SIZE = 200
+POLL_INTERVAL = 1.0
+MAX_ATTEMPTS = 5
+
+EVENT_CHANGED = "changed"
+EVENT_MOVED = "moved"
+EVENT_DELETED = "deleted"
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.page_events ("
+        "  id BIGSERIAL PRIMARY KEY, "
+        "  tenant VARCHAR(100) NOT NULL, "
+        "  page_id INTEGER NOT NULL, "
+        "  kind VARCHAR(20) NOT NULL, "
+        "  attempts INTEGER NOT NULL DEFAULT 0, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+    await db.execute(text("ALTER TABLE public.page_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0"))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.page_events_failed ("
+        "  id BIGSERIAL PRIMARY KEY, "
+        "  tenant VARCHAR(100) NOT NULL, "
+        "  page_id INTEGER NOT NULL, "
+        "  kind VARCHAR(20) NOT NULL, "
+        "  attempts INTEGER NOT NULL, "
+        "  error TEXT NOT NULL DEFAULT '', "
+        "  failed_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+    await db.commit()
+
+
+async def enqueue_page_event(db: AsyncSession, tenant_id: str, page_id: int, kind: str = EVENT_CHANGED):
+    """Record a page change in the caller's transaction; commit is up to the caller."""
+    await db.execute(
+        text("INSERT INTO public.page_events (tenant, page_id, kind) VALUES (:t, :pid, :k)"),
+        {"t": tenant_id, "pid": page_id, "k": kind},
+    )
+
+
+def _coalesce(rows) -> dict[str, dict[int, str]]:
+    """Collapse events to one per page: a delete wins, a move covers a change."""
+    by_tenant: dict[str, dict[int, str]] = {}
+    for tenant, page_id, kind, *_ in rows:
+        pages = by_tenant.setdefault(tenant, {})
+        if kind == EVENT_DELETED or pages.get(page_id) != EVENT_MOVED:
+            pages[page_id] = kind
+    return by_tenant
+
+
+async def _requeue(db: AsyncSession, tenant: str, events: dict[int, str], attempts: dict[tuple[str, int], int],
+                   error: str):
+    """Put failed events back with one more attempt, or dead-letter those out of attempts."""
+    retry, dead = [], []
+    for page_id, kind in events.items():
+        count = attempts.get((tenant, page_id), 0) + 1
+        (dead if count >= MAX_ATTEMPTS else retry).append((page_id, kind, count))
+    unnest = ("FROM unnest(CAST(:ids AS INTEGER[]), CAST(:kinds AS VARCHAR[]), CAST(:counts AS INTEGER[])) "
+              "AS e(page_id, kind, attempts)")
+
+    def params(items):
+        return {"t": tenant, "ids": [i[0] for i in items], "kinds": [i[1] for i in items],
+                "counts": [i[2] for i in items], "error": error}
+
+    if retry:
+        await db.execute(text(
+            f"INSERT INTO public.page_events (tenant, page_id, kind, attempts) SELECT :t, page_id, kind, attempts {unnest}"
+        ), params(retry))
+    if dead:
+        await db.execute(text(
+            "INSERT INTO public.page_events_failed (tenant, page_id, kind, attempts, error) "
+            f"SELECT :t, page_id, kind, attempts, :error {unnest}"
+        ), params(dead))
+        logger.error("Indexing gave up on %d pages of %s after %d attempts; see public.page_events_failed",
+                     len(dead), tenant, MAX_ATTEMPTS)
+
+
+_derived_ready: set[str] = set()
+
+
+async def _ensure_derived_table(db: AsyncSession, schema: str):
+    if schema in _derived_ready:
+        return
+    await db.execute(text(PAGE_DERIVED_DDL.format(schema=schema)))
+    _derived_ready.add(schema)
+
+
+async def _process_tenant(db: AsyncSession, tenant: str, events: dict[int, str]):
+    if not _TENANT_RE.match(tenant):
+        logger.warning("Dropping page events for invalid tenant %r", tenant)
+        return
+    if not await tenant_exists(db, tenant):
+        return  # room was deleted meanwhile
+
+    if await set_tenant_schema(db, tenant):
+        await _ensure_derived_table(db, tenant)
+    ids = [pid for pid, kind in events.items() if kind != EVENT_DELETED]
+    moved = [pid for pid, kind in events.items() if kind == EVENT_MOVED]
+    result = await db.execute(text(
+        "SELECT id, title, slug, path::text, content FROM pages WHERE id = ANY(:ids) "
+        "UNION "
+        "SELECT d.id, d.title, d.slug, d.path::text, d.content FROM pages d "
+        "JOIN pages m ON d.path <@ m.path WHERE m.id = ANY(:moved)"
+    ), {"ids": ids, "moved": moved})
+    rows = result.fetchall()
+
+    found = {row[0] for row in rows}
+    gone = [pid for pid in events if pid not in found]
+    if gone:
+        await db.execute(text("DELETE FROM page_derived WHERE page_id = ANY(:ids)"), {"ids": gone})
+
+    backend = get_search_backend()
+    for page_id, title, slug, path, content in rows:
+        outline, links = extract_structure(content)
+        await db.execute(text(
+            "INSERT INTO page_derived (page_id, plain_text, outline, links, updated_at) "
+            "VALUES (:pid, :txt, CAST(:outline AS JSONB), CAST(:links AS JSONB), now()) "
+            "ON CONFLICT (page_id) DO UPDATE SET plain_text = EXCLUDED.plain_text, "
+            "outline = EXCLUDED.outline, links = EXCLUDED.links, updated_at = now()"
+        ), {
+            "pid": page_id,
+            "txt": html_to_text(content),
+            "outline": json.dumps(outline, ensure_ascii=False),
+            "links": json.dumps(links, ensure_ascii=False),
+        })
+        await cas.sync_page_refs(db, tenant, page_id, cas.referenced_hashes(content))
+        if backend.needs_page_data:
+            await backend.index_page(tenant, page_id, title, slug, path, content)
+    for page_id in gone:
+        await cas.sync_page_refs(db, tenant, page_id, set())
+        await backend.remove_page(tenant, page_id)
+
+
+async def process_batch(limit: int = BATCH_SIZE) -> int:
+    """Claim and process up to ``limit`` events. Returns the number claimed."""
+    async with async_session_maker() as db:
+        result = await db.execute(text(
+            "DELETE FROM public.page_events WHERE id IN ("
+            "  SELECT id FROM public.page_events ORDER BY id LIMIT :n FOR UPDATE SKIP LOCKED"
+            ") RETURNING tenant, page_id, kind, attempts"
+        ), {"n": limit})
+        rows = result.fetchall()
+        if not rows:
+            await db.rollback()
+            return 0
+        attempts: dict[tuple[str, int], int] = {}
+        for tenant, page_id, _, count in rows:
+            attempts[(tenant, page_id)] = max(count, attempts.get((tenant, page_id), 0))
+        for tenant, events in _coalesce(rows).items():
+            try:
+                async with db.begin_nested():
+                    await _process_tenant(db, tenant, events)
+            except Exception as exc:
+                # Requeue at the back so one broken room doesn't stall the rest.
+                logger.exception("Indexing failed for %s, requeueing %d pages", tenant, len(events))
+                _derived_ready.discard(tenant)
+                await _requeue(db, tenant, events, attempts, repr(exc))
+        await db.commit()
+    return len(rows)
+
+
+async def run_worker(stop: asyncio.Event | None = None):
+    """Drain the queue until ``stop`` is set, polling when it runs dry."""
+    stop = stop or asyncio.Event()
+    logger.info("Indexing worker started")
+    while not stop.is_set():
+        try:
+            claimed = await process_batch()
+        except Exception:
+            logger.exception("Indexing batch failed, retrying")
+            claimed = 0
+        if claimed < BATCH_SIZE:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    logger.info("Indexing worker stopped")
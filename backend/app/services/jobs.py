@@ -0,0 +1,329 @@
+"""Durable background jobs for operations too slow for a request.
+
+A job is a row in ``public.jobs``. The endpoint that starts one inserts it
+(usually in the same transaction as whatever makes the job necessary) and
+answers 202 with the job; workers claim pending jobs with ``FOR UPDATE SKIP
+LOCKED`` and run the handler registered for the job's ``kind``.
+
+Handlers work in small committed steps and call :meth:`JobContext.checkpoint`
+after each one. That saves progress and a heartbeat, and is where a
+cancelled job or a shutting-down worker stops. A job whose worker died is
+reclaimed once its heartbeat goes stale and starts its handler again, so
+handlers must be safe to re-run from the top.
+
+At most one job per ``(kind, target)`` is queued or running at a time;
+:func:`enqueue` raises :class:`JobInProgress` otherwise.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session_maker
+
+logger = logging.getLogger("wiki.jobs")
+
+POLL_INTERVAL = 2.0
+MAX_ATTEMPTS = 3
+# A running job whose heartbeat is older than this belongs to a dead worker.
+HEARTBEAT_TIMEOUT_MINUTES = 10
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+# When a job of a kind may be cancelled.
+CANCEL_NEVER = "never"
+CANCEL_PENDING = "pending"
+CANCEL_ANYTIME = "anytime"
+
+_JOB_COLUMNS = (
+    "id, kind, tenant, target, params, status, progress, result, error, attempts, "
+    "created_by, created_at, started_at, heartbeat_at, finished_at"
+)
+
+
+class JobInProgress(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class _Stopped(Exception):
+    """The worker is shutting down; the job is handed back to the queue."""
+
+
+@dataclass
+class _Handler:
+    run: Callable[["JobContext"], Awaitable[dict | None]]
+    cancel: str
+
+
+_handlers: dict[str, _Handler] = {}
+
+
+def handler(kind: str, cancel: str = CANCEL_ANYTIME):
+    """Register the coroutine that runs jobs of ``kind``; it may return a result dict."""
+    def register(fn):
+        _handlers[kind] = _Handler(fn, cancel)
+        return fn
+    return register
+
+
+class JobContext:
+    def __init__(self, job: dict, stop: asyncio.Event):
+        self.job = job
+        self.params = job["params"]
+        self.progress = job["progress"]
+        self._stop = stop
+
+    async def checkpoint(self, db: AsyncSession, **progress):
+        """Merge ``progress``, commit it with the handler's work, and stop if asked to.
+
+        Raises :class:`JobCancelled` when the job was cancelled meanwhile (the
+        step just committed stays), or ``_Stopped`` when the worker shuts down.
+        """
+        self.progress.update(progress)
+        result = await db.execute(text(
+            "UPDATE public.jobs SET progress = CAST(:progress AS JSONB), heartbeat_at = now() "
+            "WHERE id = :id AND status = :running RETURNING id"
+        ), {"progress": json.dumps(self.progress), "id": self.job["id"], "running": STATUS_RUNNING})
+        alive = result.first() is not None
+        await db.commit()
+        if not alive:
+            raise JobCancelled()
+        if self._stop.is_set():
+            raise _Stopped()
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.jobs ("
+        "  id SERIAL PRIMARY KEY, "
+        "  kind VARCHAR(40) NOT NULL, "
+        "  tenant VARCHAR, "
+        "  target VARCHAR NOT NULL, "
+        "  params JSONB NOT NULL DEFAULT '{}', "
+        "  status VARCHAR(20) NOT NULL DEFAULT 'pending', "
+        "  progress JSONB NOT NULL DEFAULT '{}', "
+        "  result JSONB, "
+        "  error VARCHAR, "
+        "  attempts INTEGER NOT NULL DEFAULT 0, "
+        "  created_by INTEGER, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  started_at TIMESTAMPTZ, "
+        "  heartbeat_at TIMESTAMPTZ, "
+        "  finished_at TIMESTAMPTZ"
+        ")"
+    ))
+    await db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_jobs_status ON public.jobs (status, id)"
+    ))
+    # One active job per target, e.g. one deletion per room or one move per page.
+    await db.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_active_target ON public.jobs (kind, target) "
+        "WHERE status IN ('pending', 'running')"
+    ))
+    await db.commit()
+
+
+def _job_out(row) -> dict:
+    job = dict(row._mapping)
+    for name in ("params", "progress", "result"):
+        if isinstance(job[name], str):
+            job[name] = json.loads(job[name])
+    return job
+
+
+async def enqueue(db: AsyncSession, kind: str, target: str, params: dict | None = None,
+                  tenant: str | None = None, user_id: int | None = None) -> dict:
+    """Queue a job in the caller's transaction; the caller commits.
+
+    Raises JobInProgress if a job of this kind is already active for ``target``.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    result = await db.execute(text(
+        "INSERT INTO public.jobs (kind, tenant, target, params, created_by) "
+        "VALUES (:kind, :tenant, :target, CAST(:params AS JSONB), :uid) "
+        "ON CONFLICT (kind, target) WHERE status IN ('pending', 'running') DO NOTHING "
+        f"RETURNING {_JOB_COLUMNS}"
+    ), {"kind": kind, "tenant": tenant, "target": target, "params": json.dumps(params or {}), "uid": user_id})
+    row = result.first()
+    if row is None:
+        raise JobInProgress()
+    return _job_out(row)
+
+
+async def active_job(db: AsyncSession, kind: str, target: str) -> dict | None:
+    result = await db.execute(text(
+        f"SELECT {_JOB_COLUMNS} FROM public.jobs "
+        "WHERE kind = :kind AND target = :target AND status IN (:pending, :running)"
+    ), {"kind": kind, "target": target, "pending": STATUS_PENDING, "running": STATUS_RUNNING})
+    row = result.first()
+    return _job_out(row) if row else None
+
+
+async def list_jobs(db: AsyncSession, user_id: int | None = None, tenant: str | None = None,
+                    status: str | None = None, limit: int = 50) -> list[dict]:
+    """Newest jobs first; each filter applies only when given."""
+    result = await db.execute(text(
+        f"SELECT {_JOB_COLUMNS} FROM public.jobs "
+        "WHERE (CAST(:uid AS INTEGER) IS NULL OR created_by = :uid) "
+        "AND (CAST(:tenant AS VARCHAR) IS NULL OR tenant = :tenant) "
+        "AND (CAST(:status AS VARCHAR) IS NULL OR status = :status) "
+        "ORDER BY id DESC LIMIT :n"
+    ), {"uid": user_id, "tenant": tenant, "status": status, "n": limit})
+    return [_job_out(row) for row in result]
+
+
+async def get_job(db: AsyncSession, job_id: int) -> dict | None:
+    result = await db.execute(text(
+        f"SELECT {_JOB_COLUMNS} FROM public.jobs WHERE id = :id"
+    ), {"id": job_id})
+    row = result.first()
+    return _job_out(row) if row else None
+
+
+async def cancel_job(db: AsyncSession, job_id: int) -> bool:
+    """Cancel a job if its kind allows it in its current state.
+
+    A running job stops at its next checkpoint, keeping the steps it already
+    committed.
+    """
+    pending_ok = [k for k, h in _handlers.items() if h.cancel in (CANCEL_PENDING, CANCEL_ANYTIME)]
+    running_ok = [k for k, h in _handlers.items() if h.cancel == CANCEL_ANYTIME]
+    result = await db.execute(text(
+        "UPDATE public.jobs SET status = :cancelled, finished_at = now() "
+        "WHERE id = :id AND ((status = :pending AND kind = ANY(:pending_ok)) "
+        "                 OR (status = :running AND kind = ANY(:running_ok))) RETURNING id"
+    ), {"cancelled": STATUS_CANCELLED, "id": job_id, "pending": STATUS_PENDING, "running": STATUS_RUNNING,
+        "pending_ok": pending_ok, "running_ok": running_ok})
+    cancelled = result.first() is not None
+    await db.commit()
+    return cancelled
+
+
+async def retry_job(db: AsyncSession, job_id: int) -> dict | None:
+    """Queue a failed job again with fresh attempts; None if it has not failed.
+
+    The handler starts from the top with the progress it saved, so a move
+    picks up where it stopped. Raises JobInProgress if another job for the
+    same target became active meanwhile.
+    """
+    try:
+        result = await db.execute(text(
+            "UPDATE public.jobs SET status = :pending, attempts = 0, error = NULL, finished_at = NULL "
+            f"WHERE id = :id AND status = :failed RETURNING {_JOB_COLUMNS}"
+        ), {"pending": STATUS_PENDING, "id": job_id, "failed": STATUS_FAILED})
+    except IntegrityError:
+        await db.rollback()
+        raise JobInProgress()
+    row = result.first()
+    await db.commit()
+    return _job_out(row) if row else None
+
+
+# --- worker ---
+
+async def _claim() -> dict | None:
+    async with async_session_maker() as db:
+        result = await db.execute(text(
+            "UPDATE public.jobs SET status = :running, attempts = attempts + 1, heartbeat_at = now(), "
+            "started_at = COALESCE(started_at, now()) "
+            "WHERE id = ("
+            "  SELECT id FROM public.jobs "
+            "  WHERE status = :pending "
+            "     OR (status = :running AND heartbeat_at < now() - make_interval(mins => :timeout)) "
+            "  ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED"
+            f") RETURNING {_JOB_COLUMNS}"
+        ), {"running": STATUS_RUNNING, "pending": STATUS_PENDING, "timeout": HEARTBEAT_TIMEOUT_MINUTES})
+        row = result.first()
+        await db.commit()
+    return _job_out(row) if row else None
+
+
+async def _finish(job_id: int, status: str, result: dict | None = None, error: str | None = None):
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.jobs SET status = :status, result = CAST(:result AS JSONB), error = :error, "
+            "finished_at = now() WHERE id = :id AND status = :running"
+        ), {"status": status, "result": json.dumps(result) if result is not None else None,
+            "error": error, "id": job_id, "running": STATUS_RUNNING})
+        await db.commit()
+
+
+async def _retry_or_fail(job: dict, error: str):
+    """Requeue a failed attempt, or fail the job after MAX_ATTEMPTS."""
+    status = STATUS_FAILED if job["attempts"] >= MAX_ATTEMPTS else STATUS_PENDING
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.jobs SET status = :status, error = :error, "
+            "finished_at = CASE WHEN CAST(:final AS BOOLEAN) THEN now() END "
+            "WHERE id = :id AND status = :running"
+        ), {"status": status, "error": error[:500], "final": status == STATUS_FAILED,
+            "id": job["id"], "running": STATUS_RUNNING})
+        await db.commit()
+
+
+async def _requeue(job_id: int):
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.jobs SET status = :pending, attempts = GREATEST(attempts - 1, 0) "
+            "WHERE id = :id AND status = :running"
+        ), {"pending": STATUS_PENDING, "id": job_id, "running": STATUS_RUNNING})
+        await db.commit()
+
+
+async def execute_job(job: dict, stop: asyncio.Event | None = None):
+    """Run a claimed job to completion, failure, cancellation or shutdown."""
+    stop = stop or asyncio.Event()
+    spec = _handlers.get(job["kind"])
+    if spec is None:
+        await _finish(job["id"], STATUS_FAILED, error=f"unknown job kind {job['kind']!r}")
+        return
+    logger.info("Job %s (%s %s) started, attempt %d", job["id"], job["kind"], job["target"], job["attempts"])
+    try:
+        result = await spec.run(JobContext(job, stop))
+    except JobCancelled:
+        logger.info("Job %s cancelled", job["id"])
+        return
+    except _Stopped:
+        await _requeue(job["id"])
+        return
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"])
+        await _retry_or_fail(job, repr(e))
+        return
+    await _finish(job["id"], STATUS_COMPLETED, result)
+    logger.info("Job %s finished", job["id"])
+
+
+async def run_worker(stop: asyncio.Event | None = None):
+    """Run queued (or abandoned) jobs one at a time until ``stop`` is set."""
+    from app.services import room_jobs  # noqa: F401  registers the handlers
+    stop = stop or asyncio.Event()
+    logger.info("Job worker started")
+    while not stop.is_set():
+        job = None
+        try:
+            job = await _claim()
+        except Exception:
+            logger.exception("Claiming a job failed")
+        if job:
+            await execute_job(job, stop)
+            continue
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("Job worker stopped")
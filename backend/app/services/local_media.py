@@ -0,0 +1,49 @@
+"""Uploads stored on local disk under ``/media`` (room and default logos).
+
+Files are named after their content (``<stem>-<sha256[:16]><ext>``), so a new
+upload gets a new URL and the old one can be cached forever.
+"""
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import anyio
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def save_upload(file: UploadFile, directory: Path, stem: str, ext: str, max_bytes: int) -> Path:
+    """Stream ``file`` into ``directory`` without blocking the event loop.
+
+    Raises 413 once more than ``max_bytes`` have been read; nothing is left
+    behind on disk in that case.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes // 1024} KB")
+
+    await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / f".upload-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes // 1024} KB")
+                digest.update(chunk)
+                await out.write(chunk)
+        target = directory / f"{stem}-{digest.hexdigest()[:16]}{ext}"
+        await anyio.to_thread.run_sync(os.replace, tmp_path, target)
+    except BaseException:
+        await anyio.Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return target
+
+
+async def remove_files(directory: Path, names: list[str]):
+    """Delete files by name, ignoring ones that are already gone."""
+    for name in names:
+        await anyio.Path(directory / name).unlink(missing_ok=True)
@@ -0,0 +1,239 @@
+"""Local-disk storage backend (``STORAGE_BACKEND=local``).
+
+Objects live under ``<root>/objects/<key>``, with a small JSON sidecar under
+``<root>/meta/<key>.json`` for what S3 would keep as object metadata
+(content type, Cache-Control, SHA-256). Writes go to a temporary file and
+are renamed into place, so readers never see partial objects.
+
+Presigned URLs point at ``/api/v1/media/files/<key>`` and carry an HMAC of
+method, key, expiry and any signed parameters, keyed by ``SECRET_KEY``.
+Like SigV4 URLs, GET URLs are signed for a rounded-down time so they stay
+stable (and cacheable) within a window.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+import anyio
+
+from app.core.config import settings
+from app.services import sigv4
+from app.services.storage import StorageBackend
+
+URL_PREFIX = "/api/v1/media/files/"
+# A single S3 PUT is capped at 5 GiB; keep the same limit.
+MAX_PUT_BYTES = 5 * 1024 ** 3
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+class TooLarge(ValueError):
+    pass
+
+
+def _sign(method: str, key: str, expires_at: int, params: dict[str, str]) -> str:
+    payload = "\n".join([method, key, str(expires_at)] + [f"{k}={params[k]}" for k in sorted(params)])
+    return hmac.new(settings.SECRET_KEY.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.meta = root / "meta"
+
+    # --- paths ---
+
+    def path(self, object_key: str) -> Path:
+        """Filesystem path of an object; rejects keys that would escape the root."""
+        parts = object_key.split("/")
+        if not object_key or object_key.startswith("/") or "\\" in object_key \
+                or any(p in ("", ".", "..") for p in parts):
+            raise InvalidKey(object_key)
+        return self.objects.joinpath(*parts)
+
+    def _meta_path(self, object_key: str) -> Path:
+        self.path(object_key)  # validate
+        *dirs, name = object_key.split("/")
+        return self.meta.joinpath(*dirs, f"{name}.json")
+
+    def read_meta(self, object_key: str) -> dict:
+        try:
+            return json.loads(self._meta_path(object_key).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _commit(self, tmp: Path, object_key: str, meta: dict):
+        target = self.path(object_key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        meta_path = self._meta_path(object_key)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        meta_tmp = meta_path.with_name(f".{meta_path.name}.{uuid.uuid4().hex}")
+        meta_tmp.write_text(json.dumps(meta))
+        os.replace(meta_tmp, meta_path)
+        os.replace(tmp, target)
+
+    def _tmp_path(self) -> Path:
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / uuid.uuid4().hex
+
+    # --- StorageBackend ---
+
+    def ensure_ready(self):
+        for d in (self.objects, self.meta, self.root / "tmp"):
+            d.mkdir(parents=True, exist_ok=True)
+
+    def put(self, object_key, body, content_type, cache_control=None):
+        tmp = self._tmp_path()
+        tmp.write_bytes(body)
+        self._commit(tmp, object_key, {
+            "content_type": content_type,
+            "cache_control": cache_control,
+            "sha256": hashlib.sha256(body).hexdigest(),
+        })
+
+    def get(self, object_key, max_bytes):
+        path = self.path(object_key)
+        try:
+            if path.stat().st_size > max_bytes:
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def stat(self, object_key):
+        try:
+            st = self.path(object_key).stat()
+        except FileNotFoundError:
+            return None
+        meta = self.read_meta(object_key)
+        checksum = meta.get("sha256")
+        return {
+            "size": st.st_size,
+            "content_type": meta.get("content_type"),
+            "checksum_sha256": base64.b64encode(bytes.fromhex(checksum)).decode() if checksum else None,
+        }
+
+    def delete(self, object_key):
+        self.path(object_key).unlink(missing_ok=True)
+        self._meta_path(object_key).unlink(missing_ok=True)
+
+    def list_objects(self, prefix, start_after=None, limit=1000):
+        items = []
+        for key, path in self._walk(self.objects, "", prefix, start_after or ""):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            items.append({"key": key, "size": st.st_size,
+                          "last_modified": datetime.fromtimestamp(st.st_mtime, timezone.utc)})
+            if len(items) >= limit:
+                break
+        return items
+
+    def _walk(self, directory: Path, base: str, prefix: str, start_after: str):
+        """Yield ``(key, path)`` in S3 key order, skipping subtrees that are all <= ``start_after``.
+
+        Sorting a directory's entries with ``/`` appended to subdirectory
+        names gives the same order as comparing the full keys.
+        """
+        try:
+            entries = [(e.name + "/" if e.is_dir() else e.name, e) for e in os.scandir(directory)]
+        except FileNotFoundError:
+            return
+        for name, entry in sorted(entries, key=lambda item: item[0]):
+            key = base + name
+            if not (key.startswith(prefix) or prefix.startswith(key)):
+                continue
+            if entry.is_dir():
+                if key < start_after and not start_after.startswith(key):
+                    continue
+                yield from self._walk(Path(entry.path), key, prefix, start_after)
+            elif key > start_after and key.startswith(prefix):
+                yield key, Path(entry.path)
+
+    def delete_many(self, object_keys):
+        for key in object_keys:
+            self.delete(key)
+        return []
+
+    def presign_put(self, object_key, expires=3600, headers=None):
+        params = {}
+        for name, value in (headers or {}).items():
+            if name.lower() == "x-amz-checksum-sha256":
+                params["sha256"] = base64.b64decode(value).hex()
+        return self._url("PUT", object_key, int(time.time()) + expires, params)
+
+    def presign_get(self, object_key, expires=3600, cache_control=None, window=sigv4.SIGN_WINDOW):
+        now = int(time.time())
+        signed_at = now - now % window
+        if signed_at + expires - now < sigv4.MIN_REMAINING_VALIDITY:
+            signed_at = now
+        params = {"cc": cache_control} if cache_control else {}
+        return self._url("GET", object_key, signed_at + expires, params)
+
+    def _url(self, method: str, object_key: str, expires_at: int, params: dict[str, str]) -> str:
+        self.path(object_key)  # validate
+        query = {**params, "method": method, "expires": str(expires_at),
+                 "signature": _sign(method, object_key, expires_at, params)}
+        return f"{settings.PUBLIC_BASE_URL}{URL_PREFIX}{quote(object_key)}?{urlencode(query)}"
+
+    # --- serving presigned requests ---
+
+    def verify(self, method: str, object_key: str, query: dict[str, str]) -> dict[str, str] | None:
+        """Signed parameters of a valid, unexpired URL for ``method``; None otherwise."""
+        try:
+            expires_at = int(query.get("expires", ""))
+        except ValueError:
+            return None
+        if query.get("method") != method or expires_at < time.time():
+            return None
+        params = {k: v for k, v in query.items() if k not in ("method", "expires", "signature")}
+        expected = _sign(method, object_key, expires_at, params)
+        if not hmac.compare_digest(expected, query.get("signature", "")):
+            return None
+        return params
+
+    async def write_stream(self, object_key: str, chunks, content_type: str | None,
+                           expected_sha256: str | None = None, max_bytes: int = MAX_PUT_BYTES):
+        """Store an async stream of chunks, checking size and (if given) the SHA-256."""
+        tmp = await anyio.to_thread.run_sync(self._tmp_path)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            async with await anyio.open_file(tmp, "wb") as out:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise TooLarge(object_key)
+                    digest.update(chunk)
+                    await out.write(chunk)
+            if expected_sha256 and digest.hexdigest() != expected_sha256:
+                raise ChecksumMismatch(object_key)
+            await anyio.to_thread.run_sync(self._commit, tmp, object_key, {
+                "content_type": content_type,
+                "cache_control": None,
+                "sha256": digest.hexdigest(),
+            })
+        except BaseException:
+            await anyio.Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def create_backend() -> LocalStorageBackend:
+    root = settings.STORAGE_LOCAL_DIR or str(Path(__file__).resolve().parents[2] / "storage")
+    return LocalStorageBackend(Path(root))
@@ -0,0 +1,439 @@
+"""Deletion of media objects that no page links to any more.
+
+Objects under ``uploads/`` and ``cas/`` are never removed when an image
+disappears from a page or a room is dropped. A collection run fixes that in
+two phases:
+
+1. **scan** — read ``content`` of ``pages`` and ``page_versions`` in every
+   tenant schema in id-ordered batches and record the referenced roots in
+   ``public.media_gc_refs``. A root is ``uploads/<uuid>`` or
+   ``cas/<aa>/<sha256>``, so an object and all its image variants live or die
+   together.
+2. **sweep** — list the bucket page by page and delete objects whose root was
+   not seen and that are older than the grace period, in batches.
+
+Cursor and counters are saved in ``public.media_gc_runs`` after every batch,
+so a run that dies with its worker is picked up where it stopped once its
+heartbeat goes stale. Content saved after the scan passed a table is
+re-read before each delete batch, and the grace period (which should exceed
+the duration of a run) covers uploads whose page has not been saved yet.
+"""
+import asyncio
+import json
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.db.tenancy import _TENANT_RE, use_all_rooms
+from app.services import cas, storage
+
+logger = logging.getLogger("wiki.media_gc")
+
+POLL_INTERVAL = 30.0
+SCAN_BATCH = 200
+LIST_BATCH = 1000
+# A running run whose heartbeat is older than this belongs to a dead worker.
+HEARTBEAT_TIMEOUT_MINUTES = 10
+SWEEP_PREFIXES = ("uploads/", cas.KEY_PREFIX)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+PHASE_SCAN = "scan"
+PHASE_SWEEP = "sweep"
+PHASE_DONE = "done"
+
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+# Pages hold presigned URLs, whose path contains the object key.
+_ROOT_IN_CONTENT_RE = re.compile(rf"(uploads/{_UUID}|cas/[0-9a-f]{{2}}/[0-9a-f]{{64}})")
+_ROOT_OF_KEY_RE = re.compile(rf"^(uploads/{_UUID})/|^(cas/[0-9a-f]{{2}}/[0-9a-f]{{64}})(?:$|\.)")
+
+_RUN_COLUMNS = (
+    "id, status, phase, dry_run, grace_hours, cursor, stats, error, created_by, "
+    "created_at, started_at, heartbeat_at, finished_at"
+)
+
+
+class RunInProgress(Exception):
+    pass
+
+
+class _Stopped(Exception):
+    """The worker is shutting down; the run is handed back to the queue."""
+
+
+def referenced_roots(html: str | None) -> set[str]:
+    return set(_ROOT_IN_CONTENT_RE.findall(html or ""))
+
+
+def root_of(object_key: str) -> str | None:
+    """Root an object belongs to, or None for keys the collector must not touch."""
+    match = _ROOT_OF_KEY_RE.match(object_key)
+    return (match.group(1) or match.group(2)) if match else None
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.media_gc_runs ("
+        "  id SERIAL PRIMARY KEY, "
+        "  status VARCHAR(20) NOT NULL DEFAULT 'pending', "
+        "  phase VARCHAR(20) NOT NULL DEFAULT 'scan', "
+        "  dry_run BOOLEAN NOT NULL DEFAULT false, "
+        "  grace_hours INTEGER NOT NULL, "
+        "  cursor JSONB NOT NULL DEFAULT '{}', "
+        "  stats JSONB NOT NULL DEFAULT '{}', "
+        "  error VARCHAR, "
+        "  created_by INTEGER, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  started_at TIMESTAMPTZ, "
+        "  heartbeat_at TIMESTAMPTZ, "
+        "  finished_at TIMESTAMPTZ"
+        ")"
+    ))
+    # At most one run is queued or in progress.
+    await db.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_media_gc_runs_active ON public.media_gc_runs ((true)) "
+        "WHERE status IN ('pending', 'running')"
+    ))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.media_gc_refs ("
+        "  run_id INTEGER NOT NULL REFERENCES public.media_gc_runs(id) ON DELETE CASCADE, "
+        "  root VARCHAR NOT NULL, "
+        "  PRIMARY KEY (run_id, root)"
+        ")"
+    ))
+    await db.commit()
+
+
+def _run_out(row) -> dict:
+    run = dict(row._mapping)
+    for name in ("cursor", "stats"):
+        if isinstance(run[name], str):
+            run[name] = json.loads(run[name])
+    return run
+
+
+async def start_run(db: AsyncSession, user_id: int | None, grace_hours: int, dry_run: bool = False) -> dict:
+    """Queue a run; raises RunInProgress if one is already queued or running."""
+    try:
+        result = await db.execute(text(
+            "INSERT INTO public.media_gc_runs (grace_hours, dry_run, created_by) "
+            f"VALUES (:grace, :dry_run, :uid) RETURNING {_RUN_COLUMNS}"
+        ), {"grace": grace_hours, "dry_run": dry_run, "uid": user_id})
+        run = _run_out(result.one())
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise RunInProgress()
+    return run
+
+
+async def list_runs(db: AsyncSession, limit: int = 20) -> list[dict]:
+    result = await db.execute(text(
+        f"SELECT {_RUN_COLUMNS} FROM public.media_gc_runs ORDER BY id DESC LIMIT :n"
+    ), {"n": limit})
+    return [_run_out(row) for row in result]
+
+
+async def get_run(db: AsyncSession, run_id: int) -> dict | None:
+    result = await db.execute(text(
+        f"SELECT {_RUN_COLUMNS} FROM public.media_gc_runs WHERE id = :id"
+    ), {"id": run_id})
+    row = result.first()
+    return _run_out(row) if row else None
+
+
+async def cancel_run(db: AsyncSession, run_id: int) -> bool:
+    """Stop a queued or running run; the worker notices at its next batch."""
+    result = await db.execute(text(
+        "UPDATE public.media_gc_runs SET status = :cancelled, finished_at = now() "
+        "WHERE id = :id AND status IN (:pending, :running) RETURNING id"
+    ), {"cancelled": STATUS_CANCELLED, "id": run_id, "pending": STATUS_PENDING, "running": STATUS_RUNNING})
+    cancelled = result.first() is not None
+    await db.execute(text("DELETE FROM public.media_gc_refs WHERE run_id = :id"), {"id": run_id})
+    await db.commit()
+    return cancelled
+
+
+# --- worker ---
+
+async def _schedule_if_due():
+    """Queue a run when the last one is older than MEDIA_GC_INTERVAL_HOURS (0 disables)."""
+    if settings.MEDIA_GC_INTERVAL_HOURS <= 0:
+        return
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "INSERT INTO public.media_gc_runs (grace_hours) "
+            "SELECT :grace WHERE NOT EXISTS ("
+            "  SELECT 1 FROM public.media_gc_runs "
+            "  WHERE created_at > now() - make_interval(hours => :interval)"
+            ") ON CONFLICT DO NOTHING"
+        ), {"grace": settings.MEDIA_GC_GRACE_HOURS, "interval": settings.MEDIA_GC_INTERVAL_HOURS})
+        await db.commit()
+
+
+async def _claim() -> dict | None:
+    async with async_session_maker() as db:
+        result = await db.execute(text(
+            "UPDATE public.media_gc_runs SET status = :running, heartbeat_at = now(), "
+            "started_at = COALESCE(started_at, now()) "
+            "WHERE id = ("
+            "  SELECT id FROM public.media_gc_runs "
+            "  WHERE status = :pending "
+            "     OR (status = :running AND heartbeat_at < now() - make_interval(mins => :timeout)) "
+            "  ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED"
+            f") RETURNING {_RUN_COLUMNS}"
+        ), {"running": STATUS_RUNNING, "pending": STATUS_PENDING, "timeout": HEARTBEAT_TIMEOUT_MINUTES})
+        row = result.first()
+        await db.commit()
+    return _run_out(row) if row else None
+
+
+async def _save(db: AsyncSession, run: dict, phase: str | None = None) -> bool:
+    """Persist cursor and counters and commit; False if the run was cancelled meanwhile."""
+    if phase:
+        run["phase"] = phase
+    result = await db.execute(text(
+        "UPDATE public.media_gc_runs SET phase = :phase, cursor = CAST(:cursor AS JSONB), "
+        "stats = CAST(:stats AS JSONB), heartbeat_at = now() "
+        "WHERE id = :id AND status = :running RETURNING id"
+    ), {"phase": run["phase"], "cursor": json.dumps(run["cursor"]), "stats": json.dumps(run["stats"]),
+        "id": run["id"], "running": STATUS_RUNNING})
+    alive = result.first() is not None
+    await db.commit()
+    return alive
+
+
+async def _content_tables(db: AsyncSession) -> list[list[str]]:
+    """``[schema, table]`` for every pages/page_versions table, in a stable order."""
+    result = await db.execute(text(
+        "SELECT table_schema, table_name FROM information_schema.tables "
+        "WHERE table_name IN ('pages', 'page_versions') AND table_type = 'BASE TABLE' "
+        "ORDER BY table_schema, table_name"
+    ))
+    return [[schema, table] for schema, table in result if _TENANT_RE.match(schema)]
+
+
+async def _add_refs(db: AsyncSession, run_id: int, roots: set[str]) -> int:
+    if not roots:
+        return 0
+    result = await db.execute(text(
+        "INSERT INTO public.media_gc_refs (run_id, root) "
+        "SELECT :run, unnest(CAST(:roots AS VARCHAR[])) ON CONFLICT DO NOTHING"
+    ), {"run": run_id, "roots": list(roots)})
+    return result.rowcount
+
+
+async def _scan(run: dict, stop: asyncio.Event) -> bool:
+    cursor, stats = run["cursor"], run["stats"]
+    async with async_session_maker() as db:
+        if "tables" not in cursor:
+            cursor.update(tables=await _content_tables(db), index=0, after_id=0)
+            stats.update(tables_total=len(cursor["tables"]), tables_done=0, rows_scanned=0, referenced=0)
+            if not await _save(db, run):
+                return False
+
+    while cursor["index"] < len(cursor["tables"]):
+        if stop.is_set():
+            raise _Stopped()
+        schema, table = cursor["tables"][cursor["index"]]
+        async with async_session_maker() as db:
+            await use_all_rooms(db)
+            try:
+                result = await db.execute(text(
+                    f'SELECT id, content FROM "{schema}"."{table}" WHERE id > :after ORDER BY id LIMIT :n'
+                ), {"after": cursor["after_id"], "n": SCAN_BATCH})
+                rows = result.fetchall()
+            except Exception as e:
+                if "does not exist" not in str(e):
+                    raise
+                await db.rollback()
+                rows = []  # room dropped while the run was going
+            roots = set()
+            for _, content in rows:
+                roots |= referenced_roots(content)
+            stats["referenced"] += await _add_refs(db, run["id"], roots)
+            stats["rows_scanned"] += len(rows)
+            if len(rows) == SCAN_BATCH:
+                cursor["after_id"] = rows[-1][0]
+            else:
+                cursor["index"] += 1
+                cursor["after_id"] = 0
+                stats["tables_done"] += 1
+            if not await _save(db, run):
+                return False
+
+    async with async_session_maker() as db:
+        # Objects counted as in use by CAS bookkeeping are kept even if the scan missed them.
+        result = await db.execute(text(
+            "INSERT INTO public.media_gc_refs (run_id, root) "
+            "SELECT :run, 'cas/' || substr(sha256, 1, 2) || '/' || sha256 "
+            "FROM public.media_objects WHERE refcount > 0 ON CONFLICT DO NOTHING"
+        ), {"run": run["id"]})
+        stats["referenced"] += result.rowcount
+        run["cursor"] = {"prefix": 0, "start_after": None, "recheck_since": run["started_at"].isoformat()}
+        stats.update(objects_listed=0, kept_referenced=0, kept_recent=0,
+                     objects_deleted=0, bytes_deleted=0, delete_errors=0)
+        return await _save(db, run, PHASE_SWEEP)
+
+
+async def _recheck_recent(db: AsyncSession, run: dict):
+    """Add roots from content saved since the last check (or since the run started)."""
+    await use_all_rooms(db)
+    result = await db.execute(text("SELECT now()"))
+    now = result.scalar()
+    since = datetime.fromisoformat(run["cursor"]["recheck_since"])
+    roots = set()
+    for schema, table in await _content_tables(db):
+        column = "updated_at" if table == "pages" else "edited_at"
+        try:
+            rows = await db.execute(text(
+                f'SELECT content FROM "{schema}"."{table}" WHERE {column} >= :since'
+            ), {"since": since})
+        except Exception as e:
+            if "does not exist" not in str(e):
+                raise
+            await db.rollback()
+            continue
+        for (content,) in rows:
+            roots |= referenced_roots(content)
+    run["stats"]["referenced"] += await _add_refs(db, run["id"], roots)
+    # Overlap a little: a transaction that started before now() may commit after it.
+    run["cursor"]["recheck_since"] = (now - timedelta(minutes=1)).isoformat()
+
+
+async def _live_roots(db: AsyncSession, run_id: int, roots: set[str]) -> set[str]:
+    if not roots:
+        return set()
+    result = await db.execute(text(
+        "SELECT root FROM public.media_gc_refs WHERE run_id = :run AND root = ANY(:roots)"
+    ), {"run": run_id, "roots": list(roots)})
+    return {row[0] for row in result}
+
+
+async def _forget_deleted(db: AsyncSession, keys: list[str]):
+    """Drop bookkeeping rows for objects that no longer exist."""
+    await db.execute(text("DELETE FROM public.image_sources WHERE object_key = ANY(:keys)"), {"keys": keys})
+    hashes = [key.rsplit("/", 1)[1] for key in keys if key.startswith(cas.KEY_PREFIX) and root_of(key) == key]
+    if hashes:
+        await db.execute(text("DELETE FROM public.media_objects WHERE sha256 = ANY(:h)"), {"h": hashes})
+
+
+async def _sweep(run: dict, stop: asyncio.Event) -> bool:
+    cursor, stats = run["cursor"], run["stats"]
+    store = storage.get_storage()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=run["grace_hours"])
+    while cursor["prefix"] < len(SWEEP_PREFIXES):
+        if stop.is_set():
+            raise _Stopped()
+        prefix = SWEEP_PREFIXES[cursor["prefix"]]
+        objects = await asyncio.to_thread(store.list_objects, prefix, cursor["start_after"], LIST_BATCH)
+        async with async_session_maker() as db:
+            candidates = []
+            for o in objects:
+                if root_of(o["key"]) is None:
+                    stats["kept_referenced"] += 1
+                elif o["last_modified"] >= cutoff:
+                    stats["kept_recent"] += 1
+                else:
+                    candidates.append(o)
+            if candidates:
+                # Re-reading recent edits costs a pass over every tenant, so only
+                # when something is about to be deleted.
+                await _recheck_recent(db, run)
+            live = await _live_roots(db, run["id"], {root_of(o["key"]) for o in candidates})
+            doomed = [o for o in candidates if root_of(o["key"]) not in live]
+            stats["kept_referenced"] += len(candidates) - len(doomed)
+            stats["objects_listed"] += len(objects)
+
+            if doomed and not run["dry_run"]:
+                failed = set(await asyncio.to_thread(store.delete_many, [o["key"] for o in doomed]))
+                deleted = [o for o in doomed if o["key"] not in failed]
+                await _forget_deleted(db, [o["key"] for o in deleted])
+                stats["delete_errors"] += len(failed)
+            else:
+                deleted = doomed
+            stats["objects_deleted"] += len(deleted)
+            stats["bytes_deleted"] += sum(o["size"] for o in deleted)
+
+            if len(objects) == LIST_BATCH:
+                cursor["start_after"] = objects[-1]["key"]
+            else:
+                cursor["prefix"] += 1
+                cursor["start_after"] = None
+            if not await _save(db, run):
+                return False
+    return True
+
+
+async def _finish(run_id: int, status: str, error: str | None = None):
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.media_gc_runs SET status = :status, phase = :done, error = :error, "
+            "finished_at = now() WHERE id = :id AND status = :running"
+        ), {"status": status, "done": PHASE_DONE, "error": error, "id": run_id, "running": STATUS_RUNNING})
+        await db.execute(text("DELETE FROM public.media_gc_refs WHERE run_id = :id"), {"id": run_id})
+        await db.commit()
+
+
+async def _requeue(run_id: int):
+    async with async_session_maker() as db:
+        await db.execute(text(
+            "UPDATE public.media_gc_runs SET status = :pending WHERE id = :id AND status = :running"
+        ), {"pending": STATUS_PENDING, "id": run_id, "running": STATUS_RUNNING})
+        await db.commit()
+
+
+async def execute_run(run: dict, stop: asyncio.Event | None = None):
+    """Carry a claimed run through its remaining phases.
+
+    Returns early if the run is cancelled; if ``stop`` is set or storage is
+    unavailable, the run goes back to the queue and resumes from its saved
+    cursor.
+    """
+    stop = stop or asyncio.Event()
+    logger.info("Media GC run %s: %s phase%s", run["id"], run["phase"], " (dry run)" if run["dry_run"] else "")
+    try:
+        if run["phase"] == PHASE_SCAN and not await _scan(run, stop):
+            return
+        if run["phase"] == PHASE_SWEEP and not await _sweep(run, stop):
+            return
+    except (_Stopped, storage.StorageUnavailable):
+        await _requeue(run["id"])
+        return
+    except Exception as e:
+        logger.exception("Media GC run %s failed", run["id"])
+        await _finish(run["id"], STATUS_FAILED, repr(e)[:500])
+        return
+    await _finish(run["id"], STATUS_COMPLETED)
+    logger.info("Media GC run %s finished: %s", run["id"], run["stats"])
+
+
+async def run_worker(stop: asyncio.Event | None = None):
+    """Pick up queued (or abandoned) runs until ``stop`` is set."""
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        run = None
+        if storage.breaker.available:
+            try:
+                await _schedule_if_due()
+                run = await _claim()
+            except Exception:
+                logger.exception("Claiming a media GC run failed")
+        if run:
+            await execute_run(run, stop)
+            if storage.breaker.available:
+                continue
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
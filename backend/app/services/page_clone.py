@@ -0,0 +1,137 @@
+"""Copying a page and all its descendants in one statement.
+
+The subtree is copied with a single ``INSERT ... SELECT``. The same
+statement queues a page event for every copy. Versions are not copied.
+
+Slugs are unique per room, so copied pages whose slug is taken in the
+target room get one shared suffix (``-copy``, ``-copy-2``, ...): the first
+one that is free for the whole subtree. The root may get an explicit slug
+and title instead. Each copy's path is ``new_root`` followed by the new
+slugs of its ancestors below the root and its own (``-`` as ``_``), so
+labels match slugs as they do for pages created or moved by hand.
+
+The target may be another room. Each side is read through its own pages
+table: the room's schema, or the shared tables filtered by ``room_name``.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.tenancy import _TENANT_RE, SHARED_SCHEMA, shared_mode, tenant_tables_ddl, use_all_rooms
+from app.services import room_stats
+from app.services.indexing import EVENT_CHANGED
+
+MAX_SUFFIX = 100
+
+
+class CloneError(Exception):
+    """The copy cannot be made as asked; the message is shown to the user."""
+
+
+def _suffix(n: int) -> str:
+    return "-copy" if n == 1 else f"-copy-{n}"
+
+
+async def _pages_table(db: AsyncSession, room: str) -> tuple[str, bool]:
+    """The room's pages table, and whether it is shared (rows filtered by ``room_name``)."""
+    if room == "public":
+        return "public.pages", False
+    if not _TENANT_RE.match(room):
+        raise CloneError("Некорректное имя комнаты")
+    own = await db.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": f'"{room}".pages'})
+    if own.scalar():
+        return f'"{room}".pages', False
+    if shared_mode():
+        return f"{SHARED_SCHEMA}.pages", True
+    for ddl in tenant_tables_ddl(room):
+        await db.execute(text(ddl))
+    return f'"{room}".pages', False
+
+
+async def clone_subtree(db: AsyncSession, src_room: str, page: dict, dst_room: str, parent_path: str | None,
+                        slug: str | None, title: str | None, user_email: str) -> dict:
+    """Copy ``page`` (id, slug, title, path) and its descendants; the caller commits.
+
+    ``parent_path`` None keeps the source's parent within the same room and
+    means the top level in another room.
+    """
+    src, src_shared = await _pages_table(db, src_room)
+    dst, dst_shared = await _pages_table(db, dst_room)
+    # Rows of both rooms are read through qualified tables with explicit filters.
+    src_where = "s.room_name = :src" if src_shared else "TRUE"
+    dst_where = "d.room_name = :dst" if dst_shared else "TRUE"
+    if src_shared or dst_shared:
+        await use_all_rooms(db)
+    params = {"src": src_room, "dst": dst_room, "pid": page["id"], "old": page["path"]}
+
+    if parent_path is None:
+        parts = page["path"].split(".")
+        parent_path = ".".join(parts[:-1]) if src_room == dst_room else ""
+    parent_path = parent_path.replace("-", "_")
+    if parent_path:
+        found = await db.execute(text(
+            f"SELECT 1 FROM {dst} d WHERE {dst_where} AND d.path = CAST(:parent AS ltree)"
+        ), {**params, "parent": parent_path})
+        if not found.first():
+            raise CloneError("Родительская страница не найдена")
+
+    # Smallest suffix that is free for every copied slug.
+    suffix_n = await db.execute(text(
+        "SELECT n FROM generate_series(1, :max) n WHERE NOT EXISTS ("
+        f"  SELECT 1 FROM {src} s JOIN {dst} d ON d.slug = s.slug || "
+        "    CASE WHEN n = 1 THEN '-copy' ELSE '-copy-' || n END "
+        f"  WHERE {src_where} AND {dst_where} AND s.path <@ CAST(:old AS ltree)"
+        ") ORDER BY n LIMIT 1"
+    ), {**params, "max": MAX_SUFFIX})
+    n = suffix_n.scalar()
+    if n is None:
+        raise CloneError("Слишком много копий этого раздела")
+    params["suffix"] = _suffix(n)
+
+    async def slug_taken(value: str) -> bool:
+        taken = await db.execute(text(
+            f"SELECT 1 FROM {dst} d WHERE {dst_where} AND d.slug = :slug"
+        ), {**params, "slug": value})
+        return taken.first() is not None
+
+    if slug:
+        if await slug_taken(slug):
+            raise CloneError("Страница с таким URL (slug) уже существует")
+        root_slug = slug
+    else:
+        root_slug = page["slug"] + params["suffix"] if await slug_taken(page["slug"]) else page["slug"]
+    new_root = f"{parent_path}.{root_slug}" if parent_path else root_slug
+    params.update(root_slug=root_slug, root_title=title or page["title"], new_root=new_root.replace("-", "_"),
+                  user=user_email, kind=EVENT_CHANGED)
+    collision = await db.execute(text(
+        f"SELECT 1 FROM {dst} d WHERE {dst_where} AND d.path = CAST(:new_root AS ltree)"
+    ), params)
+    if collision.first():
+        raise CloneError("Страница с таким URL или путем уже существует")
+
+    room_column, room_value = ("room_name, ", ":dst, ") if dst_shared else ("", "")
+    result = await db.execute(text(
+        "WITH subtree AS ("
+        "  SELECT s.id, s.title, s.content, s.path, "
+        "    CASE WHEN s.id = :pid THEN :root_slug "
+        f"         WHEN EXISTS (SELECT 1 FROM {dst} d WHERE {dst_where} AND d.slug = s.slug) "
+        "         THEN s.slug || :suffix ELSE s.slug END AS new_slug "
+        f"  FROM {src} s WHERE {src_where} AND s.path <@ CAST(:old AS ltree)"
+        "), copied AS ("
+        f"  INSERT INTO {dst} ({room_column}title, slug, content, path, created_by, updated_by) "
+        f"  SELECT {room_value}CASE WHEN t.id = :pid THEN :root_title ELSE t.title END, t.new_slug, t.content, "
+        "    CAST(:new_root AS ltree) || CAST(COALESCE(("
+        "      SELECT string_agg(replace(a.new_slug, '-', '_'), '.' ORDER BY k) "
+        "      FROM generate_series(nlevel(CAST(:old AS ltree)) + 1, nlevel(t.path)) k "
+        "      JOIN subtree a ON a.path = subpath(t.path, 0, k)"
+        "    ), '') AS ltree), :user, :user "
+        "  FROM subtree t ORDER BY t.path "
+        "  RETURNING id, path, octet_length(content) AS bytes"
+        "), events AS ("
+        "  INSERT INTO public.page_events (tenant, page_id, kind) SELECT :dst, id, :kind FROM copied"
+        ") "
+        "SELECT (SELECT id FROM copied WHERE path = CAST(:new_root AS ltree)), count(*), "
+        "COALESCE(sum(bytes), 0) FROM copied"
+    ), params)
+    root_id, copied, size = result.one()
+    await room_stats.record_page_write(db, dst_room, pages=copied, bytes_delta=size)
+    return {"id": root_id, "slug": root_slug, "path": params["new_root"], "room": dst_room, "copied": copied}
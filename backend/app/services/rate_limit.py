@@ -0,0 +1,81 @@
+"""In-process token-bucket rate limiting.
+
+Each key (client IP, room, ...) gets a bucket of ``burst`` tokens refilled
+at ``rate`` tokens per second. Buckets live in a bounded LRU, so a flood of
+distinct keys cannot grow memory without bound; an evicted key simply starts
+again with a full bucket. Limits are per worker process.
+
+Behind a reverse proxy every request comes from the proxy's address, so
+:func:`client_ip` takes the client from ``X-Forwarded-For`` when, and only
+when, the peer is a trusted proxy.
+"""
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, key: str) -> float:
+        """Take a token for ``key``. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            self.rejected += 1
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def retry_after(wait: float) -> str:
+    """``Retry-After`` header value for a wait returned by :meth:`TokenBucketLimiter.acquire`."""
+    return str(max(1, math.ceil(wait)))
+
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+def parse_networks(spec: str) -> list[Network]:
+    """Networks from a comma-separated list of IPs and CIDRs."""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+def _is_trusted(address: str, trusted: list[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_ip(peer: str | None, forwarded_for: str | None, trusted: list[Network]) -> str:
+    """Address of the client behind any trusted proxies.
+
+    ``X-Forwarded-For`` is read right to left, each proxy appending the
+    address it received the request from; the first entry that is not a
+    trusted proxy is the client. Entries further left were written by the
+    client itself and are ignored, as is the whole header when the peer is
+    not trusted.
+    """
+    if not peer:
+        return "unknown"
+    if not forwarded_for or not _is_trusted(peer, trusted):
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted):
+            return hop
+    return hops[0] if hops else peer
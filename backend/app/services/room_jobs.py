@@ -0,0 +1,160 @@
+"""Room and page-tree operations that run as background jobs.
+
+``drop_room``: the request deletes the room's rows and renames its schema
+to ``_deleted_<hex>``, which takes only a catalog update, so the room and its
+pages disappear at once. The job then drops the tables one by one (with
+shared tables, deletes the room's rows in batches) and releases the room's
+media references. A room of the same name cannot be created until the job
+is done.
+
+``move_subtree``: the page itself gets its new path, and its new slug if it
+was renamed, only in the job's last step, so a job that fails or is cancelled
+leaves the two in agreement; descendants are re-pathed in batches of ``PAGE_MOVE_BATCH`` before
+that, each in its own short transaction. While the job runs, the descendants
+already moved are missing from the tree (their new parent path does not
+exist yet); pages stay reachable by id and slug throughout.
+"""
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.db.tenancy import SHARED_SCHEMA, set_tenant_schema, shared_mode
+from app.services import cas, jobs, suggest
+from app.services.indexing import enqueue_page_event, EVENT_MOVED
+from app.services.search_cache import search_cache
+
+KIND_DROP_ROOM = "drop_room"
+KIND_MOVE_SUBTREE = "move_subtree"
+
+TOMBSTONE_PREFIX = "_deleted_"
+# Shared tables and the column that picks a batch of a room's rows.
+SHARED_TABLES = {"page_derived": "page_id", "page_versions": "id", "pages": "id"}
+
+
+async def start_drop_room(db: AsyncSession, room_name: str, user_id: int | None) -> dict:
+    """Hide the room's schema and queue its removal; the caller commits.
+
+    The room's rows must already be deleted in the same transaction.
+    """
+    tombstone = None
+    exists = await db.execute(text("SELECT to_regnamespace(:n)"), {"n": f'"{room_name}"'})
+    if exists.scalar() is not None:
+        tombstone = f"{TOMBSTONE_PREFIX}{uuid.uuid4().hex[:16]}"
+        await db.execute(text(f'ALTER SCHEMA "{room_name}" RENAME TO "{tombstone}"'))
+    return await jobs.enqueue(db, KIND_DROP_ROOM, room_name, {"schema": tombstone},
+                              tenant=room_name, user_id=user_id)
+
+
+@jobs.handler(KIND_DROP_ROOM, cancel=jobs.CANCEL_NEVER)
+async def _drop_room(ctx: jobs.JobContext):
+    room_name, schema = ctx.job["target"], ctx.params["schema"]
+    shared_tables = SHARED_TABLES if shared_mode() else {}
+    async with async_session_maker() as db:
+        tables = []
+        if schema:
+            result = await db.execute(text(
+                "SELECT tablename FROM pg_tables WHERE schemaname = :s ORDER BY tablename"
+            ), {"s": schema})
+            tables = [row[0] for row in result]
+        total = len(tables) + len(shared_tables) + 2
+        done = 0
+        await ctx.checkpoint(db, done=done, total=total)
+        for table in tables:
+            await db.execute(text(f'DROP TABLE IF EXISTS "{schema}"."{table}" CASCADE'))
+            done += 1
+            await ctx.checkpoint(db, done=done)
+        if schema:
+            await db.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        done += 1
+        await ctx.checkpoint(db, done=done)
+
+        if shared_tables:
+            await set_tenant_schema(db, room_name)
+        rows = ctx.progress.get("rows_deleted", 0)
+        for table, key in shared_tables.items():
+            while True:
+                result = await db.execute(text(
+                    f"DELETE FROM {SHARED_SCHEMA}.{table} WHERE room_name = :room AND {key} IN ("
+                    f"  SELECT {key} FROM {SHARED_SCHEMA}.{table} WHERE room_name = :room LIMIT :n"
+                    ")"
+                ), {"room": room_name, "n": settings.PAGE_MOVE_BATCH})
+                rows += result.rowcount
+                await ctx.checkpoint(db, rows_deleted=rows)
+                if result.rowcount < settings.PAGE_MOVE_BATCH:
+                    break
+            done += 1
+            await ctx.checkpoint(db, done=done)
+
+        await cas.drop_tenant_refs(db, room_name)
+        await ctx.checkpoint(db, done=total)
+    search_cache.bump(room_name)
+    suggest.invalidate(room_name)
+    return {"tables_dropped": len(tables), "rows_deleted": rows}
+
+
+async def start_move_subtree(db: AsyncSession, tenant: str, page_id: int, old_path: str, new_path: str,
+                             new_slug: str, user_id: int | None) -> dict:
+    """Queue the move of a page and its descendants; the caller commits."""
+    return await jobs.enqueue(db, KIND_MOVE_SUBTREE, f"{tenant}:{page_id}",
+                              {"page_id": page_id, "old_path": old_path, "new_path": new_path, "slug": new_slug},
+                              tenant=tenant, user_id=user_id)
+
+
+async def _use_tenant(db: AsyncSession, tenant: str):
+    if tenant != "public":
+        await set_tenant_schema(db, tenant)
+    else:
+        await db.execute(text('SET search_path TO "public"'))
+
+
+@jobs.handler(KIND_MOVE_SUBTREE, cancel=jobs.CANCEL_PENDING)
+async def _move_subtree(ctx: jobs.JobContext):
+    tenant = ctx.job["tenant"]
+    page_id, old_path, new_path = ctx.params["page_id"], ctx.params["old_path"], ctx.params["new_path"]
+    # Jobs queued before the slug was carried in the params keep theirs.
+    paths = {"old": old_path, "new": new_path, "pid": page_id, "slug": ctx.params.get("slug")}
+    async with async_session_maker() as db:
+        await _use_tenant(db, tenant)
+        page = await db.execute(text("SELECT path::text FROM pages WHERE id = :pid"), paths)
+        current = page.scalar()
+        if current is None:
+            return {"moved": 0, "detail": "page was deleted"}
+        if current not in (old_path, new_path):
+            raise RuntimeError(f"page {page_id} was moved elsewhere meanwhile ({current})")
+        collision = await db.execute(text(
+            "SELECT path::text FROM pages WHERE (path = CAST(:new AS ltree) OR slug = :slug) AND id <> :pid"
+        ), paths)
+        if taken := collision.scalar():
+            raise RuntimeError(f"the new path or slug is taken by the page at {taken}")
+        remaining = await db.execute(text(
+            "SELECT count(*) FROM pages WHERE path <@ CAST(:old AS ltree) AND id <> :pid"
+        ), paths)
+        done = ctx.progress.get("done", 0)
+        await ctx.checkpoint(db, done=done, total=done + remaining.scalar())
+
+        # Runs until no descendant is left under the old path, which also
+        # picks up pages created there while the job was running.
+        while True:
+            result = await db.execute(text(
+                "UPDATE pages SET path = CAST(:new AS ltree) || subpath(path, nlevel(CAST(:old AS ltree))) "
+                "WHERE id IN ("
+                "  SELECT id FROM pages WHERE path <@ CAST(:old AS ltree) AND id <> :pid "
+                "  ORDER BY id LIMIT :n"
+                ")"
+            ), {**paths, "n": settings.PAGE_MOVE_BATCH})
+            done += result.rowcount
+            await ctx.checkpoint(db, done=done, total=max(done, ctx.progress.get("total", 0)))
+            if result.rowcount < settings.PAGE_MOVE_BATCH:
+                break
+
+        await db.execute(text(
+            "UPDATE pages SET path = CAST(:new AS ltree), slug = COALESCE(:slug, slug) WHERE id = :pid"
+        ), paths)
+        await enqueue_page_event(db, tenant, page_id, EVENT_MOVED)
+        await ctx.checkpoint(db, done=done)
+    search_cache.bump(tenant)
+    suggest.invalidate(tenant)
+    return {"moved": done + 1}
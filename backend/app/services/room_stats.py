@@ -0,0 +1,231 @@
+"""Per-room size and activity statistics, kept as running totals.
+
+``room_stats`` holds one row per room with its page count, total page
+content bytes and version count; ``room_activity`` holds edits and feedback
+per room and UTC day. Page writes add their deltas in their own transaction
+(:func:`record_page_write`) and feedback batches add theirs when they land
+(:func:`record_feedback`), so reading a room's stats never touches its
+pages.
+
+Totals can drift (rows changed by hand, a restore, a crash between a room's
+tables and its counters). :func:`reconcile` recounts every room, one room
+per transaction, and fixes the rows that differ. Daily activity is a log of
+writes and is not recounted; rows older than ``ACTIVITY_DAYS`` are pruned.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session_maker
+from app.db.tenancy import _TENANT_RE, SHARED_SCHEMA, shared_mode, use_all_rooms
+
+logger = logging.getLogger("wiki.stats")
+
+RECONCILE_INTERVAL = 3600
+ACTIVITY_DAYS = 90
+
+_UTC_TODAY = "CAST(now() AT TIME ZONE 'UTC' AS DATE)"
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.room_stats ("
+        "  room_name VARCHAR PRIMARY KEY, "
+        "  pages BIGINT NOT NULL DEFAULT 0, "
+        "  content_bytes BIGINT NOT NULL DEFAULT 0, "
+        "  versions BIGINT NOT NULL DEFAULT 0, "
+        "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  reconciled_at TIMESTAMPTZ"
+        ")"
+    ))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.room_activity ("
+        "  room_name VARCHAR NOT NULL, "
+        "  day DATE NOT NULL, "
+        "  edits INTEGER NOT NULL DEFAULT 0, "
+        "  feedback INTEGER NOT NULL DEFAULT 0, "
+        "  PRIMARY KEY (room_name, day)"
+        ")"
+    ))
+    await db.commit()
+
+
+def content_bytes(content: str | None) -> int:
+    """Size of page content as Postgres ``octet_length`` counts it (UTF-8)."""
+    return len(content.encode()) if content else 0
+
+
+async def record_page_write(db: AsyncSession, room: str, pages: int = 0, bytes_delta: int = 0,
+                            versions: int = 0):
+    """Add one page write's deltas to the room's totals and today's edits; the caller commits."""
+    await db.execute(text(
+        "WITH totals AS ("
+        "  INSERT INTO public.room_stats (room_name, pages, content_bytes, versions) "
+        "  VALUES (:room, :pages, :bytes, :versions) "
+        "  ON CONFLICT (room_name) DO UPDATE SET pages = room_stats.pages + EXCLUDED.pages, "
+        "  content_bytes = room_stats.content_bytes + EXCLUDED.content_bytes, "
+        "  versions = room_stats.versions + EXCLUDED.versions, updated_at = now()"
+        ") "
+        f"INSERT INTO public.room_activity (room_name, day, edits) VALUES (:room, {_UTC_TODAY}, 1) "
+        "ON CONFLICT (room_name, day) DO UPDATE SET edits = room_activity.edits + 1"
+    ), {"room": room, "pages": pages, "bytes": bytes_delta, "versions": versions})
+
+
+async def record_feedback(db: AsyncSession, per_day: Counter[tuple[str, date]]):
+    """Add feedback counts keyed by ``(room, UTC day)``; the caller commits."""
+    keys = sorted(per_day)  # a fixed lock order across concurrent flushes
+    await db.execute(text(
+        "INSERT INTO public.room_activity (room_name, day, feedback) "
+        "SELECT * FROM unnest(CAST(:rooms AS VARCHAR[]), CAST(:days AS DATE[]), CAST(:counts AS INTEGER[])) "
+        "ON CONFLICT (room_name, day) DO UPDATE SET feedback = room_activity.feedback + EXCLUDED.feedback"
+    ), {"rooms": [k[0] for k in keys], "days": [k[1] for k in keys], "counts": [per_day[k] for k in keys]})
+
+
+async def forget_room(db: AsyncSession, room: str):
+    """Drop a deleted room's statistics; the caller commits."""
+    await db.execute(text("DELETE FROM public.room_stats WHERE room_name = :room"), {"room": room})
+    await db.execute(text("DELETE FROM public.room_activity WHERE room_name = :room"), {"room": room})
+
+
+async def get_room_stats(db: AsyncSession, room: str, days: int = 30) -> dict:
+    """Totals and the last ``days`` days of activity (oldest first), from the summary tables only."""
+    result = await db.execute(text(
+        "SELECT s.pages, s.content_bytes, s.versions, s.updated_at, s.reconciled_at, "
+        "COALESCE(f.count, 0) AS feedback "
+        "FROM (SELECT CAST(:room AS VARCHAR) AS room_name) r "
+        "LEFT JOIN public.room_stats s ON s.room_name = r.room_name "
+        "LEFT JOIN feedback_counters f ON f.room_name = r.room_name"
+    ), {"room": room})
+    row = result.one()
+    activity = await db.execute(text(
+        "SELECT day, edits, feedback FROM public.room_activity "
+        f"WHERE room_name = :room AND day > {_UTC_TODAY} - :days ORDER BY day"
+    ), {"room": room, "days": days})
+    return {
+        "room": room,
+        "pages": row.pages or 0,
+        "content_bytes": row.content_bytes or 0,
+        "versions": row.versions or 0,
+        "feedback": row.feedback,
+        "updated_at": row.updated_at,
+        "reconciled_at": row.reconciled_at,
+        "activity": [{"day": a.day, "edits": a.edits, "feedback": a.feedback} for a in activity],
+    }
+
+
+async def list_room_stats(db: AsyncSession, days: int = 30) -> list[dict]:
+    """Totals of every room plus its edit and feedback sums over the last ``days`` days."""
+    result = await db.execute(text(
+        "SELECT r.name, r.display_name, COALESCE(s.pages, 0) AS pages, "
+        "COALESCE(s.content_bytes, 0) AS content_bytes, COALESCE(s.versions, 0) AS versions, "
+        "COALESCE(f.count, 0) AS feedback, COALESCE(a.edits, 0) AS recent_edits, "
+        "COALESCE(a.feedback, 0) AS recent_feedback, s.reconciled_at "
+        "FROM wiki_rooms r "
+        "LEFT JOIN public.room_stats s ON s.room_name = r.name "
+        "LEFT JOIN feedback_counters f ON f.room_name = r.name "
+        "LEFT JOIN ("
+        "  SELECT room_name, SUM(edits) AS edits, SUM(feedback) AS feedback FROM public.room_activity "
+        f"  WHERE day > {_UTC_TODAY} - :days GROUP BY room_name"
+        ") a ON a.room_name = r.name "
+        "ORDER BY r.name"
+    ), {"days": days})
+    return [dict(row._mapping) for row in result]
+
+
+# --- reconciliation ---
+
+async def _actual(db: AsyncSession, room: str) -> tuple[int, int, int]:
+    """Recount ``(pages, content_bytes, versions)`` from the room's own tables."""
+    where = ""
+    if room == "public":
+        pages, versions = "public.pages", "public.page_versions"
+    else:
+        own = await db.execute(text("SELECT to_regclass(:p) IS NOT NULL, to_regclass(:v) IS NOT NULL"),
+                               {"p": f'"{room}".pages', "v": f'"{room}".page_versions'})
+        has_pages, has_versions = own.one()
+        if has_pages:
+            pages = f'"{room}".pages'
+            versions = f'"{room}".page_versions' if has_versions else None
+        elif shared_mode():
+            pages, versions = f"{SHARED_SCHEMA}.pages", f"{SHARED_SCHEMA}.page_versions"
+            where = " WHERE room_name = :room"
+        else:
+            return 0, 0, 0
+    version_count = f"(SELECT count(*) FROM {versions}{where})" if versions else "0"
+    result = await db.execute(text(
+        f"SELECT count(*), COALESCE(sum(octet_length(content)), 0), {version_count} FROM {pages}{where}"
+    ), {"room": room})
+    return tuple(result.one())
+
+
+async def _reconcile_room(room: str) -> bool:
+    """Recount one room and fix its totals; returns whether they had drifted.
+
+    The room's stats row is locked first, so page writes that commit during
+    the recount wait and then add their deltas on top of the corrected value.
+    """
+    async with async_session_maker() as db:
+        await use_all_rooms(db)
+        await db.execute(text(
+            "INSERT INTO public.room_stats (room_name) VALUES (:room) ON CONFLICT DO NOTHING"
+        ), {"room": room})
+        current = await db.execute(text(
+            "SELECT pages, content_bytes, versions FROM public.room_stats WHERE room_name = :room FOR UPDATE"
+        ), {"room": room})
+        before = tuple(current.one())
+        actual = await _actual(db, room)
+        drifted = before != actual
+        await db.execute(text(
+            "UPDATE public.room_stats SET pages = :pages, content_bytes = :bytes, versions = :versions, "
+            "reconciled_at = now(), updated_at = CASE WHEN CAST(:drifted AS BOOLEAN) THEN now() ELSE updated_at END "
+            "WHERE room_name = :room"
+        ), {"room": room, "pages": actual[0], "bytes": actual[1], "versions": actual[2], "drifted": drifted})
+        await db.commit()
+    if drifted:
+        logger.warning("Reconciled stats of room %s: %s -> %s", room, before, actual)
+    return drifted
+
+
+async def reconcile() -> int:
+    """Recount every room, drop stats of deleted rooms and prune old activity.
+
+    Returns how many rooms had drifted.
+    """
+    async with async_session_maker() as db:
+        result = await db.execute(text("SELECT name FROM wiki_rooms ORDER BY name"))
+        rooms = ["public"] + [name for name in result.scalars().all() if _TENANT_RE.match(name)]
+    fixed = 0
+    for room in rooms:
+        try:
+            fixed += await _reconcile_room(room)
+        except Exception:
+            logger.exception("Reconciling stats of room %s failed", room)
+    async with async_session_maker() as db:
+        for table in ("room_stats", "room_activity"):
+            await db.execute(text(
+                f"DELETE FROM public.{table} WHERE room_name <> 'public' "
+                "AND room_name NOT IN (SELECT name FROM wiki_rooms)"
+            ))
+        await db.execute(text(
+            f"DELETE FROM public.room_activity WHERE day <= {_UTC_TODAY} - :days"
+        ), {"days": ACTIVITY_DAYS})
+        await db.commit()
+    return fixed
+
+
+async def run_reconcile_loop(stop: asyncio.Event | None = None, interval: float = RECONCILE_INTERVAL):
+    """Reconcile now and every ``interval`` seconds until ``stop`` is set."""
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await reconcile()
+        except Exception:
+            logger.exception("Room stats reconciliation failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,329 @@
+"""Moving a whole room in and out as one file.
+
+The export is NDJSON: a ``room`` line with the room's settings, then one
+``page`` line per page (parents before children), one ``version`` line
+per saved version and one ``feedback`` line per feedback message. The ZIP
+form holds the same lines split into ``room.ndjson``, ``pages.ndjson``,
+``versions.ndjson`` and ``feedback.ndjson``. Rows are read
+from a server-side cursor inside one REPEATABLE READ transaction, so the
+file is a consistent snapshot and memory does not grow with the room.
+
+An import goes into an existing, empty room in one transaction. Lines are
+``COPY``-ed into temporary staging tables, checked there, and moved into the
+room's tables with one ``INSERT ... SELECT`` per table. Pages get new ids
+(ids are unique across rooms); versions are re-attached by slug. Feedback
+is added to the room's feedback and its counters. When the
+room has its own schema, its secondary indexes are dropped for the load and
+rebuilt once at the end.
+"""
+import io
+import itertools
+import json
+import zipfile
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Iterator
+
+import anyio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import async_session_maker
+from app.db.tenancy import set_tenant_schema
+from app.services import room_stats
+from app.services.indexing import EVENT_CHANGED
+
+FORMAT_VERSION = 1
+EXPORT_BATCH = 500
+IMPORT_BATCH = 1000
+
+ROOM_FIELDS = ("name", "display_name", "welcome_page_id", "public_title", "public_subtitle")
+# Sections in file order and their members in the ZIP form.
+ARCHIVE_MEMBERS = {"room": "room.ndjson", "page": "pages.ndjson", "version": "versions.ndjson",
+                   "feedback": "feedback.ndjson"}
+
+_PAGE_SELECT = (
+    "SELECT id, title, slug, content, path::text AS path, created_at, updated_at, created_by, updated_by "
+    "FROM pages ORDER BY path"
+)
+_VERSION_SELECT = "SELECT id, page_id, title, content, edited_by, edited_at FROM page_versions ORDER BY id"
+_FEEDBACK_SELECT = (
+    "SELECT id, text, author_name, author_org, created_at FROM public.feedback "
+    "WHERE room_name = :room ORDER BY created_at, id"
+)
+
+_STAGE_PAGES = ("old_id", "title", "slug", "content", "path", "created_at", "updated_at", "created_by", "updated_by")
+_STAGE_VERSIONS = ("old_id", "old_page_id", "title", "content", "edited_by", "edited_at")
+_STAGE_FEEDBACK = ("old_id", "text", "author_name", "author_org", "created_at")
+_LTREE_RE = r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$"
+
+
+class InvalidArchive(Exception):
+    pass
+
+
+class RoomNotEmpty(Exception):
+    pass
+
+
+async def get_room(db: AsyncSession, room_name: str) -> dict | None:
+    result = await db.execute(text(
+        "SELECT name, display_name, welcome_page_id, COALESCE(public_title, '') AS public_title, "
+        "COALESCE(public_subtitle, '') AS public_subtitle FROM wiki_rooms WHERE name = :n"
+    ), {"n": room_name})
+    row = result.first()
+    return dict(row._mapping) if row else None
+
+
+# --- export ---
+
+def _line(kind: str, row) -> str:
+    item = {"type": kind}
+    for key, value in row._mapping.items():
+        item[key] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+async def _sections(room: dict) -> AsyncIterator[tuple[str, str]]:
+    """Yield ``(section, ndjson chunk)`` in file order, a batch of rows per chunk."""
+    yield "room", json.dumps({"type": "room", "format": FORMAT_VERSION,
+                              **{k: room[k] for k in ROOM_FIELDS}}, ensure_ascii=False) + "\n"
+    async with async_session_maker() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        await set_tenant_schema(db, room["name"])
+        for kind, sql in (("page", _PAGE_SELECT), ("version", _VERSION_SELECT), ("feedback", _FEEDBACK_SELECT)):
+            result = await db.stream(text(sql).execution_options(yield_per=EXPORT_BATCH), {"room": room["name"]})
+            async for rows in result.partitions():
+                yield kind, "".join(_line(kind, row) for row in rows)
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable target that hands over what ZipFile wrote so far."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def export_room(room: dict, fmt: str) -> AsyncIterator[bytes]:
+    """Yield the export body as NDJSON (``fmt="ndjson"``) or a ZIP archive."""
+    if fmt == "ndjson":
+        async for _, chunk in _sections(room):
+            yield chunk.encode()
+        return
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+    section, member = None, None
+    async for kind, chunk in _sections(room):
+        if kind != section:
+            if member:
+                member.close()
+            section, member = kind, archive.open(ARCHIVE_MEMBERS[kind], "w", force_zip64=True)
+        member.write(chunk.encode())
+        if data := sink.take():
+            yield data
+    member.close()
+    archive.close()
+    yield sink.take()
+
+
+# --- import ---
+
+def _lines(fileobj: BinaryIO) -> Iterator[bytes]:
+    if fileobj.read(4).startswith(b"PK"):
+        fileobj.seek(0)
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise InvalidArchive(f"Not a valid ZIP archive: {e}")
+        with archive:
+            for name in ARCHIVE_MEMBERS.values():
+                if name in archive.namelist():
+                    with archive.open(name) as member:
+                        yield from member
+        return
+    fileobj.seek(0)
+    yield from fileobj
+
+
+async def _items(fileobj: BinaryIO) -> AsyncIterator[tuple[int, dict]]:
+    """Parsed lines with their numbers; file reads and unzipping run off the event loop."""
+    lines = enumerate(_lines(fileobj), start=1)
+    while batch := await anyio.to_thread.run_sync(lambda: list(itertools.islice(lines, IMPORT_BATCH))):
+        for number, raw in batch:
+            if not raw.strip():
+                continue
+            try:
+                item = json.loads(raw)
+            except ValueError:
+                raise InvalidArchive(f"Line {number}: invalid JSON")
+            if not isinstance(item, dict):
+                raise InvalidArchive(f"Line {number}: expected an object")
+            yield number, item
+
+
+def _timestamp(value) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _record(kind: str, item: dict) -> tuple:
+    if kind == "page":
+        return (int(item["id"]), str(item["title"]), str(item["slug"]), item.get("content"), str(item["path"]),
+                _timestamp(item.get("created_at")), _timestamp(item.get("updated_at")),
+                item.get("created_by"), item.get("updated_by"))
+    if kind == "version":
+        return (int(item["id"]), int(item["page_id"]), str(item["title"]), item.get("content"),
+                item.get("edited_by"), _timestamp(item.get("edited_at")))
+    return (int(item["id"]), str(item["text"]), str(item.get("author_name") or ""),
+            str(item.get("author_org") or ""), _timestamp(item.get("created_at")))
+
+
+async def _secondary_indexes(db: AsyncSession, schema: str) -> list[tuple[str, str]]:
+    """``(qualified name, definition)`` of the room's indexes that back no constraint."""
+    result = await db.execute(text(
+        "SELECT quote_ident(n.nspname) || '.' || quote_ident(ic.relname), pg_get_indexdef(i.indexrelid) "
+        "FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indrelid JOIN pg_class ic ON ic.oid = i.indexrelid "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = :s AND c.relname IN ('pages', 'page_versions') "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)"
+    ), {"s": schema})
+    return [tuple(row) for row in result]
+
+
+async def _check_staged(db: AsyncSession):
+    checks = (
+        ("SELECT slug FROM import_pages GROUP BY slug HAVING count(*) > 1 LIMIT 1", "Duplicate slug"),
+        ("SELECT replace(path, '-', '_') FROM import_pages GROUP BY 1 HAVING count(*) > 1 LIMIT 1", "Duplicate path"),
+        (f"SELECT path FROM import_pages WHERE replace(path, '-', '_') !~ '{_LTREE_RE}' LIMIT 1", "Invalid path"),
+        ("SELECT c.path FROM import_pages c WHERE c.path LIKE '%.%' AND NOT EXISTS ("
+         "  SELECT 1 FROM import_pages p "
+         "  WHERE replace(p.path, '-', '_') = regexp_replace(replace(c.path, '-', '_'), '\\.[^.]+$', '')"
+         ") LIMIT 1", "Parent page missing for path"),
+    )
+    for sql, problem in checks:
+        found = (await db.execute(text(sql))).scalar()
+        if found is not None:
+            raise InvalidArchive(f"{problem}: {found}")
+
+
+async def import_room(db: AsyncSession, room_name: str, fileobj: BinaryIO) -> dict:
+    """Load an export into the empty room ``room_name``; the caller commits.
+
+    Raises RoomNotEmpty if the room already has pages and InvalidArchive
+    (with the offending line or value) if the file does not check out.
+    """
+    own_schema = await set_tenant_schema(db, room_name)
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"wiki.import:{room_name}"})
+    if (await db.execute(text("SELECT EXISTS (SELECT 1 FROM pages)"))).scalar():
+        raise RoomNotEmpty()
+
+    await db.execute(text(
+        "CREATE TEMP TABLE import_pages (old_id INTEGER, title VARCHAR, slug VARCHAR, content TEXT, path TEXT, "
+        "created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ, created_by VARCHAR, updated_by VARCHAR) ON COMMIT DROP"
+    ))
+    await db.execute(text(
+        "CREATE TEMP TABLE import_versions (old_id INTEGER, old_page_id INTEGER, title VARCHAR, content TEXT, "
+        "edited_by VARCHAR, edited_at TIMESTAMPTZ) ON COMMIT DROP"
+    ))
+    await db.execute(text(
+        "CREATE TEMP TABLE import_feedback (old_id INTEGER, text TEXT, author_name VARCHAR, author_org VARCHAR, "
+        "created_at TIMESTAMPTZ) ON COMMIT DROP"
+    ))
+    conn = await (await db.connection()).get_raw_connection()
+    copy = conn.driver_connection.copy_records_to_table
+    staged = {"page": [], "version": [], "feedback": []}
+    targets = {"page": ("import_pages", _STAGE_PAGES), "version": ("import_versions", _STAGE_VERSIONS),
+               "feedback": ("import_feedback", _STAGE_FEEDBACK)}
+
+    meta = None
+    async for number, item in _items(fileobj):
+        kind = item.get("type")
+        if meta is None:
+            if kind != "room" or item.get("format") != FORMAT_VERSION:
+                raise InvalidArchive(f"Line {number}: expected a room line of format {FORMAT_VERSION}")
+            meta = item
+            continue
+        if kind not in staged:
+            raise InvalidArchive(f"Line {number}: unknown type {kind!r}")
+        try:
+            staged[kind].append(_record(kind, item))
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidArchive(f"Line {number}: bad {kind} ({e!r})")
+        if len(staged[kind]) >= IMPORT_BATCH:
+            table, columns = targets[kind]
+            await copy(table, records=staged[kind], columns=columns)
+            staged[kind] = []
+    if meta is None:
+        raise InvalidArchive("Empty file")
+    for kind, records in staged.items():
+        if records:
+            table, columns = targets[kind]
+            await copy(table, records=records, columns=columns)
+    await _check_staged(db)
+
+    indexes = await _secondary_indexes(db, room_name) if own_schema else []
+    for name, _ in indexes:
+        await db.execute(text(f"DROP INDEX {name}"))
+    pages = await db.execute(text(
+        "INSERT INTO pages (title, slug, content, path, created_at, updated_at, created_by, updated_by) "
+        "SELECT title, slug, content, CAST(replace(path, '-', '_') AS ltree), COALESCE(created_at, now()), "
+        "COALESCE(updated_at, now()), created_by, updated_by FROM import_pages ORDER BY path"
+    ))
+    versions = await db.execute(text(
+        "INSERT INTO page_versions (page_id, title, content, edited_by, edited_at) "
+        "SELECT p.id, v.title, v.content, v.edited_by, COALESCE(v.edited_at, now()) "
+        "FROM import_versions v JOIN import_pages s ON s.old_id = v.old_page_id JOIN pages p ON p.slug = s.slug "
+        "ORDER BY v.old_id"
+    ))
+    for _, ddl in indexes:
+        await db.execute(text(ddl))
+    if own_schema:
+        await db.execute(text("ANALYZE pages, page_versions"))
+
+    await db.execute(text(
+        "INSERT INTO public.page_events (tenant, page_id, kind) SELECT :t, id, :k FROM pages ORDER BY id"
+    ), {"t": room_name, "k": EVENT_CHANGED})
+    size = await db.execute(text("SELECT COALESCE(sum(octet_length(content)), 0) FROM pages"))
+    await room_stats.record_page_write(db, room_name, pages=pages.rowcount, bytes_delta=size.scalar(),
+                                       versions=versions.rowcount)
+
+    feedback = await db.execute(text(
+        "INSERT INTO public.feedback (room_name, text, author_name, author_org, created_at) "
+        "SELECT :room, text, author_name, author_org, COALESCE(created_at, now()) FROM import_feedback "
+        "ORDER BY created_at, old_id RETURNING (created_at AT TIME ZONE 'UTC')::date"
+    ), {"room": room_name})
+    per_day = Counter((room_name, day) for (day,) in feedback)
+    if per_day:
+        await db.execute(text(
+            "INSERT INTO feedback_counters (room_name, count) VALUES (:room, :n) "
+            "ON CONFLICT (room_name) DO UPDATE SET count = feedback_counters.count + EXCLUDED.count, "
+            "updated_at = now()"
+        ), {"room": room_name, "n": sum(per_day.values())})
+        await room_stats.record_feedback(db, per_day)
+
+    welcome = None
+    if meta.get("welcome_page_id") is not None:
+        mapped = await db.execute(text(
+            "SELECT p.id FROM import_pages s JOIN pages p ON p.slug = s.slug WHERE s.old_id = :old"
+        ), {"old": meta["welcome_page_id"]})
+        welcome = mapped.scalar()
+    await db.execute(text(
+        "UPDATE wiki_rooms SET welcome_page_id = COALESCE(welcome_page_id, :welcome), "
+        "public_title = COALESCE(NULLIF(public_title, ''), :title), "
+        "public_subtitle = COALESCE(NULLIF(public_subtitle, ''), :subtitle) WHERE name = :n"
+    ), {"welcome": welcome, "title": meta.get("public_title") or "", "subtitle": meta.get("public_subtitle") or "",
+        "n": room_name})
+    return {"pages": pages.rowcount, "versions": versions.rowcount, "feedback": sum(per_day.values()),
+            "indexes_rebuilt": len(indexes)}
@@ -0,0 +1,175 @@
+"""Pre-provisioned spare schemas for instant room creation.
+
+Creating a room used to run ``CREATE SCHEMA`` and several ``CREATE TABLE``
+statements inside the request, each taking catalog locks that queue behind
+(and block) other DDL. Instead a background loop keeps ``SCHEMA_POOL_SIZE``
+spare schemas named ``_spare_<hex>`` with every per-room table already
+created, listed in ``public.spare_schemas``. :func:`claim` takes one with
+``FOR UPDATE SKIP LOCKED`` and renames it to the room, in the caller's
+transaction, so a failed room insert hands the spare back.
+
+Each spare records the signature of the public tables it was cloned from;
+when ``public.pages`` or ``public.page_versions`` change (or
+:data:`TENANT_TABLES_VERSION` is bumped for ``page_derived``), stale spares
+are never claimed and the loop drops and replaces them.
+"""
+import asyncio
+import logging
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.db.tenancy import _TENANT_RE, shared_mode, tenant_tables_ddl
+
+logger = logging.getLogger("wiki.schema_pool")
+
+POLL_INTERVAL = 30.0
+SPARE_PREFIX = "_spare_"
+# Bump when tenant_tables_ddl() changes in a way the public tables don't show.
+TENANT_TABLES_VERSION = 1
+# Serializes refills across API processes and workers.
+_REFILL_LOCK = "wiki.schema_pool"
+
+_refill = asyncio.Event()
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.spare_schemas ("
+        "  name VARCHAR PRIMARY KEY, "
+        "  signature VARCHAR NOT NULL, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+    await db.commit()
+
+
+async def template_signature(db: AsyncSession) -> str:
+    """Fingerprint of the tables new rooms are cloned from."""
+    result = await db.execute(text(
+        "SELECT md5(string_agg(d, ';' ORDER BY d)) FROM ("
+        "  SELECT table_name || '.' || column_name || ':' || data_type || ':' || is_nullable "
+        "         || ':' || COALESCE(column_default, '') AS d "
+        "  FROM information_schema.columns "
+        "  WHERE table_schema = 'public' AND table_name IN ('pages', 'page_versions') "
+        "  UNION ALL "
+        "  SELECT indexdef FROM pg_indexes "
+        "  WHERE schemaname = 'public' AND tablename IN ('pages', 'page_versions')"
+        ") s"
+    ))
+    return f"{TENANT_TABLES_VERSION}:{result.scalar()}"
+
+
+async def create_room_schema(db: AsyncSession, schema: str):
+    """Create a room's schema and tables in place; the slow path when the pool is empty."""
+    if not _TENANT_RE.match(schema):
+        raise ValueError(f"Invalid tenant_id: {schema}")
+    await db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
+    for ddl in tenant_tables_ddl(schema):
+        await db.execute(text(ddl))
+
+
+async def claim(db: AsyncSession, room_name: str) -> bool:
+    """Rename a spare schema to ``room_name``; False when no current spare is available.
+
+    Also False when a schema of that name is left over from an earlier room,
+    so the caller completes it in place as before. Nothing is committed here:
+    the rename becomes visible with the caller's transaction, and a rollback
+    returns the spare to the pool.
+    """
+    if not _TENANT_RE.match(room_name):
+        raise ValueError(f"Invalid tenant_id: {room_name}")
+    existing = await db.execute(text("SELECT to_regnamespace(:n)"), {"n": f'"{room_name}"'})
+    if existing.scalar() is not None:
+        return False
+    result = await db.execute(text(
+        "DELETE FROM public.spare_schemas WHERE name = ("
+        "  SELECT name FROM public.spare_schemas WHERE signature = :sig "
+        "  ORDER BY created_at LIMIT 1 FOR UPDATE SKIP LOCKED"
+        ") RETURNING name"
+    ), {"sig": await template_signature(db)})
+    spare = result.scalar()
+    if spare is None:
+        return False
+    await db.execute(text(f'ALTER SCHEMA "{spare}" RENAME TO "{room_name}"'))
+    _refill.set()
+    return True
+
+
+async def _drop_stale(db: AsyncSession, signature: str) -> int:
+    result = await db.execute(text(
+        "DELETE FROM public.spare_schemas WHERE signature <> :sig RETURNING name"
+    ), {"sig": signature})
+    stale = [row[0] for row in result]
+    for name in stale:
+        await db.execute(text(f'DROP SCHEMA IF EXISTS "{name}" CASCADE'))
+    return len(stale)
+
+
+async def _drop_orphans(db: AsyncSession) -> int:
+    """Drop spare schemas left without a pool row, e.g. by a crash between statements."""
+    result = await db.execute(text(
+        "SELECT nspname FROM pg_namespace "
+        "WHERE starts_with(nspname, :prefix) "
+        "AND nspname NOT IN (SELECT name FROM public.spare_schemas)"
+    ), {"prefix": SPARE_PREFIX})
+    orphans = [row[0] for row in result]
+    for name in orphans:
+        await db.execute(text(f'DROP SCHEMA IF EXISTS "{name}" CASCADE'))
+    return len(orphans)
+
+
+async def refill() -> int:
+    """Top the pool up to ``SCHEMA_POOL_SIZE``. Returns how many spares were created.
+
+    Every spare is created and registered in its own transaction, so a
+    claim can start using the first one while the rest are still built.
+    """
+    created = 0
+    while True:
+        async with async_session_maker() as db:
+            locked = await db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:k))"),
+                                      {"k": _REFILL_LOCK})
+            if not locked.scalar():
+                return created  # another process is refilling
+            signature = await template_signature(db)
+            if created == 0:
+                dropped = await _drop_stale(db, signature) + await _drop_orphans(db)
+                if dropped:
+                    logger.info("Dropped %d outdated spare schemas", dropped)
+            count = await db.execute(text("SELECT count(*) FROM public.spare_schemas WHERE signature = :sig"),
+                                     {"sig": signature})
+            if count.scalar() >= settings.SCHEMA_POOL_SIZE:
+                await db.commit()
+                return created
+            name = f"{SPARE_PREFIX}{uuid.uuid4().hex[:16]}"
+            await create_room_schema(db, name)
+            await db.execute(text(
+                "INSERT INTO public.spare_schemas (name, signature) VALUES (:n, :sig)"
+            ), {"n": name, "sig": signature})
+            await db.commit()
+        created += 1
+
+
+async def run_pool_loop(stop: asyncio.Event | None = None, interval: float = POLL_INTERVAL):
+    """Keep the pool full until ``stop`` is set; a claim in this process wakes it early."""
+    stop = stop or asyncio.Event()
+    if settings.SCHEMA_POOL_SIZE <= 0 or shared_mode():
+        return
+    logger.info("Schema pool loop started")
+    while not stop.is_set():
+        _refill.clear()
+        try:
+            created = await refill()
+            if created:
+                logger.info("Provisioned %d spare schemas", created)
+        except Exception:
+            logger.exception("Refilling the schema pool failed")
+        waits = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(_refill.wait())]
+        await asyncio.wait(waits, timeout=interval, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waits:
+            waiter.cancel()
+    logger.info("Schema pool loop stopped")
@@ -1,8 +1,46 @@
+from abc import ABC, abstractmethod
+
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+
+
+SEARCH_SQL = """
+    SELECT
+        id, title, slug, path::text as path,
+        CASE
+            WHEN title ILIKE :exact THEN 100
+            WHEN title ILIKE :pattern THEN 50 + similarity(title, :query) * 30
+            WHEN content ILIKE :pattern THEN similarity(title, :query) * 20
+            ELSE 0
+        END as rank,
+        CASE
+            WHEN content ILIKE :pattern THEN
+                substring(content from greatest(1, position(lower(:query) in lower(content)) - 60) for 150)
+            ELSE ''
+        END as headline
+    FROM pages
+    WHERE
+        title ILIKE :pattern
+        OR content ILIKE :pattern
+        OR similarity(title, :query) > 0.1
+    ORDER BY rank DESC, id
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def search_params(query: str, limit: int = 20, offset: int = 0) -> dict:
+    return {
+        "query": query,
+        "pattern": f"%{query}%",
+        "exact": query,
+        "limit": limit,
+        "offset": offset,
+    }
+
 
-async def search_pages(db: AsyncSession, query: str, limit: int = 20):
+async def search_pages(db: AsyncSession, query: str, limit: int = 20, offset: int = 0):
     """
     Search pages using a combined approach:
     1. pg_trgm similarity for fuzzy/partial matching on title
@@ -12,41 +50,10 @@ async def search_pages(db: AsyncSession, query: str, limit: int = 20):
     # Ensure pg_trgm extension
     await db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
 
-    pattern = f"%{query}%"
-
-    sql = text("""
-        SELECT DISTINCT ON (id)
-            id, title, slug, path::text as path,
-            CASE
-                WHEN title ILIKE :exact THEN 100
-                WHEN title ILIKE :pattern THEN 50 + similarity(title, :query) * 30
-                WHEN content ILIKE :pattern THEN similarity(title, :query) * 20
-                ELSE 0
-            END as rank,
-            CASE
-                WHEN content ILIKE :pattern THEN
-                    substring(content from greatest(1, position(lower(:query) in lower(content)) - 60) for 150)
-                ELSE ''
-            END as headline
-        FROM pages
-        WHERE
-            title ILIKE :pattern
-            OR content ILIKE :pattern
-            OR similarity(title, :query) > 0.1
-        ORDER BY id, rank DESC
-        LIMIT :limit
-    """)
-
-    result = await db.execute(sql, {
-        "query": query,
-        "pattern": pattern,
-        "exact": query,
-        "limit": limit,
-    })
+    result = await db.execute(text(SEARCH_SQL), search_params(query, limit, offset))
     rows = result.mappings().all()
 
-    # Sort by rank descending (DISTINCT ON loses the ORDER BY rank)
-    results = sorted([dict(row) for row in rows], key=lambda r: r.get("rank", 0), reverse=True)
+    results = [dict(row) for row in rows]
 
     # Add highlight markers to headline
     for r in results:
@@ -64,3 +71,48 @@ async def search_pages(db: AsyncSession, query: str, limit: int = 20):
             r["headline"] = ""
 
     return results
+
+
+class SearchBackend(ABC):
+    """Interface of a page search engine.
+
+    ``search`` returns dicts with id, title, slug, path, rank and headline.
+    Backends that keep their own index get told about page writes through
+    ``index_page``/``remove_page``; ``needs_page_data`` tells callers whether
+    it is worth loading page content for that.
+    """
+
+    needs_page_data = False
+
+    @abstractmethod
+    async def search(self, db: AsyncSession, tenant_id: str, query: str, limit: int = 20, offset: int = 0) -> list[dict]:
+        ...
+
+    async def index_page(self, tenant_id: str, page_id: int, title: str, slug: str, path: str, content: str | None):
+        pass
+
+    async def remove_page(self, tenant_id: str, page_id: int):
+        pass
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Queries the tenant's pages table directly; nothing to maintain."""
+
+    async def search(self, db, tenant_id, query, limit=20, offset=0):
+        return await search_pages(db, query, limit, offset)
+
+
+_backend: SearchBackend | None = None
+
+
+def get_search_backend() -> SearchBackend:
+    global _backend
+    if _backend is None:
+        if settings.SEARCH_BACKEND == "bm25":
+            from app.services.bm25 import create_backend
+            _backend = create_backend()
+        elif settings.SEARCH_BACKEND == "postgres":
+            _backend = PostgresSearchBackend()
+        else:
+            raise ValueError(f"Unknown SEARCH_BACKEND: {settings.SEARCH_BACKEND}")
+    return _backend
@@ -0,0 +1,124 @@
+"""Bounded LRU cache for search results.
+
+Entries are keyed by (tenant, normalized query, result page) and tied to a
+per-tenant content version: every page write bumps the version and drops the
+tenant's entries, and results computed against an older version are never
+stored. Each tenant also has a byte budget, and when the global entry cap is
+reached the entry evicted comes from the tenant holding the most entries, so a
+flood of unique queries in one room only evicts that room's own entries.
+"""
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace; search itself is case-insensitive."""
+    return " ".join(query.split())
+
+
+def _entry_size(results: list[dict]) -> int:
+    size = 64
+    for r in results:
+        size += 64 + sum(len(v) for v in r.values() if isinstance(v, str))
+    return size
+
+
+class SearchCache:
+    def __init__(self, max_entries: int, tenant_max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.tenant_max_bytes = tenant_max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, int, list[dict]]] = OrderedDict()
+        self._tenant_keys: dict[str, OrderedDict[tuple, None]] = {}
+        self._tenant_bytes: dict[str, int] = {}
+        self._versions: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(tenant_id: str, query: str, page: int) -> tuple:
+        return (tenant_id, normalize_query(query).casefold(), page)
+
+    def version(self, tenant_id: str) -> int:
+        return self._versions.get(tenant_id, 0)
+
+    def get(self, tenant_id: str, query: str, page: int) -> list[dict] | None:
+        key = self._key(tenant_id, query, page)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._tenant_keys[tenant_id].move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, tenant_id: str, query: str, page: int, version: int, results: list[dict]):
+        """Store results computed while the tenant was at ``version``."""
+        if version != self.version(tenant_id):
+            return
+        size = _entry_size(results)
+        if size > self.tenant_max_bytes:
+            return
+        key = self._key(tenant_id, query, page)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic(), size, results)
+        self._tenant_keys.setdefault(tenant_id, OrderedDict())[key] = None
+        self._tenant_bytes[tenant_id] = self._tenant_bytes.get(tenant_id, 0) + size
+
+        tenant_keys = self._tenant_keys[tenant_id]
+        while self._tenant_bytes[tenant_id] > self.tenant_max_bytes:
+            self._drop(next(iter(tenant_keys)))
+            self.evictions += 1
+        while len(self._entries) > self.max_entries:
+            # The largest tenant is at or over its fair share (max_entries / tenants);
+            # on a tie, the one that is adding pays.
+            largest = max(self._tenant_keys, key=lambda t: (len(self._tenant_keys[t]), t == tenant_id))
+            self._drop(next(iter(self._tenant_keys[largest])))
+            self.evictions += 1
+
+    def bump(self, tenant_id: str):
+        """Invalidate everything cached for a tenant after its content changed."""
+        self._versions[tenant_id] = self.version(tenant_id) + 1
+        for key in list(self._tenant_keys.get(tenant_id, ())):
+            self._drop(key)
+        self.invalidations += 1
+
+    def _drop(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        tenant_id = key[0]
+        tenant_keys = self._tenant_keys[tenant_id]
+        del tenant_keys[key]
+        self._tenant_bytes[tenant_id] -= size
+        if not tenant_keys:
+            del self._tenant_keys[tenant_id]
+            del self._tenant_bytes[tenant_id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "tenant_max_bytes": self.tenant_max_bytes,
+            "tenants": len(self._tenant_keys),
+            "bytes": sum(self._tenant_bytes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+search_cache = SearchCache(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    tenant_max_bytes=settings.SEARCH_CACHE_TENANT_MAX_BYTES,
+    ttl=settings.SEARCH_CACHE_TTL,
+)
@@ -0,0 +1,220 @@
+"""Shared, partitioned page tables for ``TENANCY_MODE=shared``.
+
+``rooms.pages`` and ``rooms.page_versions`` are hash-partitioned by
+``room_name`` into ``TENANCY_PARTITIONS`` partitions, and ``rooms.page_derived``
+by ``page_id``. That keeps the catalog the same size however many rooms there
+are. Columns are cloned from the public tables, so the ORM models work
+unchanged. Ids still come from the public sequences and stay unique across
+rooms.
+
+Row-level security is forced, so it applies to the table owner too, but not
+to superusers or roles with BYPASSRLS: :func:`check_app_role` stops the API
+from starting as one.
+See :mod:`app.db.tenancy` for how a session picks its room.
+
+:func:`migrate_rooms` moves rooms that still have their own schema into the
+shared tables, one room per transaction.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.db.tenancy import _TENANT_RE, SHARED_SCHEMA, shared_mode, use_all_rooms
+
+logger = logging.getLogger("wiki.tenancy")
+
+TABLES = ("pages", "page_versions", "page_derived")
+_DDL_LOCK = "wiki.shared_tenancy"
+# Waiting longer than this for a busy room's locks skips it until the next batch.
+MIGRATE_LOCK_TIMEOUT = "5s"
+
+_POLICY = (
+    "room_name = current_setting('app.room', true) "
+    "OR current_setting('app.all_rooms', true) = 'on'"
+)
+
+
+def _shared_ddl(partitions: int) -> list[str]:
+    s = SHARED_SCHEMA
+    ddl = [
+        f"CREATE SCHEMA IF NOT EXISTS {s}",
+        f"CREATE TABLE {s}.pages ("
+        "  room_name VARCHAR NOT NULL DEFAULT current_setting('app.room'), "
+        "  LIKE public.pages INCLUDING DEFAULTS"
+        ") PARTITION BY HASH (room_name)",
+        f"CREATE TABLE {s}.page_versions ("
+        "  room_name VARCHAR NOT NULL DEFAULT current_setting('app.room'), "
+        "  LIKE public.page_versions INCLUDING DEFAULTS"
+        ") PARTITION BY HASH (room_name)",
+        f"CREATE TABLE {s}.page_derived ("
+        "  room_name VARCHAR NOT NULL DEFAULT current_setting('app.room'), "
+        "  page_id INTEGER NOT NULL, "
+        "  plain_text TEXT NOT NULL DEFAULT '', "
+        "  outline JSONB NOT NULL DEFAULT '[]', "
+        "  links JSONB NOT NULL DEFAULT '[]', "
+        "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ") PARTITION BY HASH (page_id)",
+    ]
+    for table in TABLES:
+        for i in range(partitions):
+            ddl.append(
+                f"CREATE TABLE {s}.{table}_p{i} PARTITION OF {s}.{table} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+            )
+    ddl += [
+        f"ALTER TABLE {s}.pages ADD PRIMARY KEY (room_name, id)",
+        f"CREATE UNIQUE INDEX ux_rooms_pages_slug ON {s}.pages (room_name, slug)",
+        f"CREATE INDEX ix_rooms_pages_path ON {s}.pages (room_name, path)",
+        f"CREATE INDEX ix_rooms_pages_title ON {s}.pages (room_name, title)",
+        # Media GC scans every table by id.
+        f"CREATE INDEX ix_rooms_pages_id ON {s}.pages (id)",
+        f"ALTER TABLE {s}.page_versions ADD PRIMARY KEY (room_name, id)",
+        f"CREATE INDEX ix_rooms_page_versions_page ON {s}.page_versions (room_name, page_id)",
+        f"CREATE INDEX ix_rooms_page_versions_id ON {s}.page_versions (id)",
+        f"ALTER TABLE {s}.page_derived ADD PRIMARY KEY (page_id)",
+    ]
+    for table in TABLES:
+        ddl += [
+            f"ALTER TABLE {s}.{table} ENABLE ROW LEVEL SECURITY",
+            f"ALTER TABLE {s}.{table} FORCE ROW LEVEL SECURITY",
+            f"CREATE POLICY room_isolation ON {s}.{table} USING ({_POLICY}) WITH CHECK ({_POLICY})",
+        ]
+    return ddl
+
+
+async def check_app_role(db: AsyncSession):
+    """Refuse shared mode for a database role that row-level security does not apply to.
+
+    Rooms are kept apart only by the policies, so a superuser or BYPASSRLS
+    connection would let every room see every other room's pages.
+    """
+    if not shared_mode():
+        return
+    result = await db.execute(text(
+        "SELECT rolname, rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+    ))
+    role, bypass = result.one()
+    if bypass:
+        raise RuntimeError(
+            f"TENANCY_MODE=shared needs a database role without SUPERUSER and BYPASSRLS; "
+            f"{role!r} bypasses row-level security. Point DATABASE_URL at a plain role."
+        )
+
+
+async def ensure_tables(db: AsyncSession):
+    """Create the shared tables once; a no-op in schema mode or when they exist."""
+    if not shared_mode():
+        return
+    # Several processes may start at once; the first creates everything in one transaction.
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": _DDL_LOCK})
+    exists = await db.execute(text("SELECT to_regclass(:t)"), {"t": f"{SHARED_SCHEMA}.pages"})
+    if exists.scalar() is None:
+        for ddl in _shared_ddl(settings.TENANCY_PARTITIONS):
+            await db.execute(text(ddl))
+        logger.info("Created shared room tables with %d partitions", settings.TENANCY_PARTITIONS)
+    await db.commit()
+
+
+async def _columns(db: AsyncSession, schema: str, table: str) -> list[str]:
+    result = await db.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = :s AND table_name = :t ORDER BY ordinal_position"
+    ), {"s": schema, "t": table})
+    return [row[0] for row in result]
+
+
+async def migrate_room(room_name: str) -> dict[str, int] | None:
+    """Copy a room's own tables into the shared ones and drop its schema.
+
+    Runs in one transaction that locks the room's tables, so writers wait
+    and then land in the shared tables. Returns rows copied per table, or
+    None if the room's locks could not be taken in time. Safe to run again:
+    rows already in the shared tables are kept as they are, and a room
+    without its own schema copies nothing.
+    """
+    copied = {}
+    async with async_session_maker() as db:
+        await use_all_rooms(db)
+        await db.execute(text(f"SET LOCAL lock_timeout = '{MIGRATE_LOCK_TIMEOUT}'"))
+        present = []
+        for table in TABLES:
+            found = await db.execute(text("SELECT to_regclass(:t)"), {"t": f'"{room_name}".{table}'})
+            if found.scalar() is not None:
+                present.append(table)
+        try:
+            for table in present:
+                await db.execute(text(f'LOCK TABLE "{room_name}".{table} IN ACCESS EXCLUSIVE MODE'))
+        except Exception as e:
+            if "lock timeout" not in str(e):
+                raise
+            await db.rollback()
+            logger.warning("Room %s is busy, will retry its migration", room_name)
+            return None
+        for table in present:
+            # Only columns both sides have: old rooms may predate a column.
+            shared = set(await _columns(db, SHARED_SCHEMA, table))
+            columns = ", ".join(c for c in await _columns(db, room_name, table) if c in shared and c != "room_name")
+            result = await db.execute(text(
+                f"INSERT INTO {SHARED_SCHEMA}.{table} (room_name, {columns}) "
+                f'SELECT :room, {columns} FROM "{room_name}".{table} ON CONFLICT DO NOTHING'
+            ), {"room": room_name})
+            copied[table] = result.rowcount
+        await db.execute(text(f'DROP SCHEMA IF EXISTS "{room_name}" CASCADE'))
+        await db.commit()
+    return copied
+
+
+async def _drop_spares():
+    """Spare schemas are useless in shared mode."""
+    async with async_session_maker() as db:
+        result = await db.execute(text("DELETE FROM public.spare_schemas RETURNING name"))
+        for name in result.scalars().all():
+            await db.execute(text(f'DROP SCHEMA IF EXISTS "{name}" CASCADE'))
+        await db.commit()
+
+
+async def rooms_to_migrate(db: AsyncSession, limit: int) -> list[str]:
+    result = await db.execute(text(
+        "SELECT name FROM public.wiki_rooms "
+        "WHERE to_regclass(quote_ident(name) || '.pages') IS NOT NULL "
+        "ORDER BY name LIMIT :n"
+    ), {"n": limit})
+    return [row[0] for row in result if _TENANT_RE.match(row[0])]
+
+
+async def migrate_rooms(batch: int = 50, dry_run: bool = False) -> dict:
+    """Migrate every room that still has its own schema, ``batch`` rooms at a time.
+
+    Busy rooms are skipped and tried again on the next call.
+    """
+    if not shared_mode():
+        raise RuntimeError("Set TENANCY_MODE=shared (and restart the API) before migrating")
+    async with async_session_maker() as db:
+        await ensure_tables(db)
+    if not dry_run:
+        await _drop_spares()
+    stats = {"migrated": 0, "skipped": 0, "rows": 0}
+    skipped: set[str] = set()
+    while True:
+        async with async_session_maker() as db:
+            rooms = [r for r in await rooms_to_migrate(db, batch + len(skipped)) if r not in skipped][:batch]
+        if not rooms:
+            break
+        if dry_run:
+            stats["pending"] = stats.get("pending", 0) + len(rooms)
+            skipped.update(rooms)
+            continue
+        for room in rooms:
+            copied = await migrate_room(room)
+            if copied is None:
+                skipped.add(room)
+                stats["skipped"] += 1
+                continue
+            stats["migrated"] += 1
+            stats["rows"] += sum(copied.values())
+            logger.info("Migrated room %s: %s", room, copied)
+        logger.info("Migration progress: %s", stats)
+    return stats
@@ -0,0 +1,119 @@
+"""Local AWS Signature Version 4 query-string presigning for S3/MinIO.
+
+Presigning needs no network access, so instead of going through boto3's
+request machinery for every URL we build the canonical request ourselves and
+reuse the derived signing key for the whole day. Signing time is rounded
+down to ``SIGN_WINDOW`` seconds, which makes URLs for the same object stable
+within a window: they can be cached here and by browsers alike.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from app.core.config import settings
+
+REGION = "us-east-1"
+SERVICE = "s3"
+SIGN_WINDOW = 900
+# Cached URLs are handed out only while they stay valid at least this long.
+MIN_REMAINING_VALIDITY = 600
+CACHE_SIZE = 20000
+
+_signing_keys: dict[str, bytes] = {}
+_url_cache: OrderedDict[tuple, tuple[str, float]] = OrderedDict()
+_url_cache_lock = threading.Lock()
+
+
+def _uri_encode(value: str, safe: str = "") -> str:
+    return quote(value, safe="-_.~" + safe)
+
+
+def _signing_key(date_stamp: str) -> bytes:
+    key = _signing_keys.get(date_stamp)
+    if key is None:
+        k = hmac.new(f"AWS4{settings.MINIO_SECRET_KEY}".encode(), date_stamp.encode(), hashlib.sha256).digest()
+        for part in (REGION, SERVICE, "aws4_request"):
+            k = hmac.new(k, part.encode(), hashlib.sha256).digest()
+        _signing_keys.clear()  # only today's key is ever needed
+        key = _signing_keys[date_stamp] = k
+    return key
+
+
+def presign(
+    method: str,
+    bucket: str,
+    object_key: str,
+    expires: int = 3600,
+    query: dict[str, str] | None = None,
+    headers: dict[str, str] | None = None,
+    signed_at: float | None = None,
+) -> str:
+    """Return a presigned path-style URL.
+
+    ``query`` adds signed query parameters (e.g. ``uploadId``/``partNumber``),
+    ``headers`` adds headers the client must send with exactly these values.
+    """
+    host = settings.MINIO_ENDPOINT
+    ts = datetime.fromtimestamp(signed_at if signed_at is not None else time.time(), tz=timezone.utc)
+    amz_date = ts.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = amz_date[:8]
+    scope = f"{date_stamp}/{REGION}/{SERVICE}/aws4_request"
+
+    all_headers = {"host": host}
+    for name, value in (headers or {}).items():
+        all_headers[name.lower()] = str(value).strip()
+    signed_headers = ";".join(sorted(all_headers))
+
+    params = {
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{settings.MINIO_ACCESS_KEY}/{scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(expires),
+        "X-Amz-SignedHeaders": signed_headers,
+    }
+    params.update(query or {})
+    canonical_query = "&".join(
+        f"{_uri_encode(k)}={_uri_encode(str(v))}" for k, v in sorted(params.items())
+    )
+    canonical_uri = f"/{_uri_encode(bucket)}/{_uri_encode(object_key, safe='/')}"
+    canonical_headers = "".join(f"{name}:{all_headers[name]}\n" for name in sorted(all_headers))
+    canonical_request = "\n".join((
+        method, canonical_uri, canonical_query, canonical_headers, signed_headers, "UNSIGNED-PAYLOAD",
+    ))
+    string_to_sign = "\n".join((
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ))
+    signature = hmac.new(_signing_key(date_stamp), string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return f"http://{host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+
+def presign_cached(method: str, bucket: str, object_key: str, expires: int = 3600,
+                   query: dict[str, str] | None = None, window: int = SIGN_WINDOW) -> str:
+    """Like :func:`presign`, but reuses a URL until shortly before it expires.
+
+    ``window`` is the signing-time granularity; long-lived URLs for immutable
+    objects use a wider one so the URL, and thus the browser cache entry,
+    stays the same for longer.
+    """
+    now = time.time()
+    cache_key = (method, bucket, object_key, expires, window, tuple(sorted((query or {}).items())))
+    with _url_cache_lock:
+        cached = _url_cache.get(cache_key)
+        if cached is not None and cached[1] - now >= MIN_REMAINING_VALIDITY:
+            _url_cache.move_to_end(cache_key)
+            return cached[0]
+
+    signed_at = now - now % window
+    if signed_at + expires - now < MIN_REMAINING_VALIDITY:
+        signed_at = now  # window too coarse for a short expiry
+    url = presign(method, bucket, object_key, expires, query=query, signed_at=signed_at)
+    with _url_cache_lock:
+        _url_cache[cache_key] = (url, signed_at + expires)
+        _url_cache.move_to_end(cache_key)
+        while len(_url_cache) > CACHE_SIZE:
+            _url_cache.popitem(last=False)
+    return url
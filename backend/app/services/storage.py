@@ -1,37 +1,421 @@
+"""Object storage for uploaded media.
+
+Code talks to a :class:`StorageBackend` from :func:`get_storage`; which one
+is configured by ``STORAGE_BACKEND``:
+
+* ``s3`` — MinIO/S3 (default). Clients upload and download directly with
+  presigned URLs; large files can use multipart uploads.
+* ``local`` — files on local disk (see ``app.services.local_storage``),
+  for single-node installs without MinIO. Presigned URLs point at the API,
+  which checks an HMAC signature and serves the file itself.
+
+Backend methods block and are meant for the threadpool, except presigning,
+which is local and cheap. The multipart helpers further down are S3-only.
+
+Every S3 request goes through :func:`_call`: short connect/read timeouts,
+a few retries with jittered backoff for transient errors, and a circuit
+breaker. After ``S3_BREAKER_THRESHOLD`` consecutive failures calls fail
+at once with :class:`StorageUnavailable` (HTTP 503) for
+``S3_BREAKER_RESET_SECONDS``, then a single probe decides whether to close
+it again. Presigning needs no network and keeps working, so pages with
+images still render while storage is down.
+"""
+import logging
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
 from app.core.config import settings
+from app.services import sigv4
+
+logger = logging.getLogger("wiki.storage")
+
+BUCKET = 'wiki-media'
+# DeleteObjects accepts at most this many keys per request.
+DELETE_BATCH = 1000
+
+# Error codes S3/MinIO return for overload or internal trouble; worth a retry.
+_TRANSIENT_CODES = ('SlowDown', 'ServiceUnavailable', 'InternalError', 'RequestTimeout', 'Throttling')
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+
+_client = None
+_client_lock = threading.Lock()
+_ready_buckets: set[str] = set()
+
 
 def get_s3_client():
-    return boto3.client(
-        's3',
-        endpoint_url=f'http://{settings.MINIO_ENDPOINT}',
-        aws_access_key_id=settings.MINIO_ACCESS_KEY,
-        aws_secret_access_key=settings.MINIO_SECRET_KEY,
-        region_name='us-east-1',
-    )
+    """Return the process-wide S3 client.
+
+    Building a client resolves endpoints and credentials, which costs tens of
+    milliseconds, so it is done once; boto3 clients are thread-safe and the
+    connection pool is sized to serve the whole request threadpool.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    's3',
+                    endpoint_url=f'http://{settings.MINIO_ENDPOINT}',
+                    aws_access_key_id=settings.MINIO_ACCESS_KEY,
+                    aws_secret_access_key=settings.MINIO_SECRET_KEY,
+                    region_name='us-east-1',
+                    config=Config(
+                        signature_version='s3v4',
+                        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                        tcp_keepalive=True,
+                        connect_timeout=settings.S3_CONNECT_TIMEOUT,
+                        read_timeout=settings.S3_READ_TIMEOUT,
+                        # Retries happen in _call, where the breaker sees them.
+                        retries={'total_max_attempts': 1},
+                    ),
+                )
+    return _client
+
+
+class StorageUnavailable(Exception):
+    """Object storage is failing or its circuit breaker is open."""
+
+    def __init__(self, message: str = "Object storage is unavailable", retry_after: int | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by all threads of the process.
+
+    closed -> open after ``threshold`` failures in a row; open -> half-open
+    after ``reset_timeout`` seconds, letting one probe call through; the
+    probe's outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_error: str | None = None
+
+    def before_call(self):
+        """Raise StorageUnavailable unless a call may go out now."""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise StorageUnavailable(retry_after=int(remaining) + 1)
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    raise StorageUnavailable(retry_after=1)
+                self._probing = True
 
-def ensure_bucket(bucket_name: str = 'wiki-media'):
-    client = get_s3_client()
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Object storage recovered, closing circuit breaker")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self._failures += 1
+            self._last_error = repr(error)[:200]
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Object storage failing (%s), opening circuit breaker", self._last_error)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    @property
+    def available(self) -> bool:
+        """False while open; callers with nothing urgent to do can wait."""
+        with self._lock:
+            return not (self._state == self.OPEN
+                        and time.monotonic() < self._opened_at + self.reset_timeout)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {'state': self._state, 'consecutive_failures': self._failures, 'last_error': self._last_error}
+            if self._state == self.OPEN:
+                out['retry_in'] = max(0, round(self._opened_at + self.reset_timeout - time.monotonic(), 1))
+            return out
+
+
+breaker = CircuitBreaker(settings.S3_BREAKER_THRESHOLD, settings.S3_BREAKER_RESET_SECONDS)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):  # refused, DNS, timeouts, resets
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return code in _TRANSIENT_CODES or status >= 500
+    return False
+
+
+def _call(fn, *args, **kwargs):
+    """Run one S3 operation with retries and the circuit breaker.
+
+    Non-transient errors (NoSuchKey, AccessDenied, ...) mean storage is up:
+    they are raised as they are and count as success for the breaker.
+    Transient errors are retried up to ``S3_MAX_ATTEMPTS`` times with full
+    jitter, then surface as StorageUnavailable.
+    """
+    breaker.before_call()
+    attempts = max(1, settings.S3_MAX_ATTEMPTS)
+    for attempt in range(attempts):
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not _is_transient(e):
+                breaker.record_success()
+                raise
+            if attempt + 1 == attempts:
+                breaker.record_failure(e)
+                raise StorageUnavailable(f"Object storage request failed: {e}") from e
+            time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+        else:
+            breaker.record_success()
+            return result
+
+
+def _s3(operation: str, **params):
+    return _call(lambda: getattr(get_s3_client(), operation)(**params))
+
+
+def ensure_bucket(bucket_name: str = BUCKET):
+    """Create the bucket if needed; checked against S3 once per process."""
+    if bucket_name in _ready_buckets:
+        return
     try:
-        client.head_bucket(Bucket=bucket_name)
+        _s3('head_bucket', Bucket=bucket_name)
     except ClientError:
-        client.create_bucket(Bucket=bucket_name)
-
-def generate_presigned_upload_url(object_key: str, bucket: str = 'wiki-media', expires: int = 3600) -> str:
-    client = get_s3_client()
-    url = client.generate_presigned_url(
-        'put_object',
-        Params={'Bucket': bucket, 'Key': object_key},
-        ExpiresIn=expires,
-    )
-    return url
-
-def generate_presigned_download_url(object_key: str, bucket: str = 'wiki-media', expires: int = 3600) -> str:
-    client = get_s3_client()
-    url = client.generate_presigned_url(
-        'get_object',
-        Params={'Bucket': bucket, 'Key': object_key},
-        ExpiresIn=expires,
+        _s3('create_bucket', Bucket=bucket_name)
+    _ready_buckets.add(bucket_name)
+
+_NOT_FOUND_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+
+class StorageBackend(ABC):
+    """Put, get, stat, delete and presign objects by key."""
+
+    #: Whether multipart upload sessions (``app.services.uploads``) work.
+    supports_multipart = False
+
+    def ensure_ready(self):
+        """Make sure objects can be written; raises if storage is unreachable."""
+
+    @abstractmethod
+    def put(self, object_key: str, body: bytes, content_type: str, cache_control: str | None = None):
+        ...
+
+    @abstractmethod
+    def get(self, object_key: str, max_bytes: int) -> bytes | None:
+        """Whole object, or None if it is missing or larger than ``max_bytes``."""
+
+    @abstractmethod
+    def stat(self, object_key: str) -> dict | None:
+        """``{size, content_type, checksum_sha256}`` (base64, if known), or None if missing."""
+
+    @abstractmethod
+    def delete(self, object_key: str):
+        ...
+
+    @abstractmethod
+    def list_objects(self, prefix: str, start_after: str | None = None, limit: int = 1000) -> list[dict]:
+        """Up to ``limit`` objects under ``prefix`` with keys after ``start_after``, in key order.
+
+        Each item is ``{key, size, last_modified}`` (an aware datetime).
+        """
+
+    @abstractmethod
+    def delete_many(self, object_keys: list[str]) -> list[str]:
+        """Delete objects in bulk; returns the keys that could not be deleted."""
+
+    @abstractmethod
+    def presign_put(self, object_key: str, expires: int = 3600, headers: dict[str, str] | None = None) -> str:
+        """URL the client PUTs the body to, sending ``headers`` verbatim."""
+
+    @abstractmethod
+    def presign_get(self, object_key: str, expires: int = 3600, cache_control: str | None = None,
+                    window: int = sigv4.SIGN_WINDOW) -> str:
+        """Download URL, kept stable for ``window`` seconds so browsers can cache it."""
+
+
+class S3StorageBackend(StorageBackend):
+    supports_multipart = True
+
+    def __init__(self, bucket: str = BUCKET):
+        self.bucket = bucket
+
+    def ensure_ready(self):
+        # Once the bucket is known, this is where uploads learn that storage
+        # is down: presigning alone would hand out URLs that fail in the browser.
+        if not breaker.available:
+            raise StorageUnavailable()
+        ensure_bucket(self.bucket)
+
+    def put(self, object_key, body, content_type, cache_control=None):
+        params = {'Bucket': self.bucket, 'Key': object_key, 'Body': body, 'ContentType': content_type}
+        if cache_control:
+            params['CacheControl'] = cache_control
+        _s3('put_object', **params)
+
+    def get(self, object_key, max_bytes):
+        def fetch():
+            resp = get_s3_client().get_object(Bucket=self.bucket, Key=object_key)
+            with resp['Body'] as body:
+                if resp['ContentLength'] > max_bytes:
+                    return None
+                return body.read()  # inside _call: a stalled body is retried too
+        try:
+            return _call(fetch)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in _NOT_FOUND_CODES:
+                return None
+            raise
+
+    def stat(self, object_key):
+        try:
+            head = _s3('head_object', Bucket=self.bucket, Key=object_key, ChecksumMode='ENABLED')
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in _NOT_FOUND_CODES:
+                return None
+            raise
+        return {
+            'size': head['ContentLength'],
+            'content_type': head.get('ContentType'),
+            'checksum_sha256': head.get('ChecksumSHA256'),
+        }
+
+    def delete(self, object_key):
+        _s3('delete_object', Bucket=self.bucket, Key=object_key)
+
+    def list_objects(self, prefix, start_after=None, limit=1000):
+        params = {'Bucket': self.bucket, 'Prefix': prefix, 'MaxKeys': limit}
+        if start_after:
+            params['StartAfter'] = start_after
+        resp = _s3('list_objects_v2', **params)
+        return [{'key': o['Key'], 'size': o['Size'], 'last_modified': o['LastModified']}
+                for o in resp.get('Contents', [])]
+
+    def delete_many(self, object_keys):
+        failed = []
+        for i in range(0, len(object_keys), DELETE_BATCH):
+            chunk = object_keys[i:i + DELETE_BATCH]
+            resp = _s3('delete_objects', Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in chunk], 'Quiet': True,
+            })
+            for error in resp.get('Errors', []):
+                logger.warning("Could not delete %s: %s", error.get('Key'), error.get('Message'))
+                failed.append(error['Key'])
+        return failed
+
+    def presign_put(self, object_key, expires=3600, headers=None):
+        return sigv4.presign('PUT', self.bucket, object_key, expires, headers=headers)
+
+    def presign_get(self, object_key, expires=3600, cache_control=None, window=sigv4.SIGN_WINDOW):
+        query = {'response-cache-control': cache_control} if cache_control else None
+        return sigv4.presign_cached('GET', self.bucket, object_key, expires, query=query, window=window)
+
+
+_backend: StorageBackend | None = None
+
+
+def get_storage() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        if settings.STORAGE_BACKEND == 'local':
+            from app.services.local_storage import create_backend
+            _backend = create_backend()
+        elif settings.STORAGE_BACKEND == 's3':
+            _backend = S3StorageBackend()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}")
+    return _backend
+
+
+def health() -> dict:
+    """Storage state for ``/health``; never touches the network."""
+    if settings.STORAGE_BACKEND != 's3':
+        return {'backend': settings.STORAGE_BACKEND, 'state': CircuitBreaker.CLOSED}
+    return {'backend': 's3', **breaker.snapshot()}
+
+
+def init_storage():
+    """Warm up the backend and verify it is writable at startup. Blocking."""
+    try:
+        get_storage().ensure_ready()
+    except Exception as e:
+        # Keep serving pages; uploads retry the check until storage is back.
+        logger.warning("Object storage not ready at startup: %s", e)
+
+def generate_presigned_upload_url(object_key: str, expires: int = 3600) -> str:
+    return get_storage().presign_put(object_key, expires)
+
+def generate_presigned_download_url(object_key: str, expires: int = 3600) -> str:
+    """Download URLs are cached: repeat views of a page get the same links."""
+    return get_storage().presign_get(object_key, expires)
+
+
+# --- Multipart uploads (S3 only) ---
+
+def generate_presigned_part_url(object_key: str, upload_id: str, part_number: int,
+                                bucket: str = BUCKET, expires: int = 3600) -> str:
+    return sigv4.presign('PUT', bucket, object_key, expires,
+                         query={'partNumber': str(part_number), 'uploadId': upload_id})
+
+def create_multipart_upload(object_key: str, content_type: str | None = None, bucket: str = BUCKET) -> str:
+    params = {'Bucket': bucket, 'Key': object_key}
+    if content_type:
+        params['ContentType'] = content_type
+    return _s3('create_multipart_upload', **params)['UploadId']
+
+def list_uploaded_parts(object_key: str, upload_id: str, bucket: str = BUCKET) -> list[dict]:
+    """Parts S3 actually has for an upload, as [{PartNumber, ETag, Size}]."""
+    parts, marker = [], 0
+    while True:
+        resp = _s3('list_parts', Bucket=bucket, Key=object_key, UploadId=upload_id, PartNumberMarker=marker)
+        parts.extend({k: p[k] for k in ('PartNumber', 'ETag', 'Size')} for p in resp.get('Parts', []))
+        if not resp.get('IsTruncated'):
+            return parts
+        marker = resp['NextPartNumberMarker']
+
+def complete_multipart_upload(object_key: str, upload_id: str, parts: list[dict], bucket: str = BUCKET):
+    _s3(
+        'complete_multipart_upload', Bucket=bucket, Key=object_key, UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]},
     )
-    return url
+
+def abort_multipart_upload(object_key: str, upload_id: str, bucket: str = BUCKET):
+    try:
+        _s3('abort_multipart_upload', Bucket=bucket, Key=object_key, UploadId=upload_id)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchUpload':
+            raise
+
+def list_multipart_uploads(bucket: str = BUCKET):
+    """Yield every in-progress multipart upload in the bucket."""
+    params = {'Bucket': bucket}
+    while True:
+        resp = _s3('list_multipart_uploads', **params)
+        yield from resp.get('Uploads', [])
+        if not resp.get('IsTruncated'):
+            return
+        params['KeyMarker'] = resp['NextKeyMarker']
+        params['UploadIdMarker'] = resp['NextUploadIdMarker']
@@ -0,0 +1,233 @@
+"""In-memory title/slug index for search-as-you-type suggestions.
+
+Each tenant gets its own ``TitleIndex`` built lazily from the ``pages`` table
+on first use and then kept up to date by the page endpoints, so answering a
+suggestion never touches Postgres.
+
+Prefix lookups go through a sorted array of normalized keys (whole title,
+every word-suffix of the title and the slug); typo-tolerant lookups fall back
+to a trigram map over title words, scored the same way pg_trgm does.
+"""
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import text
+
+from app.db.session import async_session_maker
+from app.db.tenancy import set_tenant_schema
+
+logger = logging.getLogger("wiki.suggest")
+
+# Rebuild an index in the background after this many seconds, so changes made
+# through another worker process show up eventually.
+INDEX_MAX_AGE = 300
+MIN_SIMILARITY = 0.3
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Suggestion index of a single tenant."""
+
+    def __init__(self):
+        self.built_at = time.monotonic()
+        self._docs: dict[int, dict] = {}
+        self._keys: list[tuple[str, int]] = []
+        self._page_keys: dict[int, list[tuple[str, int]]] = {}
+        self._word_trigrams: dict[int, list[set[str]]] = {}
+        self._trigram_map: dict[str, set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, page_id: int, title: str, slug: str, path: str):
+        if page_id in self._docs:
+            self.remove(page_id)
+        self._docs[page_id] = {"id": page_id, "title": title, "slug": slug, "path": path}
+
+        norm_title = _normalize(title)
+        words = _WORD_RE.findall(norm_title)
+        keys = {norm_title, _normalize(slug)}
+        for i in range(1, len(words)):
+            keys.add(" ".join(words[i:]))
+        page_keys = [(k, page_id) for k in keys if k]
+        for key in page_keys:
+            insort(self._keys, key)
+        self._page_keys[page_id] = page_keys
+
+        word_trigrams = [_trigrams(w) for w in set(words)]
+        self._word_trigrams[page_id] = word_trigrams
+        for tri in set().union(*word_trigrams):
+            self._trigram_map.setdefault(tri, set()).add(page_id)
+
+    def remove(self, page_id: int):
+        if self._docs.pop(page_id, None) is None:
+            return
+        for key in self._page_keys.pop(page_id, []):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+        for tris in self._word_trigrams.pop(page_id, []):
+            for tri in tris:
+                ids = self._trigram_map.get(tri)
+                if ids is not None:
+                    ids.discard(page_id)
+                    if not ids:
+                        del self._trigram_map[tri]
+
+    def _prefix(self, query: str, limit: int) -> list[int]:
+        found: list[int] = []
+        i = bisect_left(self._keys, (query, -1))
+        while i < len(self._keys) and len(found) < limit:
+            key, page_id = self._keys[i]
+            if not key.startswith(query):
+                break
+            if page_id not in found:
+                found.append(page_id)
+            i += 1
+        return found
+
+    def _fuzzy(self, query: str, limit: int, exclude: set[int]) -> list[int]:
+        words = _WORD_RE.findall(query)
+        if not words:
+            return []
+        # Score against the last (possibly incomplete) word of the query.
+        q_tris = _trigrams(words[-1])
+        hits: dict[int, int] = {}
+        for tri in q_tris:
+            for page_id in self._trigram_map.get(tri, ()):
+                if page_id not in exclude:
+                    hits[page_id] = hits.get(page_id, 0) + 1
+
+        scored = []
+        for page_id in hits:
+            best = 0.0
+            for w_tris in self._word_trigrams[page_id]:
+                shared = len(q_tris & w_tris)
+                if shared:
+                    best = max(best, shared / (len(q_tris) + len(w_tris) - shared))
+            if best >= MIN_SIMILARITY:
+                scored.append((best, page_id))
+        scored.sort(key=lambda s: (-s[0], self._docs[s[1]]["title"]))
+        return [page_id for _, page_id in scored[:limit]]
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict]:
+        """Prefix matches first, then typo-tolerant matches to fill up ``limit``."""
+        query = _normalize(query)
+        if not query:
+            return []
+        ids = self._prefix(query, limit)
+        if len(ids) < limit:
+            ids += self._fuzzy(query, limit - len(ids), set(ids))
+        return [dict(self._docs[page_id]) for page_id in ids]
+
+
+class _Build:
+    """A build in progress; page changes noted while it reads the table queue here."""
+
+    def __init__(self):
+        self.notes: list[tuple] = []
+        self.stale = False  # the tenant was invalidated; the snapshot is too old to keep
+
+
+_indexes: dict[str, TitleIndex] = {}
+_build_locks: dict[str, asyncio.Lock] = {}
+_builds: dict[str, list[_Build]] = {}
+_refreshing: set[str] = set()
+
+
+async def _build_index(tenant_id: str) -> tuple[TitleIndex, bool]:
+    """Build a tenant's index; the flag says whether it may replace the current one."""
+    build = _Build()
+    _builds.setdefault(tenant_id, []).append(build)
+    try:
+        index = TitleIndex()
+        async with async_session_maker() as session:
+            if tenant_id != "public":
+                await set_tenant_schema(session, tenant_id)
+            else:
+                await session.execute(text('SET search_path TO "public"'))
+            result = await session.execute(text("SELECT id, title, slug, path::text FROM pages"))
+            for row in result:
+                index.add(row[0], row[1], row[2], row[3])
+        # No await from here until the caller installs the index, so no note
+        # can slip in between.
+        for method, *args in build.notes:
+            getattr(index, method)(*args)
+    finally:
+        _builds[tenant_id].remove(build)
+        if not _builds[tenant_id]:
+            del _builds[tenant_id]
+    logger.info("Built suggestion index for %s (%d pages)", tenant_id, len(index))
+    return index, not build.stale
+
+
+async def _refresh(tenant_id: str):
+    try:
+        index, fresh = await _build_index(tenant_id)
+        if fresh:
+            _indexes[tenant_id] = index
+    except Exception as e:
+        logger.warning("Suggestion index refresh failed for %s: %s", tenant_id, e)
+    finally:
+        _refreshing.discard(tenant_id)
+
+
+async def get_index(tenant_id: str) -> TitleIndex:
+    """Return the tenant's index, building it on first use."""
+    index = _indexes.get(tenant_id)
+    if index is None:
+        lock = _build_locks.setdefault(tenant_id, asyncio.Lock())
+        try:
+            async with lock:
+                index = _indexes.get(tenant_id)
+                if index is None:
+                    index, fresh = await _build_index(tenant_id)
+                    if fresh:
+                        _indexes[tenant_id] = index
+        finally:
+            # Waiters keep their reference; a lock per X-Tenant-ID ever seen
+            # would otherwise pile up.
+            if _build_locks.get(tenant_id) is lock and not lock.locked():
+                del _build_locks[tenant_id]
+    elif time.monotonic() - index.built_at > INDEX_MAX_AGE and tenant_id not in _refreshing:
+        # Serve the current index while a fresh one is built in the background.
+        _refreshing.add(tenant_id)
+        asyncio.create_task(_refresh(tenant_id))
+    return index
+
+
+def note_page_saved(tenant_id: str, page_id: int, title: str, slug: str, path: str):
+    """Reflect a created or updated page in an already built index."""
+    index = _indexes.get(tenant_id)
+    if index is not None:
+        index.add(page_id, title, slug, path)
+    for build in _builds.get(tenant_id, ()):
+        build.notes.append(("add", page_id, title, slug, path))
+
+
+def note_page_deleted(tenant_id: str, page_id: int):
+    index = _indexes.get(tenant_id)
+    if index is not None:
+        index.remove(page_id)
+    for build in _builds.get(tenant_id, ()):
+        build.notes.append(("remove", page_id))
+
+
+def invalidate(tenant_id: str):
+    """Drop a tenant's index, e.g. after a subtree move rewrote many paths."""
+    _indexes.pop(tenant_id, None)
+    for build in _builds.get(tenant_id, ()):
+        build.stale = True
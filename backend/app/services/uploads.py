@@ -0,0 +1,168 @@
+"""Resumable multipart upload sessions.
+
+A session wraps one S3 multipart upload. The browser asks for presigned part
+URLs in batches, PUTs the parts straight to MinIO and reports each finished
+part back, so an interrupted upload can resume from the first missing part
+instead of starting over. Completion reconciles against the parts S3 really
+holds. Sessions that go quiet are aborted by :func:`run_gc_loop`, which also
+sweeps multipart uploads S3 still holds but no session knows about.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.services import storage
+
+logger = logging.getLogger("wiki.uploads")
+
+MIB = 1024 * 1024
+MIN_PART_SIZE = 16 * MIB  # S3 minimum is 5 MiB; bigger parts mean fewer requests
+MAX_PARTS = 10000
+MAX_UPLOAD_SIZE = 100 * 1024 * MIB
+GC_INTERVAL = 3600
+
+STATUS_ACTIVE = "active"
+STATUS_COMPLETED = "completed"
+STATUS_ABORTED = "aborted"
+STATUS_EXPIRED = "expired"
+
+
+async def ensure_tables(db: AsyncSession):
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.upload_sessions ("
+        "  id VARCHAR(36) PRIMARY KEY, "
+        "  object_key VARCHAR NOT NULL, "
+        "  upload_id VARCHAR NOT NULL, "
+        "  filename VARCHAR NOT NULL, "
+        "  content_type VARCHAR, "
+        "  size BIGINT NOT NULL, "
+        "  part_size BIGINT NOT NULL, "
+        "  part_count INTEGER NOT NULL, "
+        "  status VARCHAR(20) NOT NULL DEFAULT 'active', "
+        "  created_by INTEGER, "
+        "  created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        ")"
+    ))
+    await db.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_upload_sessions_status_updated "
+        "ON public.upload_sessions (status, updated_at)"
+    ))
+    await db.execute(text(
+        "CREATE TABLE IF NOT EXISTS public.upload_parts ("
+        "  session_id VARCHAR(36) NOT NULL REFERENCES public.upload_sessions(id) ON DELETE CASCADE, "
+        "  part_number INTEGER NOT NULL, "
+        "  etag VARCHAR NOT NULL, "
+        "  size BIGINT, "
+        "  PRIMARY KEY (session_id, part_number)"
+        ")"
+    ))
+    await db.commit()
+
+
+def plan_parts(size: int) -> tuple[int, int]:
+    """Return ``(part_size, part_count)`` for an object of ``size`` bytes."""
+    part_size = max(MIN_PART_SIZE, math.ceil(size / MAX_PARTS / MIB) * MIB)
+    return part_size, max(1, math.ceil(size / part_size))
+
+
+async def get_session(db: AsyncSession, session_id: str) -> dict | None:
+    result = await db.execute(text(
+        "SELECT id, object_key, upload_id, filename, content_type, size, part_size, part_count, "
+        "status, created_by, created_at, updated_at FROM public.upload_sessions WHERE id = :id"
+    ), {"id": session_id})
+    row = result.mappings().first()
+    return dict(row) if row else None
+
+
+async def get_parts(db: AsyncSession, session_id: str) -> list[dict]:
+    result = await db.execute(text(
+        "SELECT part_number, etag, size FROM public.upload_parts "
+        "WHERE session_id = :id ORDER BY part_number"
+    ), {"id": session_id})
+    return [dict(r) for r in result.mappings()]
+
+
+async def record_part(db: AsyncSession, session_id: str, part_number: int, etag: str, size: int | None):
+    await db.execute(text(
+        "INSERT INTO public.upload_parts (session_id, part_number, etag, size) "
+        "VALUES (:id, :n, :etag, :size) "
+        "ON CONFLICT (session_id, part_number) DO UPDATE SET etag = EXCLUDED.etag, size = EXCLUDED.size"
+    ), {"id": session_id, "n": part_number, "etag": etag, "size": size})
+    await touch(db, session_id)
+
+
+async def touch(db: AsyncSession, session_id: str, status: str | None = None):
+    await db.execute(text(
+        "UPDATE public.upload_sessions SET updated_at = now(), status = COALESCE(:status, status) "
+        "WHERE id = :id"
+    ), {"id": session_id, "status": status})
+
+
+async def collect_stale_uploads() -> int:
+    """Abort idle sessions and orphaned multipart uploads. Returns how many were aborted."""
+    if not storage.get_storage().supports_multipart:
+        return 0
+    ttl = settings.UPLOAD_SESSION_TTL_HOURS
+    async with async_session_maker() as db:
+        result = await db.execute(text(
+            "UPDATE public.upload_sessions SET status = :expired, updated_at = now() "
+            "WHERE status = :active AND updated_at < now() - make_interval(hours => :ttl) "
+            "RETURNING object_key, upload_id"
+        ), {"expired": STATUS_EXPIRED, "active": STATUS_ACTIVE, "ttl": ttl})
+        expired = result.fetchall()
+        # Finished sessions are only kept around for a while for debugging.
+        await db.execute(text(
+            "DELETE FROM public.upload_sessions "
+            "WHERE status <> :active AND updated_at < now() - make_interval(hours => :keep)"
+        ), {"active": STATUS_ACTIVE, "keep": ttl * 7})
+        await db.commit()
+
+    aborted = 0
+    for object_key, upload_id in expired:
+        try:
+            await asyncio.to_thread(storage.abort_multipart_upload, object_key, upload_id)
+            aborted += 1
+        except Exception:
+            logger.exception("Could not abort upload %s; the bucket sweep will retry", upload_id)
+
+    # Uploads initiated long ago that no active session owns: a crash between
+    # create_multipart_upload and the session insert, or a failed abort above.
+    def stale_in_bucket():
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=ttl)
+        return [(u["Key"], u["UploadId"]) for u in storage.list_multipart_uploads() if u["Initiated"] < cutoff]
+
+    candidates = await asyncio.to_thread(stale_in_bucket)
+    if candidates:
+        async with async_session_maker() as db:
+            result = await db.execute(text(
+                "SELECT upload_id FROM public.upload_sessions WHERE status = :active AND upload_id = ANY(:ids)"
+            ), {"active": STATUS_ACTIVE, "ids": [uid for _, uid in candidates]})
+            live = {row[0] for row in result}
+        for object_key, upload_id in candidates:
+            if upload_id not in live:
+                await asyncio.to_thread(storage.abort_multipart_upload, object_key, upload_id)
+                aborted += 1
+    if aborted:
+        logger.info("Aborted %d stale multipart uploads", aborted)
+    return aborted
+
+
+async def run_gc_loop(stop: asyncio.Event | None = None, interval: float = GC_INTERVAL):
+    """Collect stale uploads every ``interval`` seconds until ``stop`` is set."""
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await collect_stale_uploads()
+        except Exception:
+            logger.exception("Upload GC failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,53 @@
+"""Standalone background worker.
+
+Runs the same loops the API starts in-process, for deployments that set
+``BACKGROUND_WORKERS_IN_PROCESS=false`` and scale workers separately::
+
+    python -m app.worker
+"""
+import asyncio
+import logging
+import signal
+
+from app.db.session import async_session_maker
+from app.services import cas, derivatives, feedback_ingest, indexing, jobs, media_gc, room_stats, schema_pool, shared_tenancy, uploads
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("wiki.worker")
+
+
+async def main():
+    async with async_session_maker() as session:
+        await indexing.ensure_tables(session)
+        await uploads.ensure_tables(session)
+        await cas.ensure_tables(session)
+        await derivatives.ensure_tables(session)
+        await media_gc.ensure_tables(session)
+        await schema_pool.ensure_tables(session)
+        await jobs.ensure_tables(session)
+        await shared_tenancy.ensure_tables(session)
+        await room_stats.ensure_tables(session)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await asyncio.gather(
+        indexing.run_worker(stop),
+        uploads.run_gc_loop(stop),
+        derivatives.run_worker(stop),
+        media_gc.run_worker(stop),
+        feedback_ingest.run_reconcile_loop(stop),
+        schema_pool.run_pool_loop(stop),
+        jobs.run_worker(stop),
+        room_stats.run_reconcile_loop(stop),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,311 @@
+"""Search latency and relevance benchmark.
+
+Generates synthetic rooms (nested pages with Russian/English HTML, images,
+Mermaid blocks and tables) into a local Postgres, runs a fixed query set
+against the search backend and prints a JSON report with latency
+percentiles, query plan node types and recall@k / MRR for labelled queries.
+
+Run from ``backend/`` with the usual ``DATABASE_URL``::
+
+    python -m benchmarks.search_bench --yes-drop --pages 5000 --output bench.json
+    python -m benchmarks.search_bench --yes-drop --baseline bench.json   # exit 1 on regression
+
+Rooms are created as ``bench_<n>`` schemas, replacing any schema of that name,
+and dropped afterwards unless ``--keep`` is given. Because of that the run
+needs ``--yes-drop`` and refuses to start if a real room is named ``bench_<n>``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+
+from app.db.session import async_session_maker
+from app.db.tenancy import set_tenant_schema
+from app.services.search import SEARCH_SQL, search_params, search_pages
+
+EN_WORDS = (
+    "deployment server cluster database backup migration release pipeline "
+    "monitoring alert incident runbook onboarding security access token "
+    "network storage bucket cache latency throughput replica schema index "
+    "invoice customer report quarterly budget roadmap design review"
+).split()
+RU_WORDS = (
+    "развертывание сервер кластер база данных резервная копия миграция релиз "
+    "мониторинг оповещение инцидент регламент адаптация безопасность доступ "
+    "сеть хранилище кэш задержка реплика схема индекс счет клиент отчет "
+    "квартальный бюджет дорожная карта дизайн ревью сотрудник отпуск договор"
+).split()
+
+# Queries timed for latency only.
+LATENCY_QUERIES = [
+    "deployment", "server cluster", "backup", "runbook incident", "cache",
+    "сервер", "миграция базы", "отчет", "регламент", "дорожная карта",
+    "dep", "мон", "xyzzy-no-match", "invoice customer report",
+]
+
+# Queries with known relevant pages: the phrase is planted into a random
+# subset of pages, the query must find them.
+LABELLED_QUERIES = [
+    {"query": "zeltron gateway", "phrase": "zeltron gateway"},
+    {"query": "протокол ковчег", "phrase": "протокол ковчег"},
+    {"query": "quasar ledger", "phrase": "quasar ledger"},
+    {"query": "оранжевый дирижабль", "phrase": "оранжевый дирижабль"},
+    {"query": "zeltron", "phrase": "zeltron gateway"},
+]
+
+
+def _sentence(rng: random.Random, words: list[str]) -> str:
+    return " ".join(rng.choices(words, k=rng.randint(6, 18))).capitalize() + "."
+
+
+def _page_html(rng: random.Random, planted: list[str]) -> str:
+    words = rng.choice((EN_WORDS, RU_WORDS, EN_WORDS + RU_WORDS))
+    parts = []
+    for _ in range(rng.randint(2, 6)):
+        parts.append(f"<h2>{' '.join(rng.choices(words, k=3)).capitalize()}</h2>")
+        for _ in range(rng.randint(1, 4)):
+            parts.append(f"<p>{' '.join(_sentence(rng, words) for _ in range(rng.randint(1, 5)))}</p>")
+        if rng.random() < 0.3:
+            key = f"uploads/{rng.getrandbits(128):032x}/screenshot.png"
+            parts.append(f'<img src="http://minio:9000/wiki-media/{key}?X-Amz-Expires=3600">')
+        if rng.random() < 0.1:
+            parts.append(
+                '<pre><code class="language-mermaid">graph TD\n'
+                f"  A[{rng.choice(words)}] --> B[{rng.choice(words)}]\n</code></pre>"
+            )
+        if rng.random() < 0.1:
+            cells = "".join(f"<td>{rng.choice(words)}</td>" for _ in range(4))
+            parts.append(f"<table><tbody><tr>{cells}</tr><tr>{cells}</tr></tbody></table>")
+    for phrase in planted:
+        parts.insert(rng.randrange(len(parts) + 1), f"<p>{_sentence(rng, words)[:-1]} {phrase}.</p>")
+    return "".join(parts)
+
+
+def generate_room(rng: random.Random, pages: int, depth: int) -> tuple[list[dict], dict[str, set[str]]]:
+    """Return page rows and, per labelled phrase, the slugs it was planted in."""
+    planted_in: dict[str, set[str]] = {}
+    for label in LABELLED_QUERIES:
+        phrase = label["phrase"]
+        if phrase not in planted_in:
+            planted_in[phrase] = {f"p{i}" for i in rng.sample(range(pages), rng.randint(3, 8))}
+
+    rows, parents = [], []  # parents: paths that can still take a child
+    for i in range(pages):
+        slug = f"p{i}"
+        parent = rng.choice(parents) if parents and rng.random() < 0.8 else None
+        path = f"{parent}.{slug}" if parent else slug
+        if path.count(".") < depth - 1:
+            parents.append(path)
+        words = rng.choice((EN_WORDS, RU_WORDS))
+        planted = [phrase for phrase, slugs in planted_in.items() if slug in slugs]
+        title = " ".join(rng.choices(words, k=rng.randint(2, 4))).capitalize()
+        if planted and rng.random() < 0.3:
+            title += f" ({planted[0]})"
+        rows.append({"title": title, "slug": slug, "content": _page_html(rng, planted), "path": path})
+    return rows, planted_in
+
+
+async def seed_room(tenant: str, rows: list[dict]):
+    async with async_session_maker() as db:
+        await db.execute(text(f'DROP SCHEMA IF EXISTS "{tenant}" CASCADE'))
+        await db.execute(text(f'CREATE SCHEMA "{tenant}"'))
+        await set_tenant_schema(db, tenant)
+        for i in range(0, len(rows), 500):
+            await db.execute(text(
+                "INSERT INTO pages (title, slug, content, path, created_by, updated_by) "
+                "VALUES (:title, :slug, :content, CAST(:path AS ltree), 'bench', 'bench')"
+            ), rows[i:i + 500])
+        await db.execute(text("ANALYZE pages"))
+        await db.commit()
+
+
+def _plan_nodes(plan: dict) -> list[str]:
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" ({plan['Index Name']})"
+    nodes = [node]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def _percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "mean": round(statistics.fmean(ordered), 3)}
+
+
+async def run_queries(tenant: str, backend: str, repeat: int, k: int, planted_in: dict, slug_ids: dict) -> dict:
+    bm25 = None
+    if backend == "bm25":
+        from app.services.bm25 import BM25SearchBackend
+        bm25 = BM25SearchBackend(Path(tempfile.mkdtemp(prefix="bench-bm25-")))
+
+    async with async_session_maker() as db:
+        await set_tenant_schema(db, tenant)
+
+        async def search(q: str) -> list[dict]:
+            if bm25 is not None:
+                return await bm25.search(db, tenant, q, limit=k)
+            return await search_pages(db, q, limit=k)
+
+        await search("warmup")
+        per_query, all_samples, plan_types = [], [], {}
+        queries = LATENCY_QUERIES + [label["query"] for label in LABELLED_QUERIES]
+        for q in queries:
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await search(q)
+                samples.append((time.perf_counter() - start) * 1000)
+            all_samples.extend(samples)
+            entry = {"query": q, **_percentiles(samples)}
+            if bm25 is None:
+                plan = await db.execute(text("EXPLAIN (FORMAT JSON) " + SEARCH_SQL), search_params(q, k))
+                raw = plan.scalar()
+                nodes = _plan_nodes((json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"])
+                entry["plan"] = nodes
+                for node in nodes:
+                    plan_types[node] = plan_types.get(node, 0) + 1
+            per_query.append(entry)
+
+        relevance = []
+        for label in LABELLED_QUERIES:
+            relevant = {slug_ids[s] for s in planted_in[label["phrase"]]}
+            found = [r["id"] for r in await search(label["query"])]
+            hits = relevant.intersection(found)
+            first = next((i for i, pid in enumerate(found) if pid in relevant), None)
+            relevance.append({
+                "query": label["query"],
+                "relevant": len(relevant),
+                f"recall_at_{k}": round(len(hits) / len(relevant), 4),
+                "reciprocal_rank": round(1 / (first + 1), 4) if first is not None else 0.0,
+            })
+
+    return {
+        "latency_ms": _percentiles(all_samples),
+        "plan_types": plan_types,
+        "queries": per_query,
+        "relevance": relevance,
+    }
+
+
+def _summary(rooms: list[dict], k: int) -> dict:
+    samples = [q["p50"] for room in rooms for q in room["queries"]]
+    relevance = [r for room in rooms for r in room["relevance"]]
+    return {
+        "latency_p50_ms": round(statistics.median(samples), 3),
+        "latency_p95_ms": max(room["latency_ms"]["p95"] for room in rooms),
+        "latency_p99_ms": max(room["latency_ms"]["p99"] for room in rooms),
+        f"recall_at_{k}": round(statistics.fmean(r[f"recall_at_{k}"] for r in relevance), 4),
+        "mrr": round(statistics.fmean(r["reciprocal_rank"] for r in relevance), 4),
+    }
+
+
+def check_regression(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """Compare summaries; latency may grow by ``max_regression``, recall may not drop."""
+    problems = []
+    current, previous = report["summary"], baseline["summary"]
+    for key in ("latency_p95_ms", "latency_p99_ms"):
+        if current[key] > previous[key] * (1 + max_regression):
+            problems.append(f"{key}: {previous[key]} -> {current[key]}")
+    for key in previous:
+        if key.startswith("recall_at_") or key == "mrr":
+            if current.get(key, 0) < previous[key] - 0.01:
+                problems.append(f"{key}: {previous[key]} -> {current.get(key)}")
+    return problems
+
+
+async def _real_rooms(tenants: list[str]) -> list[str]:
+    async with async_session_maker() as db:
+        if (await db.execute(text("SELECT to_regclass('public.wiki_rooms')"))).scalar() is None:
+            return []
+        result = await db.execute(text("SELECT name FROM public.wiki_rooms WHERE name = ANY(:names)"),
+                                  {"names": tenants})
+        return sorted(result.scalars())
+
+
+async def main(args) -> int:
+    tenants = [f"bench_{n}" for n in range(args.rooms)]
+    if not args.yes_drop:
+        print(f"Refusing to run: schemas {', '.join(tenants)} are dropped and recreated; "
+              "pass --yes-drop against a disposable database", file=sys.stderr)
+        return 2
+    if taken := await _real_rooms(tenants):
+        print(f"Refusing to run: {', '.join(taken)} are rooms of this wiki", file=sys.stderr)
+        return 2
+
+    rng = random.Random(args.seed)
+    rooms = []
+    for tenant in tenants:
+        rows, planted_in = generate_room(rng, args.pages, args.depth)
+        start = time.perf_counter()
+        await seed_room(tenant, rows)
+        seed_seconds = time.perf_counter() - start
+        async with async_session_maker() as db:
+            await set_tenant_schema(db, tenant)
+            result = await db.execute(text("SELECT slug, id FROM pages"))
+            slug_ids = dict(result.fetchall())
+        try:
+            room = await run_queries(tenant, args.backend, args.repeat, args.k, planted_in, slug_ids)
+        finally:
+            if not args.keep:
+                async with async_session_maker() as db:
+                    await db.execute(text(f'DROP SCHEMA IF EXISTS "{tenant}" CASCADE'))
+                    await db.commit()
+        rooms.append({"room": tenant, "pages": len(rows), "seed_seconds": round(seed_seconds, 2), **room})
+
+    report = {
+        "config": {
+            "backend": args.backend, "rooms": args.rooms, "pages": args.pages,
+            "depth": args.depth, "repeat": args.repeat, "k": args.k, "seed": args.seed,
+        },
+        "summary": _summary(rooms, args.k),
+        "rooms": rooms,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        problems = check_regression(report, baseline, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=2000, help="pages per room")
+    parser.add_argument("--depth", type=int, default=4, help="maximum tree depth")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query")
+    parser.add_argument("--k", type=int, default=10, help="result count for recall@k")
+    parser.add_argument("--backend", choices=("postgres", "bm25"), default="postgres")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed relative growth of p95/p99 latency")
+    parser.add_argument("--keep", action="store_true", help="keep the generated schemas")
+    parser.add_argument("--yes-drop", action="store_true",
+                        help="allow dropping and recreating the bench_<n> schemas")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
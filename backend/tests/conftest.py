@@ -8,7 +8,8 @@ from sqlalchemy.pool import NullPool
 
 from app.core.config import settings
 from app.db.base import Base
-from app.main import app
+import app.db.base_class  # noqa: register every model for create_all
+from app.main import _init_admin_tables, _init_service_tables, app
 from app.api.deps import get_db
 
 
@@ -34,6 +35,9 @@ async def setup_database():
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS ltree"))
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+    # Tables the app creates at startup (ASGITransport does not run the lifespan)
+    await _init_admin_tables()
+    await _init_service_tables()
     yield
     async with test_engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -0,0 +1,144 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.core.security import create_access_token
+from app.models.user import User
+
+URL = "/api/v1/admin/users-with-rooms"
+
+
+@pytest.mark.asyncio
+class TestUserDirectory:
+    async def _seed(self, db_session) -> list[User]:
+        users = [
+            User(email=f"dir{i}@example.com", hashed_password="x", is_active=True, is_superuser=False)
+            for i in range(5)
+        ]
+        db_session.add_all(users)
+        await db_session.commit()
+        await db_session.execute(text("DELETE FROM user_rooms WHERE room_name IN ('dir_a', 'dir_b')"))
+        await db_session.execute(text(
+            "INSERT INTO user_rooms (user_id, room_name, role) VALUES "
+            "(:u0, 'dir_a', 'Editor'), (:u1, 'dir_a', 'Viewer'), (:u1, 'dir_b', 'Editor'), (:u2, 'dir_b', 'Owner')"
+        ), {"u0": users[0].id, "u1": users[1].id, "u2": users[2].id})
+        await db_session.commit()
+        return users
+
+    async def test_pages(self, client: AsyncClient, auth_token: str, db_session):
+        """Pages are ordered by id and ``total`` counts every match."""
+        users = await self._seed(db_session)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+
+        resp = await client.get(URL, params={"q": "DIR", "page_size": 2, "page": 2}, headers=headers)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert (data["total"], data["page"], data["page_size"]) == (5, 2, 2)
+        assert [u["email"] for u in data["items"]] == ["dir2@example.com", "dir3@example.com"]
+        assert data["items"][0]["rooms"] == [{"room": "dir_b", "role": "Owner"}]
+
+        resp = await client.get(URL, params={"q": "dir", "page_size": 2, "page": 3}, headers=headers)
+        assert [u["id"] for u in resp.json()["items"]] == [users[4].id]
+
+        resp = await client.get(URL, params={"page_size": 500}, headers=headers)
+        assert resp.status_code == 422
+
+    async def test_filters(self, client: AsyncClient, auth_token: str, db_session):
+        """``room`` and ``role`` keep users with such a membership; all their rooms are listed."""
+        await self._seed(db_session)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+
+        async def emails(**params) -> list[str]:
+            resp = await client.get(URL, params=params, headers=headers)
+            assert resp.status_code == 200
+            return [u["email"] for u in resp.json()["items"]]
+
+        assert await emails(room="dir_a") == ["dir0@example.com", "dir1@example.com"]
+        assert await emails(role="Editor") == ["dir0@example.com", "dir1@example.com"]
+        assert await emails(room="dir_a", role="Editor") == ["dir0@example.com"]
+        assert await emails(q="dir1", role="Owner") == []
+        # Literal wildcards in the search term match only themselves.
+        assert await emails(q="dir_") == []
+
+        resp = await client.get(URL, params={"room": "dir_b", "role": "Editor"}, headers=headers)
+        assert resp.json()["items"][0]["rooms"] == [
+            {"room": "dir_a", "role": "Viewer"}, {"room": "dir_b", "role": "Editor"},
+        ]
+        resp = await client.get(URL, params={"role": "Boss"}, headers=headers)
+        assert resp.status_code == 400
+
+    async def test_requires_superuser(self, client: AsyncClient, auth_token: str, db_session):
+        users = await self._seed(db_session)
+        token = create_access_token(subject=users[2].id)
+        resp = await client.get(URL, headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 403
+
+
+@pytest.mark.asyncio
+class TestMemberships:
+    async def _memberships(self, db_session, user_ids: list[int]) -> list[tuple]:
+        result = await db_session.execute(text(
+            "SELECT user_id, room_name, role, xmin::text FROM user_rooms "
+            "WHERE user_id = ANY(:ids) ORDER BY user_id, room_name"
+        ), {"ids": user_ids})
+        rows = [tuple(r) for r in result]
+        await db_session.commit()
+        return rows
+
+    async def test_bulk_assign_diffs_existing_rows(self, client: AsyncClient, auth_token: str, db_session):
+        """Only new or changed memberships are written; unchanged rows keep their row version."""
+        users = [User(email=f"mem{i}@example.com", hashed_password="x", is_active=True) for i in range(2)]
+        db_session.add_all(users)
+        await db_session.commit()
+        ids = [u.id for u in users]
+        headers = {"Authorization": f"Bearer {auth_token}"}
+
+        async def assign(rooms: list[dict], replace: bool = False) -> dict:
+            resp = await client.post("/api/v1/admin/memberships/bulk", json={
+                "user_ids": ids, "rooms": rooms, "replace": replace,
+            }, headers=headers)
+            assert resp.status_code == 200
+            return resp.json()
+
+        assert await assign([{"room": "mem_a", "role": "Editor"}, {"room": "mem_b"}]) == {
+            "added": 4, "updated": 0, "removed": 0,
+        }
+        before = await self._memberships(db_session, ids)
+
+        assert await assign([{"room": "mem_a", "role": "Editor"}, {"room": "mem_b"}]) == {
+            "added": 0, "updated": 0, "removed": 0,
+        }
+        assert await self._memberships(db_session, ids) == before
+
+        assert await assign([{"room": "mem_a", "role": "Admin"}, {"room": "mem_b", "role": "Boss"}],
+                            replace=True) == {"added": 0, "updated": 2, "removed": 0}
+        after = {(u, room): (role, xmin) for u, room, role, xmin in await self._memberships(db_session, ids)}
+        for u, room, role, xmin in before:
+            if room == "mem_a":
+                assert after[(u, room)][0] == "Admin"
+            else:
+                # Unknown roles become Viewer, which it already was.
+                assert after[(u, room)] == (role, xmin)
+
+        assert await assign([{"room": "mem_c", "role": "Viewer"}], replace=True) == {
+            "added": 2, "updated": 0, "removed": 4,
+        }
+        assert [r[1:3] for r in await self._memberships(db_session, ids)] == [("mem_c", "Viewer")] * 2
+
+    async def test_user_rooms_replace(self, client: AsyncClient, auth_token: str, db_session):
+        """Setting a user's rooms keeps listed ones, changes roles and drops the rest."""
+        user = User(email="mem-single@example.com", hashed_password="x", is_active=True)
+        db_session.add(user)
+        await db_session.commit()
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        url = f"/api/v1/admin/users/{user.id}/rooms"
+
+        await client.put(url, json={"rooms": [{"room": "mem_a", "role": "Editor"}, {"room": "mem_b"}]},
+                         headers=headers)
+        kept = [r for r in await self._memberships(db_session, [user.id]) if r[1] == "mem_a"]
+        resp = await client.put(url, json={"rooms": [{"room": "mem_a", "role": "Editor"},
+                                                     {"room": "mem_c", "role": "Owner"}]}, headers=headers)
+        assert resp.status_code == 200
+        rows = await self._memberships(db_session, [user.id])
+        assert [r[1:3] for r in rows] == [("mem_a", "Editor"), ("mem_c", "Owner")]
+        assert rows[0] == kept[0]
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.api.endpoints import public_view
+from app.services import feedback_ingest
+from app.services.rate_limit import TokenBucketLimiter, client_ip, parse_networks
+
+PROXIES = parse_networks("127.0.0.1, 172.16.0.0/12")
+
+
+class TestClientIp:
+    def test_untrusted_peer_is_the_client(self):
+        """A forwarded header from anyone but a trusted proxy is ignored."""
+        assert client_ip("203.0.113.9", "198.51.100.1", PROXIES) == "203.0.113.9"
+
+    def test_forwarded_client_behind_trusted_proxies(self):
+        assert client_ip("172.18.0.2", "198.51.100.1", PROXIES) == "198.51.100.1"
+        assert client_ip("172.18.0.2", "198.51.100.1, 172.18.0.5", PROXIES) == "198.51.100.1"
+
+    def test_spoofed_entries_are_skipped(self):
+        """Entries left of the address the proxy saw were written by the client."""
+        assert client_ip("172.18.0.2", "10.9.9.9, 198.51.100.1", PROXIES) == "198.51.100.1"
+
+    def test_no_peer(self):
+        assert client_ip(None, "198.51.100.1", PROXIES) == "unknown"
+
+
+@pytest.mark.asyncio
+class TestFeedback:
+    async def test_forwarded_clients_get_separate_buckets(self, client: AsyncClient, monkeypatch):
+        """Behind the proxy, each forwarded client IP is limited on its own."""
+        monkeypatch.setattr(feedback_ingest, "ip_limiter", TokenBucketLimiter(rate=0.001, burst=1))
+        monkeypatch.setattr(feedback_ingest, "trusted_proxies", parse_networks("127.0.0.1"))
+        body = {"text": "Hello"}
+
+        async def submit(ip: str) -> int:
+            resp = await client.post("/api/v1/public/no-such-room/feedback", json=body,
+                                      headers={"X-Forwarded-For": ip})
+            return resp.status_code
+
+        # The IP limit is checked before the room is looked up.
+        assert await submit("198.51.100.1") == 404
+        assert await submit("198.51.100.1") == 429
+        assert await submit("198.51.100.2") == 404
+
+    async def test_counters_follow_batches_and_reconcile(self, db_session):
+        """Batches bump the room counter; reconciliation repairs counters that drifted."""
+        await db_session.execute(text("DELETE FROM feedback WHERE room_name IN ('fb_room', 'fb_ghost')"))
+        await db_session.execute(text("DELETE FROM feedback_counters WHERE room_name IN ('fb_room', 'fb_ghost')"))
+        await db_session.commit()
+
+        async def counters():
+            result = await db_session.execute(text(
+                "SELECT room_name, count FROM feedback_counters "
+                "WHERE room_name IN ('fb_room', 'fb_ghost') ORDER BY room_name"
+            ))
+            rows = [tuple(r) for r in result]
+            await db_session.commit()
+            return rows
+
+        await feedback_ingest.buffer.add("fb_room", "first", "", "")
+        await feedback_ingest.buffer.add("fb_room", "second", "", "")
+        assert await counters() == [("fb_room", 2)]
+
+        await db_session.execute(text("UPDATE feedback_counters SET count = 99 WHERE room_name = 'fb_room'"))
+        await db_session.execute(text("INSERT INTO feedback_counters (room_name, count) VALUES ('fb_ghost', 5)"))
+        await db_session.commit()
+
+        assert await feedback_ingest.reconcile_counters() >= 2
+        assert await counters() == [("fb_ghost", 0), ("fb_room", 2)]
+        assert await feedback_ingest.reconcile_counters() == 0
+
+    async def test_oversized_fields_are_rejected(self, client: AsyncClient):
+        """Fields longer than their columns fail validation instead of poisoning a batch."""
+        for body in ({"text": "Hi", "author_name": "x" * 201},
+                     {"text": "Hi", "author_org": "x" * 201},
+                     {"text": "x" * (public_view.FEEDBACK_MAX_TEXT + 1)}):
+            resp = await client.post("/api/v1/public/no-such-room/feedback", json=body)
+            assert resp.status_code == 422
+
+    async def test_bad_row_is_dropped_not_requeued(self, db_session):
+        """A row the database refuses is dropped; the rest of its batch is still written."""
+        await db_session.execute(text("DELETE FROM feedback WHERE room_name = 'fb_bad'"))
+        await db_session.commit()
+
+        buf = feedback_ingest.FeedbackBuffer(flush_size=10, max_rows=10)
+        buf.running = True  # queue only; flush by hand below
+        await buf.add("fb_bad", "before", "", "")
+        await buf.add("fb_bad", "too long", "x" * 201, "")
+        await buf.add("fb_bad", "after", "", "")
+
+        assert await buf.flush() == 2
+        assert (buf.dropped, len(buf)) == (1, 0)
+        result = await db_session.execute(text(
+            "SELECT text FROM feedback WHERE room_name = 'fb_bad' ORDER BY id"
+        ))
+        assert result.scalars().all() == ["before", "after"]
+
+    async def _seed_room(self, db_session):
+        await db_session.execute(text("DELETE FROM feedback WHERE room_name = 'fb_export'"))
+        await db_session.execute(text(
+            "INSERT INTO wiki_rooms (name, display_name, public_slug) "
+            "VALUES ('fb_export', 'Feedback export', 'fb-export') ON CONFLICT (name) DO NOTHING"
+        ))
+        await db_session.execute(text(
+            "INSERT INTO feedback (room_name, text, author_name, author_org, created_at) VALUES "
+            "('fb_export', 'first', 'Ann', 'Org', now() - interval '3 minutes'), "
+            "('fb_export', 'second, with comma', 'Bob', '', now() - interval '2 minutes'), "
+            "('fb_export', 'third', '', '', now() - interval '1 minute')"
+        ))
+        await db_session.commit()
+
+    async def test_list_pages_by_cursor(self, client: AsyncClient, db_session):
+        """Pages follow each other newest first; the last one has no next_cursor."""
+        await self._seed_room(db_session)
+
+        resp = await client.get("/api/v1/public/fb-export/feedback", params={"limit": 2})
+        first = resp.json()
+        assert [i["text"] for i in first["items"]] == ["third", "second, with comma"]
+        assert first["next_cursor"]
+
+        resp = await client.get("/api/v1/public/fb-export/feedback",
+                                params={"limit": 2, "cursor": first["next_cursor"]})
+        second = resp.json()
+        assert [i["text"] for i in second["items"]] == ["first"]
+        assert second["next_cursor"] is None
+
+        resp = await client.get("/api/v1/public/fb-export/feedback", params={"cursor": "garbage"})
+        assert resp.status_code == 400
+
+    async def test_export_formats(self, client: AsyncClient, auth_token: str, db_session):
+        """The export is CSV with a BOM and a header row, or one JSON object per line."""
+        await self._seed_room(db_session)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        url = "/api/v1/admin/rooms/fb_export/feedback/export"
+
+        resp = await client.get(url, headers=headers)
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/csv")
+        assert 'filename="feedback-fb_export.csv"' in resp.headers["content-disposition"]
+        assert resp.text.startswith("\ufeff")
+        rows = list(csv.reader(io.StringIO(resp.text.lstrip("\ufeff"))))
+        assert rows[0] == ["id", "created_at", "author_name", "author_org", "text"]
+        assert [r[4] for r in rows[1:]] == ["third", "second, with comma", "first"]
+
+        resp = await client.get(url, params={"format": "ndjson"}, headers=headers)
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        items = [json.loads(line) for line in resp.text.splitlines()]
+        assert [i["author_name"] for i in items] == ["", "Bob", "Ann"]
+
+        assert (await client.get(url, params={"format": "xml"}, headers=headers)).status_code == 422
+
+    async def test_export_requires_room_admin(self, client: AsyncClient):
+        resp = await client.get("/api/v1/admin/rooms/fb_export/feedback/export")
+        assert resp.status_code == 401
+        resp = await client.get("/api/v1/public/fb-export/feedback/export")
+        assert resp.status_code == 404
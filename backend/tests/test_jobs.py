@@ -0,0 +1,142 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services import jobs, room_jobs
+
+
+async def _run_jobs():
+    while job := await jobs._claim():
+        await jobs.execute_job(job)
+
+
+@pytest.mark.asyncio
+class TestMoveJobs:
+    @pytest.fixture(autouse=True)
+    def small_batches(self, monkeypatch):
+        monkeypatch.setattr(settings, "PAGE_MOVE_INLINE_LIMIT", 2)
+        monkeypatch.setattr(settings, "PAGE_MOVE_BATCH", 2)
+
+    async def _subtree(self, client: AsyncClient, headers: dict, root: str) -> int:
+        """A root with three children and a grandchild, plus a ``<root>-dest`` page to move it under."""
+        resp = await client.post("/api/v1/pages/", json={
+            "title": root, "slug": root, "content": "", "parent_path": "",
+        }, headers=headers)
+        root_id = resp.json()["id"]
+        for parent, slug in [(root, "c1"), (root, "c2"), (root, "c3"), (f"{root}.{root}_c1", "c4")]:
+            await client.post("/api/v1/pages/", json={
+                "title": slug, "slug": f"{root}-{slug}", "content": "", "parent_path": parent.replace("-", "_"),
+            }, headers=headers)
+        await client.post("/api/v1/pages/", json={
+            "title": "dest", "slug": f"{root}-dest", "content": "", "parent_path": "",
+        }, headers=headers)
+        return root_id
+
+    async def _paths(self, db_session, root: str) -> list[str]:
+        result = await db_session.execute(text(
+            "SELECT path::text FROM public.pages WHERE slug LIKE :prefix AND slug <> :dest ORDER BY path"
+        ), {"prefix": f"{root}%", "dest": f"{root}-dest"})
+        paths = [row[0] for row in result]
+        await db_session.commit()
+        return paths
+
+    async def test_large_move_runs_as_job(self, client: AsyncClient, auth_token: str, db_session):
+        """Above the inline limit the move answers 202 and the job re-paths the whole subtree."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        root_id = await self._subtree(client, headers, "mvjob")
+
+        resp = await client.put(f"/api/v1/pages/{root_id}", json={"parent_path": "mvjob_dest"}, headers=headers)
+        assert resp.status_code == 202
+        job = resp.json()["job"]
+        assert job["status"] == jobs.STATUS_PENDING
+        assert resp.json()["page"]["path"] == "mvjob"
+
+        resp = await client.put(f"/api/v1/pages/{root_id}", json={"parent_path": "mvjob_dest"}, headers=headers)
+        assert resp.status_code == 409
+
+        await _run_jobs()
+        resp = await client.get(f"/api/v1/jobs/{job['id']}", headers=headers)
+        done = resp.json()
+        assert done["status"] == jobs.STATUS_COMPLETED
+        assert done["result"] == {"moved": 5}
+        assert done["progress"]["done"] == done["progress"]["total"] == 4
+        assert await self._paths(db_session, "mvjob") == [
+            "mvjob_dest.mvjob",
+            "mvjob_dest.mvjob.mvjob_c1",
+            "mvjob_dest.mvjob.mvjob_c1.mvjob_c4",
+            "mvjob_dest.mvjob.mvjob_c2",
+            "mvjob_dest.mvjob.mvjob_c3",
+        ]
+
+    async def test_renaming_move_sets_slug_with_path(self, client: AsyncClient, auth_token: str, db_session):
+        """A move that also renames keeps the old slug until the job sets the new path."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        root_id = await self._subtree(client, headers, "mvren")
+
+        resp = await client.put(f"/api/v1/pages/{root_id}", json={
+            "slug": "mvren-renamed", "parent_path": "mvren_dest",
+        }, headers=headers)
+        assert resp.status_code == 202
+        assert (resp.json()["page"]["slug"], resp.json()["page"]["path"]) == ("mvren", "mvren")
+        assert (await client.get(f"/api/v1/pages/{root_id}", headers=headers)).json()["slug"] == "mvren"
+
+        await _run_jobs()
+        page = (await client.get(f"/api/v1/pages/{root_id}", headers=headers)).json()
+        assert (page["slug"], page["path"]) == ("mvren-renamed", "mvren_dest.mvren_renamed")
+        assert await self._paths(db_session, "mvren") == [
+            "mvren_dest.mvren_renamed",
+            "mvren_dest.mvren_renamed.mvren_c1",
+            "mvren_dest.mvren_renamed.mvren_c1.mvren_c4",
+            "mvren_dest.mvren_renamed.mvren_c2",
+            "mvren_dest.mvren_renamed.mvren_c3",
+        ]
+
+    async def test_failed_move_resumes_on_retry(self, client: AsyncClient, auth_token: str, db_session,
+                                                monkeypatch):
+        """A job that failed after moving the descendants finishes the move when retried."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        root_id = await self._subtree(client, headers, "mvfail")
+
+        async def broken(*args):
+            raise RuntimeError("queue unavailable")
+
+        enqueue_page_event = room_jobs.enqueue_page_event
+        monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 1)
+        monkeypatch.setattr(room_jobs, "enqueue_page_event", broken)
+        resp = await client.put(f"/api/v1/pages/{root_id}", json={"parent_path": "mvfail_dest"}, headers=headers)
+        job_id = resp.json()["job"]["id"]
+        await _run_jobs()
+
+        failed = (await client.get(f"/api/v1/jobs/{job_id}", headers=headers)).json()
+        assert failed["status"] == jobs.STATUS_FAILED
+        assert "queue unavailable" in failed["error"]
+        assert failed["progress"]["done"] == 4
+        # The descendants were moved in committed batches; the root was not.
+        assert await self._paths(db_session, "mvfail") == [
+            "mvfail",
+            "mvfail_dest.mvfail.mvfail_c1",
+            "mvfail_dest.mvfail.mvfail_c1.mvfail_c4",
+            "mvfail_dest.mvfail.mvfail_c2",
+            "mvfail_dest.mvfail.mvfail_c3",
+        ]
+
+        monkeypatch.setattr(room_jobs, "enqueue_page_event", enqueue_page_event)
+        resp = await client.post(f"/api/v1/jobs/{job_id}/retry", headers=headers)
+        assert resp.status_code == 200
+        assert (resp.json()["status"], resp.json()["attempts"]) == (jobs.STATUS_PENDING, 0)
+        await _run_jobs()
+
+        done = (await client.get(f"/api/v1/jobs/{job_id}", headers=headers)).json()
+        assert done["status"] == jobs.STATUS_COMPLETED
+        assert done["error"] is None
+        assert done["result"] == {"moved": 5}
+        assert await self._paths(db_session, "mvfail") == [
+            "mvfail_dest.mvfail",
+            "mvfail_dest.mvfail.mvfail_c1",
+            "mvfail_dest.mvfail.mvfail_c1.mvfail_c4",
+            "mvfail_dest.mvfail.mvfail_c2",
+            "mvfail_dest.mvfail.mvfail_c3",
+        ]
+        resp = await client.post(f"/api/v1/jobs/{job_id}/retry", headers=headers)
+        assert resp.status_code == 409
@@ -0,0 +1,346 @@
+import datetime
+import io
+import os
+import time
+import uuid
+from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
+
+import boto3
+import pytest
+from botocore.config import Config
+from httpx import AsyncClient
+from PIL import Image
+from sqlalchemy import text
+
+from app.api.endpoints import admin
+from app.core.config import settings
+from app.services.local_storage import LocalStorageBackend
+from app.services import cas, derivatives, imaging, media_gc, sigv4, storage, uploads
+
+SIGNED_AT = datetime.datetime(2026, 3, 1, 12, 0, 0)
+
+
+class _FrozenDatetime(datetime.datetime):
+    @classmethod
+    def utcnow(cls):
+        return SIGNED_AT
+
+
+def _path(url: str) -> str:
+    split = urlsplit(url)
+    return f"{split.path}?{split.query}"
+
+
+def _parts(url: str):
+    split = urlsplit(url)
+    return split.netloc, split.path, dict(parse_qsl(split.query))
+
+
+def test_plan_parts():
+    """Parts stay at the minimum size until the part count limit forces them larger."""
+    assert uploads.plan_parts(1) == (uploads.MIN_PART_SIZE, 1)
+    assert uploads.plan_parts(uploads.MIN_PART_SIZE * 3) == (uploads.MIN_PART_SIZE, 3)
+    part_size, count = uploads.plan_parts(uploads.MAX_UPLOAD_SIZE)
+    assert count <= uploads.MAX_PARTS and part_size * count >= uploads.MAX_UPLOAD_SIZE
+
+
+def _image(fmt: str, size: tuple[int, int]) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_render_variants_sizes_and_formats():
+    """Large images get each smaller size in WebP plus a fallback of their own family."""
+    size, variants = imaging.render_variants(_image("PNG", (2000, 1000)), 50_000_000)
+    assert size == (2000, 1000)
+    assert [(v["variant"], v["format"], v["width"], v["height"]) for v in variants] == [
+        ("thumb", "webp", 320, 160), ("thumb", "png", 320, 160),
+        ("medium", "webp", 1280, 640), ("medium", "png", 1280, 640),
+        ("full", "webp", 2000, 1000),
+    ]
+    assert Image.open(io.BytesIO(variants[0]["body"])).format == "WEBP"
+
+
+def test_render_variants_never_upscales():
+    _, variants = imaging.render_variants(_image("JPEG", (200, 100)), 50_000_000)
+    assert [(v["variant"], v["format"]) for v in variants] == [("full", "webp")]
+
+
+def test_render_variants_rejects_garbage():
+    with pytest.raises(imaging.UnsupportedImage):
+        imaging.render_variants(b"not an image", 50_000_000)
+
+
+class TestSigning:
+    @pytest.fixture(autouse=True)
+    def _empty_cache(self, monkeypatch):
+        monkeypatch.setattr(sigv4, "_url_cache", type(sigv4._url_cache)())
+
+    @pytest.mark.parametrize("operation, method, query", [
+        ("get_object", "GET", {}),
+        ("upload_part", "PUT", {"uploadId": "x/y=+z", "partNumber": "3"}),
+    ])
+    def test_presign_matches_botocore(self, operation, method, query):
+        """Local signing produces the same URL, signature included, as botocore."""
+        client = boto3.client(
+            "s3",
+            endpoint_url=f"http://{settings.MINIO_ENDPOINT}",
+            aws_access_key_id=settings.MINIO_ACCESS_KEY,
+            aws_secret_access_key=settings.MINIO_SECRET_KEY,
+            region_name=sigv4.REGION,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+        key = "uploads/0f1e/отчёт 2026 (final).png"
+        params = {"Bucket": "wiki-media", "Key": key}
+        if query:
+            params.update(UploadId=query["uploadId"], PartNumber=int(query["partNumber"]))
+        with mock.patch("botocore.auth.datetime.datetime", _FrozenDatetime):
+            expected = client.generate_presigned_url(operation, Params=params, ExpiresIn=900)
+
+        signed_at = SIGNED_AT.replace(tzinfo=datetime.timezone.utc).timestamp()
+        url = sigv4.presign(method, "wiki-media", key, 900, query=query, signed_at=signed_at)
+        assert _parts(url) == _parts(expected)
+
+    def test_cached_url_stable_within_window(self, monkeypatch):
+        """URLs signed in the same window are identical, so browsers can cache the image."""
+        now = 1_800_000_000 - 1_800_000_000 % sigv4.SIGN_WINDOW + 10
+        monkeypatch.setattr(sigv4.time, "time", lambda: now)
+        first = sigv4.presign_cached("GET", "wiki-media", "uploads/a.png")
+        assert _parts(first)[2]["X-Amz-Date"] == datetime.datetime.fromtimestamp(
+            now - 10, tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+        sigv4._url_cache.clear()
+        monkeypatch.setattr(sigv4.time, "time", lambda: now + sigv4.SIGN_WINDOW - 20)
+        assert sigv4.presign_cached("GET", "wiki-media", "uploads/a.png") == first
+
+    def test_cached_url_reused_until_close_to_expiry(self, monkeypatch):
+        """A cached URL is handed out while it stays valid long enough, then re-signed."""
+        start = 1_800_000_000 - 1_800_000_000 % sigv4.SIGN_WINDOW
+        clock = {"now": start}
+        monkeypatch.setattr(sigv4.time, "time", lambda: clock["now"])
+        first = sigv4.presign_cached("GET", "wiki-media", "uploads/b.png", expires=3600)
+
+        # Next window, but still far from expiry: the cached URL is reused.
+        clock["now"] = start + sigv4.SIGN_WINDOW + 5
+        assert sigv4.presign_cached("GET", "wiki-media", "uploads/b.png", expires=3600) == first
+
+        # Less than MIN_REMAINING_VALIDITY left: a fresh URL from the current window.
+        clock["now"] = start + 3600 - sigv4.MIN_REMAINING_VALIDITY + 1
+        fresh = sigv4.presign_cached("GET", "wiki-media", "uploads/b.png", expires=3600)
+        assert fresh != first
+        signed = datetime.datetime.strptime(_parts(fresh)[2]["X-Amz-Date"], "%Y%m%dT%H%M%SZ")
+        assert signed.replace(tzinfo=datetime.timezone.utc).timestamp() + 3600 - clock["now"] \
+            >= sigv4.MIN_REMAINING_VALIDITY
+
+    def test_short_expiry_signed_now(self, monkeypatch):
+        """An expiry too short for the window is signed at the current time instead."""
+        now = 1_800_000_000 - 1_800_000_000 % sigv4.SIGN_WINDOW + sigv4.SIGN_WINDOW - 1
+        monkeypatch.setattr(sigv4.time, "time", lambda: now)
+        url = sigv4.presign_cached("GET", "wiki-media", "uploads/c.png", expires=sigv4.MIN_REMAINING_VALIDITY)
+        assert _parts(url)[2]["X-Amz-Date"] == datetime.datetime.fromtimestamp(
+            now, tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+@pytest.mark.asyncio
+class TestMedia:
+    async def test_upload_urls_require_login(self, client: AsyncClient):
+        """Batch upload URLs are only handed out to signed-in users."""
+        resp = await client.post("/api/v1/media/upload-urls", json={"filenames": ["a.png"]})
+        assert resp.status_code == 401
+
+    async def test_download_urls_batch(self, client: AsyncClient, auth_token: str):
+        """One request returns a URL per distinct key."""
+        resp = await client.post("/api/v1/media/download-urls", json={
+            "object_keys": ["uploads/1/a.png", "uploads/2/b.png", "uploads/1/a.png"],
+        }, headers={"Authorization": f"Bearer {auth_token}"})
+        assert resp.status_code == 200
+        assert sorted(resp.json()["urls"]) == ["uploads/1/a.png", "uploads/2/b.png"]
+
+    async def test_multipart_session_resume_and_complete(self, client: AsyncClient, auth_token: str, monkeypatch):
+        """Reported parts drive resuming; completion checks the parts S3 really has."""
+        held = []
+        monkeypatch.setattr(storage.S3StorageBackend, "ensure_ready", lambda self: None)
+        monkeypatch.setattr(storage, "create_multipart_upload", lambda key, content_type=None: "upload-1")
+        monkeypatch.setattr(storage, "list_uploaded_parts", lambda key, upload_id: list(held))
+        monkeypatch.setattr(storage, "complete_multipart_upload", lambda key, upload_id, parts: None)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+
+        size = uploads.MIN_PART_SIZE * 2 + 1
+        resp = await client.post("/api/v1/media/uploads", json={"filename": "big.bin", "size": size}, headers=headers)
+        assert resp.status_code == 201
+        session = resp.json()
+        assert (session["part_size"], session["part_count"]) == (uploads.MIN_PART_SIZE, 3)
+        sid = session["session_id"]
+
+        resp = await client.post(f"/api/v1/media/uploads/{sid}/part-urls", json={"part_numbers": [4]}, headers=headers)
+        assert resp.status_code == 400
+        await client.put(f"/api/v1/media/uploads/{sid}/parts/2", json={"etag": "e2"}, headers=headers)
+        resp = await client.get(f"/api/v1/media/uploads/{sid}", headers=headers)
+        assert [p["part_number"] for p in resp.json()["parts"]] == [2]
+
+        held.extend({"PartNumber": n, "ETag": f"e{n}"} for n in (1, 2))
+        resp = await client.post(f"/api/v1/media/uploads/{sid}/complete", headers=headers)
+        assert resp.status_code == 409
+        assert resp.json()["detail"]["missing_parts"] == [3]
+
+        held.append({"PartNumber": 3, "ETag": "e3"})
+        resp = await client.post(f"/api/v1/media/uploads/{sid}/complete", headers=headers)
+        assert resp.status_code == 200
+        resp = await client.get(f"/api/v1/media/uploads/{sid}", headers=headers)
+        assert resp.json()["status"] == uploads.STATUS_COMPLETED
+
+    async def test_variants_require_login(self, client: AsyncClient):
+        resp = await client.get("/api/v1/media/variants", params={"object_key": "uploads/1/a.png"})
+        assert resp.status_code == 401
+        resp = await client.post("/api/v1/media/variants", json={"object_keys": ["uploads/1/a.png"]})
+        assert resp.status_code == 401
+
+    async def test_variants_queue_only_stored_images(self, client: AsyncClient, auth_token: str, db_session):
+        """Asking for variants queues an image only if its original is really stored."""
+        stored, made_up = "cd" * 32, "ef" * 32
+        await db_session.execute(text(
+            "INSERT INTO public.media_objects (sha256, size, status, refcount) VALUES (:h, 3, 'ready', 0)"
+        ), {"h": stored})
+        await db_session.commit()
+        keys = [cas.object_key(stored), cas.object_key(made_up)]
+
+        resp = await client.post("/api/v1/media/variants", json={"object_keys": keys},
+                                 headers={"Authorization": f"Bearer {auth_token}"})
+        assert resp.status_code == 200
+        variants = resp.json()["variants"]
+        assert variants[keys[0]]["status"] == derivatives.STATUS_PENDING
+        assert variants[keys[1]]["status"] == "unknown"
+
+        queued = await db_session.execute(text(
+            "SELECT object_key FROM public.image_sources WHERE object_key = ANY(:keys)"
+        ), {"keys": keys})
+        assert queued.scalars().all() == [keys[0]]
+
+    async def test_local_files_put_and_ranges(self, client: AsyncClient, monkeypatch, tmp_path):
+        """The local backend accepts signed PUTs and serves signed GETs with byte ranges."""
+        backend = LocalStorageBackend(tmp_path)
+        monkeypatch.setattr(storage, "_backend", backend)
+        body = b"0123456789"
+        key = "uploads/1/digits.txt"
+
+        resp = await client.put("/api/v1/media/files/" + key, content=body)
+        assert resp.status_code == 403
+        put_url = _path(backend.presign_put(key, headers={"x-amz-checksum-sha256": cas.checksum("00" * 32)}))
+        resp = await client.put(put_url, content=body, headers={"Content-Type": "text/plain"})
+        assert resp.status_code == 400
+        put_url = _path(backend.presign_put(key))
+        resp = await client.put(put_url, content=body, headers={"Content-Type": "text/plain"})
+        assert resp.status_code == 200
+
+        get_url = _path(backend.presign_get(key))
+        resp = await client.get(get_url)
+        assert resp.status_code == 200
+        assert resp.content == body
+        assert resp.headers["accept-ranges"] == "bytes"
+
+        resp = await client.get(get_url, headers={"Range": "bytes=2-5"})
+        assert resp.status_code == 206
+        assert resp.content == b"2345"
+        assert resp.headers["content-range"] == "bytes 2-5/10"
+        assert resp.headers["content-length"] == "4"
+
+        resp = await client.get(get_url, headers={"Range": "bytes=-3"})
+        assert resp.status_code == 206
+        assert resp.content == b"789"
+
+        resp = await client.get(get_url, headers={"Range": "bytes=7-100"})
+        assert resp.content == b"789"
+
+        resp = await client.get(get_url, headers={"Range": "bytes=10-"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == "bytes */10"
+
+        resp = await client.get(get_url, headers={"Range": "bytes=0-1,4-5"})
+        assert resp.status_code == 200  # multi-range: the whole file
+
+        resp = await client.get(get_url.replace("GET", "PUT"))
+        assert resp.status_code == 403
+
+    async def test_local_files_never_render_as_pages(self, client: AsyncClient, monkeypatch, tmp_path):
+        """Uploaded HTML or SVG is served as a sandboxed download; raster images stay inline."""
+        backend = LocalStorageBackend(tmp_path)
+        monkeypatch.setattr(storage, "_backend", backend)
+        for key, content_type, inline in [
+            ("uploads/1/x.html", "text/html", False),
+            ("uploads/1/x.svg", "image/svg+xml", False),
+            ("uploads/1/x.bin", None, False),
+            ("uploads/1/x.png", "image/png", True),
+        ]:
+            headers = {"Content-Type": content_type} if content_type else {}
+            resp = await client.put(_path(backend.presign_put(key)), content=b"<script>1</script>", headers=headers)
+            assert resp.status_code == 200
+            resp = await client.get(_path(backend.presign_get(key)))
+            assert resp.status_code == 200
+            assert resp.headers["x-content-type-options"] == "nosniff"
+            assert resp.headers["content-security-policy"] == "sandbox"
+            assert ("content-disposition" not in resp.headers) == inline
+            if not inline:
+                assert resp.headers["content-disposition"] == "attachment"
+
+    async def test_oversized_logo_rejected_before_upload(self, client: AsyncClient, auth_token: str):
+        """A logo larger than the limit is refused from its Content-Length."""
+        resp = await client.put(
+            "/api/v1/admin/default-logo",
+            files={"file": ("logo.png", b"x" * (settings.LOGO_MAX_BYTES + 100 * 1024), "image/png")},
+            headers={"Authorization": f"Bearer {auth_token}"},
+        )
+        assert resp.status_code == 413
+
+    async def test_default_logo_ignores_similarly_named_rooms(self, client: AsyncClient, auth_token: str,
+                                                              monkeypatch, tmp_path):
+        """A room whose name starts with the default-logo stem keeps its logo."""
+        monkeypatch.setattr(admin, "LOGOS_DIR", tmp_path)
+        monkeypatch.setattr(admin, "_default_logo_cache", None)
+        (tmp_path / "default_logo2-0123456789abcdef.png").write_bytes(b"room")
+        assert admin._find_default_logo() is None
+
+        resp = await client.put(
+            "/api/v1/admin/default-logo",
+            files={"file": ("logo.png", b"default", "image/png")},
+            headers={"Authorization": f"Bearer {auth_token}"},
+        )
+        assert resp.status_code == 200
+        assert (tmp_path / "default_logo2-0123456789abcdef.png").exists()
+        assert admin._find_default_logo() == resp.json()["logo_url"]
+
+        resp = await client.post("/api/v1/admin/rooms", json={"name": "default_logo", "display_name": "X"},
+                                 headers={"Authorization": f"Bearer {auth_token}"})
+        assert resp.status_code == 400
+
+    async def test_media_gc_keeps_referenced_and_recent(self, client: AsyncClient, auth_token: str, db_session,
+                                                       monkeypatch, tmp_path):
+        """A run deletes only unreferenced objects older than the grace period, variants included."""
+        backend = LocalStorageBackend(tmp_path)
+        monkeypatch.setattr(storage, "_backend", backend)
+        used, recent, orphan = (f"uploads/{uuid.uuid4()}" for _ in range(3))
+        old = time.time() - 100 * 3600
+        for root in (used, recent, orphan):
+            for key in (f"{root}/a.png", f"{root}/a.png.thumb.webp"):
+                backend.put(key, b"img", "image/png")
+                if root != recent:
+                    os.utime(backend.path(key), (old, old))
+
+        await client.post("/api/v1/pages/", json={
+            "title": "GC Page", "slug": "gc-page", "parent_path": "",
+            "content": f'<img src="http://minio/wiki-media/{used}/a.png?X-Amz-Expires=1">',
+        }, headers={"Authorization": f"Bearer {auth_token}"})
+        await db_session.execute(text("DELETE FROM public.media_gc_runs"))
+        await db_session.commit()
+
+        await media_gc.start_run(db_session, None, grace_hours=72)
+        run = await media_gc._claim()
+        await media_gc.execute_run(run)
+
+        remaining = {o["key"] for o in backend.list_objects("uploads/")}
+        assert remaining == {f"{root}/{name}" for root in (used, recent) for name in ("a.png", "a.png.thumb.webp")}
+        done = await media_gc.get_run(db_session, run["id"])
+        assert done["status"] == media_gc.STATUS_COMPLETED
+        assert done["stats"]["objects_deleted"] == 2
+        assert done["stats"]["kept_recent"] == 2
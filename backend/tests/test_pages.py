@@ -1,5 +1,9 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.services import indexing
+from app.services.indexing import process_batch
 
 
 @pytest.mark.asyncio
@@ -72,8 +76,176 @@ class TestPages:
         })
         assert resp.status_code == 404
 
+    async def test_page_write_indexed_after_commit(self, client: AsyncClient, auth_token: str, db_session):
+        """Page writes enqueue an event that the indexing worker turns into derived data."""
+        resp = await client.post("/api/v1/pages/", json={
+            "title": "Outline Page",
+            "slug": "outline-page",
+            "content": '<h2>Setup</h2><p>See <a href="https://example.com">docs</a></p>',
+            "parent_path": "",
+        }, headers={
+            "Authorization": f"Bearer {auth_token}"
+        })
+        page_id = resp.json()["id"]
+
+        while await process_batch():
+            pass
+
+        result = await db_session.execute(
+            text("SELECT plain_text, outline, links FROM public.page_derived WHERE page_id = :pid"),
+            {"pid": page_id},
+        )
+        plain_text, outline, links = result.one()
+        assert "See docs" in plain_text
+        assert outline == [{"level": 2, "text": "Setup"}]
+        assert links[0]["href"] == "https://example.com"
+
+    async def test_failing_events_are_dead_lettered(self, db_session, monkeypatch):
+        """Events of a room that keeps failing are retried with a count, then moved out of the queue."""
+        async def broken(db, tenant, events):
+            raise RuntimeError("index unavailable")
+
+        monkeypatch.setattr(indexing, "_process_tenant", broken)
+        await db_session.execute(text("DELETE FROM public.page_events"))
+        await db_session.execute(text(
+            "INSERT INTO public.page_events (tenant, page_id, kind, attempts) "
+            "VALUES ('public', 424242, 'changed', 0), ('public', 424243, 'changed', :last)"
+        ), {"last": indexing.MAX_ATTEMPTS - 1})
+        await db_session.commit()
+
+        assert await process_batch() == 2
+        queued = await db_session.execute(text("SELECT page_id, attempts FROM public.page_events"))
+        assert [tuple(r) for r in queued] == [(424242, 1)]
+        failed = await db_session.execute(text(
+            "SELECT attempts, error FROM public.page_events_failed WHERE page_id = 424243"
+        ))
+        attempts, error = failed.one()
+        assert attempts == indexing.MAX_ATTEMPTS
+        assert "index unavailable" in error
+        await db_session.execute(text("DELETE FROM public.page_events"))
+        await db_session.commit()
+
+    async def test_media_refcount_follows_page_content(self, client: AsyncClient, auth_token: str, db_session):
+        """Content-addressed media is reference-counted from saved pages."""
+        sha256 = "ab" * 32
+        await db_session.execute(text(
+            "INSERT INTO public.media_objects (sha256, size, status, refcount) VALUES (:h, 3, 'ready', 0)"
+        ), {"h": sha256})
+        await db_session.commit()
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        resp = await client.post("/api/v1/pages/", json={
+            "title": "Media Page",
+            "slug": "media-page",
+            "content": f'<img src="http://minio/wiki-media/cas/ab/{sha256}?X-Amz-Expires=1">',
+            "parent_path": "",
+        }, headers=headers)
+        page_id = resp.json()["id"]
+
+        async def refcount():
+            while await process_batch():
+                pass
+            result = await db_session.execute(
+                text("SELECT refcount FROM public.media_objects WHERE sha256 = :h"), {"h": sha256}
+            )
+            return result.scalar()
+
+        assert await refcount() == 1
+        await client.delete(f"/api/v1/pages/{page_id}", headers=headers)
+        assert await refcount() == 0
+
+    async def test_room_stats_follow_page_writes(self, client: AsyncClient, auth_token: str, db_session):
+        """Page writes keep the room's running totals in step with its pages."""
+        async def totals():
+            result = await db_session.execute(text(
+                "SELECT pages, content_bytes, versions FROM public.room_stats WHERE room_name = 'public'"
+            ))
+            row = result.first()
+            await db_session.commit()
+            return tuple(row) if row else (0, 0, 0)
+
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        pages, size, versions = await totals()
+        resp = await client.post("/api/v1/pages/", json={
+            "title": "Stats Page", "slug": "stats-page", "content": "абв", "parent_path": "",
+        }, headers=headers)
+        page_id = resp.json()["id"]
+        assert await totals() == (pages + 1, size + 6, versions)
+
+        await client.put(f"/api/v1/pages/{page_id}", json={"content": "abcd"}, headers=headers)
+        assert await totals() == (pages + 1, size + 4, versions + 1)
+
+        await client.delete(f"/api/v1/pages/{page_id}", headers=headers)
+        assert await totals() == (pages, size, versions + 1)
+
+    async def test_clone_subtree(self, client: AsyncClient, auth_token: str, db_session):
+        """Cloning copies the whole subtree under a new root, renaming taken slugs."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        resp = await client.post("/api/v1/pages/", json={
+            "title": "Template", "slug": "tpl", "content": "root", "parent_path": "",
+        }, headers=headers)
+        root_id = resp.json()["id"]
+        await client.post("/api/v1/pages/", json={
+            "title": "Step", "slug": "tpl-step", "content": "child", "parent_path": "tpl",
+        }, headers=headers)
+
+        resp = await client.post(f"/api/v1/pages/{root_id}/clone", json={}, headers=headers)
+        assert resp.status_code == 201
+        copy = resp.json()
+        assert copy["copied"] == 2
+        assert copy["slug"] == "tpl-copy"
+
+        result = await db_session.execute(text(
+            "SELECT slug, path::text FROM public.pages WHERE path <@ 'tpl_copy' ORDER BY path"
+        ))
+        assert [tuple(r) for r in result] == [("tpl-copy", "tpl_copy"), ("tpl-step-copy", "tpl_copy.tpl_step_copy")]
+
+        resp = await client.post(f"/api/v1/pages/{root_id}/clone", json={"slug": "tpl-copy"}, headers=headers)
+        assert resp.status_code == 400
+
+    async def test_move_cloned_child(self, client: AsyncClient, auth_token: str, db_session):
+        """Copies get path labels from their new slugs, so they move like any other page."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        resp = await client.post("/api/v1/pages/", json={
+            "title": "Template", "slug": "mvt", "content": "", "parent_path": "",
+        }, headers=headers)
+        root_id = resp.json()["id"]
+        for slug, parent in [("mvt-step", "mvt"), ("mvt-step-detail", "mvt.mvt_step")]:
+            await client.post("/api/v1/pages/", json={
+                "title": slug, "slug": slug, "content": "", "parent_path": parent,
+            }, headers=headers)
+        resp = await client.post(f"/api/v1/pages/{root_id}/clone", json={}, headers=headers)
+        assert resp.status_code == 201
+
+        async def paths(root: str) -> list[tuple]:
+            result = await db_session.execute(text(
+                "SELECT slug, path::text FROM public.pages WHERE path <@ CAST(:root AS ltree) ORDER BY path"
+            ), {"root": root})
+            rows = [tuple(r) for r in result]
+            await db_session.commit()
+            return rows
+
+        assert await paths("mvt_copy") == [
+            ("mvt-copy", "mvt_copy"),
+            ("mvt-step-copy", "mvt_copy.mvt_step_copy"),
+            ("mvt-step-detail-copy", "mvt_copy.mvt_step_copy.mvt_step_detail_copy"),
+        ]
+
+        resp = await client.get("/api/v1/pages/by-slug/mvt-step-copy", headers=headers)
+        child_id = resp.json()["id"]
+        resp = await client.put(f"/api/v1/pages/{child_id}", json={"parent_path": ""}, headers=headers)
+        assert resp.status_code == 200
+        assert await paths("mvt_step_copy") == [
+            ("mvt-step-copy", "mvt_step_copy"),
+            ("mvt-step-detail-copy", "mvt_step_copy.mvt_step_detail_copy"),
+        ]
+        assert await paths("mvt_copy") == [("mvt-copy", "mvt_copy")]
+        assert await paths("mvt") == [
+            ("mvt", "mvt"), ("mvt-step", "mvt.mvt_step"), ("mvt-step-detail", "mvt.mvt_step.mvt_step_detail"),
+        ]
+
     async def test_health_check(self, client: AsyncClient):
         """GET /health returns ok."""
         resp = await client.get("/health")
         assert resp.status_code == 200
         assert resp.json()["status"] == "ok"
+        assert resp.json()["storage"]["state"] == "closed"
@@ -0,0 +1,131 @@
+import io
+import json
+import zipfile
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from app.services import room_transfer
+
+ROOMS = ("rt_src", "rt_dst", "rt_bad")
+
+
+@pytest.mark.asyncio
+class TestRoomTransfer:
+    @pytest_asyncio.fixture(autouse=True)
+    async def rooms(self, client: AsyncClient, auth_token: str, db_session):
+        for room in ROOMS:
+            await db_session.execute(text(f'DROP SCHEMA IF EXISTS "{room}" CASCADE'))
+            for table in ("wiki_rooms", "feedback", "feedback_counters"):
+                column = "name" if table == "wiki_rooms" else "room_name"
+                await db_session.execute(text(f"DELETE FROM {table} WHERE {column} = :r"), {"r": room})
+            await db_session.execute(text("DELETE FROM public.page_events WHERE tenant = :r"), {"r": room})
+        await db_session.commit()
+        self.headers = {"Authorization": f"Bearer {auth_token}"}
+        for room in ROOMS:
+            resp = await client.post("/api/v1/admin/rooms", json={"name": room, "display_name": room},
+                                     headers=self.headers)
+            assert resp.status_code == 200
+
+    async def _rows(self, db_session, sql: str, **params) -> list[tuple]:
+        result = await db_session.execute(text(sql), params)
+        rows = [tuple(r) for r in result]
+        await db_session.commit()
+        return rows
+
+    async def _import(self, client: AsyncClient, room: str, body: bytes, name: str = "room.ndjson"):
+        return await client.post(f"/api/v1/admin/rooms/{room}/import", files={"file": (name, body)},
+                                 headers=self.headers)
+
+    async def test_round_trip(self, client: AsyncClient, db_session):
+        """Pages keep their tree, versions their page and feedback its messages."""
+        room_headers = {**self.headers, "X-Tenant-ID": "rt_src"}
+        for slug, parent in [("rt-guide", ""), ("rt-install", "rt_guide"), ("rt-linux", "rt_guide.rt_install")]:
+            resp = await client.post("/api/v1/pages/", json={
+                "title": slug, "slug": slug, "content": f"<p>{slug}</p>", "parent_path": parent,
+            }, headers=room_headers)
+            assert resp.status_code == 200
+            if slug == "rt-install":
+                await client.put(f"/api/v1/pages/{resp.json()['id']}", json={"content": "<p>v2</p>"},
+                                 headers=room_headers)
+        await db_session.execute(text(
+            "INSERT INTO feedback (room_name, text, author_name, author_org, created_at) VALUES "
+            "('rt_src', 'Спасибо', 'Ann', 'Org', '2026-01-02T10:00:00+00:00'), "
+            "('rt_src', 'Ещё', '', '', '2026-01-03T10:00:00+00:00')"
+        ))
+        await db_session.commit()
+
+        resp = await client.get("/api/v1/admin/rooms/rt_src/export", params={"format": "ndjson"},
+                                headers=self.headers)
+        types = [json.loads(line)["type"] for line in resp.text.splitlines()]
+        assert types == ["room", "page", "page", "page", "version", "feedback", "feedback"]
+
+        resp = await client.get("/api/v1/admin/rooms/rt_src/export", params={"format": "zip"}, headers=self.headers)
+        body = resp.content
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        assert archive.namelist() == ["room.ndjson", "pages.ndjson", "versions.ndjson", "feedback.ndjson"]
+
+        resp = await self._import(client, "rt_dst", body, "room.zip")
+        assert resp.status_code == 200
+        assert resp.json()["pages"] == 3
+        assert resp.json()["versions"] == 1
+        assert resp.json()["feedback"] == 2
+
+        tree = 'SELECT slug, path::text, content FROM "{}".pages ORDER BY path'
+        assert await self._rows(db_session, tree.format("rt_dst")) == await self._rows(db_session, tree.format("rt_src"))
+        assert await self._rows(db_session, tree.format("rt_dst")) == [
+            ("rt-guide", "rt_guide", "<p>rt-guide</p>"),
+            ("rt-install", "rt_guide.rt_install", "<p>v2</p>"),
+            ("rt-linux", "rt_guide.rt_install.rt_linux", "<p>rt-linux</p>"),
+        ]
+        assert await self._rows(
+            db_session,
+            'SELECT p.slug, v.content FROM "rt_dst".page_versions v JOIN "rt_dst".pages p ON p.id = v.page_id',
+        ) == [("rt-install", "<p>rt-install</p>")]
+        feedback = "SELECT text, author_name, author_org, created_at FROM feedback WHERE room_name = :r ORDER BY id"
+        assert await self._rows(db_session, feedback, r="rt_dst") == await self._rows(db_session, feedback, r="rt_src")
+        assert await self._rows(db_session, "SELECT count FROM feedback_counters WHERE room_name = 'rt_dst'") == [(2,)]
+
+        resp = await self._import(client, "rt_dst", body, "room.zip")
+        assert resp.status_code == 409
+
+    async def test_malformed_stream_leaves_room_empty(self, client: AsyncClient, db_session, monkeypatch):
+        """A bad line after rows were already copied rolls the whole import back."""
+        monkeypatch.setattr(room_transfer, "IMPORT_BATCH", 2)
+        room = json.dumps({"type": "room", "format": room_transfer.FORMAT_VERSION, "name": "x"})
+        pages = [
+            json.dumps({"type": "page", "id": 1, "title": "A", "slug": "a", "path": "a"}),
+            json.dumps({"type": "page", "id": 2, "title": "B", "slug": "b", "path": "a.b"}),
+            json.dumps({"type": "page", "id": 3, "title": "C", "slug": "c", "path": "a.c"}),
+        ]
+        feedback = json.dumps({"type": "feedback", "id": 1, "text": "hi"})
+        indexes = "SELECT count(*) FROM pg_indexes WHERE schemaname = 'rt_bad'"
+        before = await self._rows(db_session, indexes)
+
+        async def assert_empty():
+            assert await self._rows(db_session, 'SELECT count(*) FROM "rt_bad".pages') == [(0,)]
+            assert await self._rows(db_session, "SELECT count(*) FROM feedback WHERE room_name = 'rt_bad'") == [(0,)]
+            assert await self._rows(
+                db_session, "SELECT count(*) FROM public.page_events WHERE tenant = 'rt_bad'"
+            ) == [(0,)]
+            assert await self._rows(db_session, indexes) == before
+
+        broken = "\n".join([room, *pages, feedback, "{not json"]).encode()
+        resp = await self._import(client, "rt_bad", broken)
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "Line 6: invalid JSON"
+        await assert_empty()
+
+        orphan = json.dumps({"type": "page", "id": 4, "title": "D", "slug": "d", "path": "missing.d"})
+        resp = await self._import(client, "rt_bad", "\n".join([room, *pages, orphan]).encode())
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "Parent page missing for path: missing.d"
+        await assert_empty()
+
+        resp = await self._import(client, "rt_bad", "\n".join([room, *pages, feedback]).encode())
+        assert resp.status_code == 200
+        assert await self._rows(db_session, 'SELECT path::text FROM "rt_bad".pages ORDER BY path') == [
+            ("a",), ("a.b",), ("a.c",),
+        ]
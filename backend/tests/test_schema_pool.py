@@ -0,0 +1,93 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.services import schema_pool
+
+
+async def _schema_exists(db, name: str) -> bool:
+    result = await db.execute(text("SELECT to_regnamespace(:n) IS NOT NULL"), {"n": f'"{name}"'})
+    return result.scalar()
+
+
+async def _spares(db) -> list[str]:
+    result = await db.execute(text("SELECT name FROM public.spare_schemas ORDER BY created_at"))
+    return [row[0] for row in result]
+
+
+@pytest.mark.asyncio
+class TestSchemaPool:
+    @pytest_asyncio.fixture(autouse=True)
+    async def empty_pool(self, db_session, monkeypatch):
+        monkeypatch.setattr(settings, "SCHEMA_POOL_SIZE", 2)
+        yield
+        for name in await _spares(db_session) + ["pool_room_a", "pool_room_b", "pool_room_c"]:
+            await db_session.execute(text(f'DROP SCHEMA IF EXISTS "{name}" CASCADE'))
+        await db_session.execute(text("DELETE FROM public.spare_schemas"))
+        await db_session.commit()
+
+    async def test_claim_renames_a_spare(self, db_session):
+        """A claimed spare becomes the room's schema, with its tables, when the caller commits."""
+        assert await schema_pool.refill() == 2
+        assert await schema_pool.refill() == 0
+        spares = await _spares(db_session)
+        await db_session.commit()
+
+        async with async_session_maker() as db:
+            assert await schema_pool.claim(db, "pool_room_a")
+            await db.commit()
+        assert not await _schema_exists(db_session, spares[0])
+        pages = await db_session.execute(text("SELECT to_regclass('\"pool_room_a\".pages') IS NOT NULL"))
+        assert pages.scalar()
+        assert await _spares(db_session) == spares[1:]
+        await db_session.commit()
+
+    async def test_rollback_returns_the_spare(self, db_session):
+        await schema_pool.refill()
+        spares = await _spares(db_session)
+        await db_session.commit()
+
+        async with async_session_maker() as db:
+            assert await schema_pool.claim(db, "pool_room_a")
+            await db.rollback()
+        assert await _spares(db_session) == spares
+        assert not await _schema_exists(db_session, "pool_room_a")
+        await db_session.commit()
+
+    async def test_concurrent_claims_take_different_spares(self, db_session):
+        """SKIP LOCKED hands an open claim's spare to nobody else; an empty pool says False."""
+        await schema_pool.refill()
+        async with async_session_maker() as first, async_session_maker() as second, \
+                async_session_maker() as third:
+            assert await schema_pool.claim(first, "pool_room_a")
+            assert await schema_pool.claim(second, "pool_room_b")
+            assert not await schema_pool.claim(third, "pool_room_c")
+            await first.commit()
+            await second.commit()
+        assert await _schema_exists(db_session, "pool_room_a")
+        assert await _schema_exists(db_session, "pool_room_b")
+        assert await _spares(db_session) == []
+        await db_session.commit()
+
+    async def test_existing_schema_and_stale_spares_are_not_claimed(self, db_session, monkeypatch):
+        await schema_pool.refill()
+        await db_session.execute(text('CREATE SCHEMA "pool_room_a"'))
+        await db_session.commit()
+        async with async_session_maker() as db:
+            assert not await schema_pool.claim(db, "pool_room_a")
+            await db.rollback()
+
+        stale = await _spares(db_session)
+        await db_session.commit()
+        monkeypatch.setattr(schema_pool, "TENANT_TABLES_VERSION", schema_pool.TENANT_TABLES_VERSION + 1)
+        async with async_session_maker() as db:
+            assert not await schema_pool.claim(db, "pool_room_b")
+            await db.rollback()
+
+        # The next refill replaces the outdated spares.
+        assert await schema_pool.refill() == 2
+        assert not set(await _spares(db_session)) & set(stale)
+        assert not any([await _schema_exists(db_session, name) for name in stale])
+        await db_session.commit()
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.services import suggest
+from app.services.bm25 import BM25SearchBackend, TenantIndex
+from app.services.search import PostgresSearchBackend, SearchBackend
+from app.services.search_cache import SearchCache
+
+
+@pytest.mark.asyncio
+class TestSearch:
+    async def test_suggest_prefix_and_typo(self, client: AsyncClient, auth_token: str):
+        """GET /search/suggest matches title prefixes and tolerates typos."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        await client.post("/api/v1/pages/", json={
+            "title": "Deployment Guide",
+            "slug": "deployment-guide",
+            "content": "",
+            "parent_path": "",
+        }, headers=headers)
+
+        resp = await client.get("/api/v1/search/suggest", params={"q": "deploy"}, headers=headers)
+        assert resp.status_code == 200
+        assert "deployment-guide" in [r["slug"] for r in resp.json()["results"]]
+
+        resp = await client.get("/api/v1/search/suggest", params={"q": "guied"}, headers=headers)
+        assert resp.status_code == 200
+        assert "deployment-guide" in [r["slug"] for r in resp.json()["results"]]
+
+    async def test_suggest_reflects_delete(self, client: AsyncClient, auth_token: str):
+        """Deleted pages disappear from suggestions without a rebuild."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        create_resp = await client.post("/api/v1/pages/", json={
+            "title": "Ephemeral Notes",
+            "slug": "ephemeral-notes",
+            "content": "",
+            "parent_path": "",
+        }, headers=headers)
+        page_id = create_resp.json()["id"]
+
+        resp = await client.get("/api/v1/search/suggest", params={"q": "ephem"}, headers=headers)
+        assert page_id in [r["id"] for r in resp.json()["results"]]
+
+        await client.delete(f"/api/v1/pages/{page_id}", headers=headers)
+        resp = await client.get("/api/v1/search/suggest", params={"q": "ephem"}, headers=headers)
+        assert page_id not in [r["id"] for r in resp.json()["results"]]
+
+    async def test_suggest_keeps_changes_noted_during_build(self):
+        """Pages saved or deleted while the index is being built end up in it; the lock is released."""
+        suggest.invalidate("public")
+        build = asyncio.create_task(suggest.get_index("public"))
+        await asyncio.sleep(0)  # the build is now waiting on the database
+        suggest.note_page_saved("public", -1, "Okapi Handbook", "okapi-handbook", "okapi_handbook")
+        suggest.note_page_saved("public", -2, "Okapi Draft", "okapi-draft", "okapi_draft")
+        suggest.note_page_deleted("public", -2)
+        index = await build
+
+        assert [s["id"] for s in index.suggest("okapi")] == [-1]
+        assert await suggest.get_index("public") is index
+        assert "public" not in suggest._build_locks
+        suggest.invalidate("public")
+
+    async def test_suggest_discards_build_invalidated_meanwhile(self):
+        """A build whose snapshot predates an invalidation is not kept."""
+        suggest.invalidate("public")
+        build = asyncio.create_task(suggest.get_index("public"))
+        await asyncio.sleep(0)
+        suggest.invalidate("public")
+        await build
+        assert "public" not in suggest._indexes
+
+    async def test_search_cache_invalidated_by_page_write(self, client: AsyncClient, auth_token: str):
+        """A cached search result is not served after a page write in the same room."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        resp = await client.get("/api/v1/search/", params={"q": "Zanzibar"}, headers=headers)
+        assert resp.status_code == 200
+        assert "zanzibar-runbook" not in [r["slug"] for r in resp.json()["results"]]
+
+        await client.post("/api/v1/pages/", json={
+            "title": "Zanzibar Runbook",
+            "slug": "zanzibar-runbook",
+            "content": "",
+            "parent_path": "",
+        }, headers=headers)
+
+        resp = await client.get("/api/v1/search/", params={"q": "zanzibar"}, headers=headers)
+        assert "zanzibar-runbook" in [r["slug"] for r in resp.json()["results"]]
+
+    async def test_search_cache_flood_evicts_only_its_room(self):
+        """Filling the global entry cap from one room leaves other rooms' entries alone."""
+        cache = SearchCache(max_entries=10, tenant_max_bytes=1 << 20, ttl=60)
+        cache.put("quiet", "kept", 1, 0, [])
+        for i in range(50):
+            cache.put("busy", f"query {i}", 1, 0, [])
+
+        assert cache.get("quiet", "kept", 1) == []
+        assert cache.stats()["entries"] == 10
+
+    async def test_bm25_backend_incremental_updates(self, client: AsyncClient, auth_token: str, db_session, tmp_path):
+        """The embedded BM25 backend builds from the pages table and follows later writes."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        await client.post("/api/v1/pages/", json={
+            "title": "Kubernetes Ingress",
+            "slug": "k8s-ingress",
+            "content": "<p>Configure the ingress controller for the cluster.</p>",
+            "parent_path": "",
+        }, headers=headers)
+
+        backend = BM25SearchBackend(tmp_path)
+        results = await backend.search(db_session, "public", "ingress controller")
+        assert results[0]["slug"] == "k8s-ingress"
+        assert "<mark>" in results[0]["headline"]
+
+        page_id = results[0]["id"]
+        await backend.index_page("public", page_id, "Kubernetes Ingress", "k8s-ingress", "k8s_ingress",
+                                 "<p>Moved to the gateway API.</p>")
+        assert await backend.search(db_session, "public", "controller") == []
+        assert (await backend.search(db_session, "public", "gateway"))[0]["id"] == page_id
+
+        await backend.remove_page("public", page_id)
+        assert await backend.search(db_session, "public", "gateway") == []
+
+    async def test_bm25_keeps_writes_made_during_a_build(self, tmp_path):
+        """Writes that land between reading the pages and writing the index are not lost."""
+        index = TenantIndex(tmp_path / "room")
+        pending = index.begin_build()
+        # Snapshot already read; these writes happen before the index exists.
+        index.write({"op": "put", "id": 2, "title": "Walrus", "slug": "walrus", "path": "walrus", "text": ""})
+        index.write({"op": "del", "id": 1})
+        index.build([{"id": 1, "title": "Narwhal", "slug": "narwhal", "path": "narwhal", "text": ""}], pending)
+
+        assert [r["id"] for r in index.search("walrus", 10, 0)] == [2]
+        assert index.search("narwhal", 10, 0) == []
+        assert not pending.exists()
+
+    async def test_postgres_backend_ranks_title_matches_first(self, client: AsyncClient, auth_token: str, db_session):
+        """The Postgres backend ranks a title match above a content-only match and marks the headline."""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        await client.post("/api/v1/pages/", json={
+            "title": "Quokka Notes", "slug": "quokka-notes", "content": "", "parent_path": "",
+        }, headers=headers)
+        await client.post("/api/v1/pages/", json={
+            "title": "Field Trip", "slug": "field-trip", "content": "We saw a quokka at dawn.", "parent_path": "",
+        }, headers=headers)
+
+        results = await PostgresSearchBackend().search(db_session, "public", "quokka")
+        slugs = [r["slug"] for r in results]
+        assert slugs.index("quokka-notes") < slugs.index("field-trip")
+        assert "<mark>quokka</mark>" in results[slugs.index("field-trip")]["headline"]
+
+    async def test_backend_interface_requires_search(self):
+        """A backend without ``search`` cannot be instantiated."""
+        class Incomplete(SearchBackend):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
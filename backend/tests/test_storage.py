@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from app.services import storage
+from app.services.local_storage import LocalStorageBackend
+
+
+def _client_error(code: str, status: int) -> ClientError:
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+class TestStorage:
+    def test_one_client_per_process(self, monkeypatch):
+        """Threads racing for the S3 client all get the same instance."""
+        monkeypatch.setattr(storage, "_client", None)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: storage.get_s3_client(), range(32)))
+        assert all(c is clients[0] for c in clients)
+        assert clients[0].meta.config.max_pool_connections == storage.settings.S3_MAX_POOL_CONNECTIONS
+
+    def test_bucket_checked_once(self, monkeypatch):
+        """ensure_bucket asks S3 once and then trusts its cache."""
+        calls = []
+        monkeypatch.setattr(storage, "_ready_buckets", set())
+        monkeypatch.setattr(storage, "_s3", lambda operation, **params: calls.append(operation))
+        storage.ensure_bucket("media-test")
+        storage.ensure_bucket("media-test")
+        assert calls == ["head_bucket"]
+
+    def test_backend_interface_is_abstract(self, tmp_path):
+        """Backends must implement every storage operation; the local one does."""
+        class PutOnly(storage.StorageBackend):
+            def put(self, object_key, body, content_type, cache_control=None):
+                pass
+
+        with pytest.raises(TypeError):
+            PutOnly()
+        assert isinstance(LocalStorageBackend(tmp_path), storage.StorageBackend)
+
+    def test_transient_errors_are_retried(self, monkeypatch):
+        """Transient failures are retried; other errors surface at once and don't trip the breaker."""
+        monkeypatch.setattr(storage, "breaker", storage.CircuitBreaker(threshold=3, reset_timeout=30))
+        monkeypatch.setattr(storage.time, "sleep", lambda seconds: None)
+        monkeypatch.setattr(storage.settings, "S3_MAX_ATTEMPTS", 3)
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise _client_error("SlowDown", 503)
+            return "ok"
+
+        assert storage._call(flaky) == "ok"
+        assert len(calls) == 3
+
+        def missing():
+            calls.append(1)
+            raise _client_error("NoSuchKey", 404)
+
+        calls.clear()
+        with pytest.raises(ClientError):
+            storage._call(missing)
+        assert len(calls) == 1
+        assert storage.breaker.snapshot()["state"] == storage.CircuitBreaker.CLOSED
+
+    def test_breaker_opens_and_probes(self, monkeypatch):
+        """Repeated failures open the breaker; after the timeout one probe decides."""
+        clock = {"now": 1000.0}
+        monkeypatch.setattr(storage.time, "monotonic", lambda: clock["now"])
+        monkeypatch.setattr(storage.time, "sleep", lambda seconds: None)
+        monkeypatch.setattr(storage.settings, "S3_MAX_ATTEMPTS", 1)
+        monkeypatch.setattr(storage, "breaker", storage.CircuitBreaker(threshold=2, reset_timeout=30))
+        calls = []
+
+        def down():
+            calls.append(1)
+            raise EndpointConnectionError(endpoint_url="http://minio:9000")
+
+        for _ in range(2):
+            with pytest.raises(storage.StorageUnavailable):
+                storage._call(down)
+        assert storage.breaker.snapshot()["state"] == storage.CircuitBreaker.OPEN
+        with pytest.raises(storage.StorageUnavailable) as exc:
+            storage._call(down)
+        assert len(calls) == 2  # failed fast without calling storage
+        assert exc.value.retry_after >= 30
+
+        clock["now"] += 31
+        assert storage.breaker.available
+        assert storage._call(lambda: "up") == "up"
+        assert storage.breaker.snapshot()["state"] == storage.CircuitBreaker.CLOSED
+
+    def test_failed_probe_reopens(self, monkeypatch):
+        clock = {"now": 1000.0}
+        monkeypatch.setattr(storage.time, "monotonic", lambda: clock["now"])
+        breaker = storage.CircuitBreaker(threshold=1, reset_timeout=10)
+        breaker.before_call()
+        breaker.record_failure(RuntimeError("down"))
+        clock["now"] += 11
+        breaker.before_call()  # the probe
+        with pytest.raises(storage.StorageUnavailable):
+            breaker.before_call()  # only one probe at a time
+        breaker.record_failure(RuntimeError("still down"))
+        assert breaker.snapshot()["state"] == storage.CircuitBreaker.OPEN
+        assert not breaker.available
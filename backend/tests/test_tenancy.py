@@ -0,0 +1,156 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import async_session_maker
+from app.db.tenancy import SHARED_SCHEMA, current_room, set_tenant_schema, tenant_tables_ddl, use_all_rooms
+from app.services import indexing, shared_tenancy
+
+# RLS does not apply to superusers, so isolation is checked as a plain role.
+PLAIN_ROLE = "wiki_rls_test"
+
+
+async def _shared_pages(room: str) -> list[str]:
+    async with async_session_maker() as db:
+        await use_all_rooms(db)
+        result = await db.execute(text(
+            f"SELECT slug FROM {SHARED_SCHEMA}.pages WHERE room_name = :room ORDER BY slug"
+        ), {"room": room})
+        return [row[0] for row in result]
+
+
+async def _use_plain_role(db) -> bool:
+    """Switch the session to a role RLS applies to, if it is not one; True if switched."""
+    result = await db.execute(text(
+        "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+    ))
+    if not result.scalar():
+        return False
+    await db.execute(text(
+        f"DO $$ BEGIN CREATE ROLE {PLAIN_ROLE} NOLOGIN; "
+        "EXCEPTION WHEN duplicate_object THEN NULL; END $$"
+    ))
+    await db.execute(text(f"GRANT USAGE ON SCHEMA {SHARED_SCHEMA}, public TO {PLAIN_ROLE}"))
+    await db.execute(text(f"GRANT SELECT, INSERT ON ALL TABLES IN SCHEMA {SHARED_SCHEMA} TO {PLAIN_ROLE}"))
+    await db.execute(text(f"GRANT USAGE ON ALL SEQUENCES IN SCHEMA public TO {PLAIN_ROLE}"))
+    await db.execute(text(f"SET ROLE {PLAIN_ROLE}"))
+    return True
+
+
+@pytest.mark.asyncio
+class TestSharedTenancy:
+    @pytest_asyncio.fixture(autouse=True)
+    async def shared_tables(self, db_session, monkeypatch):
+        monkeypatch.setattr(settings, "TENANCY_MODE", "shared")
+        async with async_session_maker() as db:
+            await shared_tenancy.ensure_tables(db)
+        yield
+        await db_session.execute(text(f"DROP SCHEMA IF EXISTS {SHARED_SCHEMA} CASCADE"))
+        await db_session.execute(text('DROP SCHEMA IF EXISTS "mig_room" CASCADE'))
+        await db_session.execute(text("DELETE FROM wiki_rooms WHERE name = 'mig_room'"))
+        await db_session.execute(text(
+            f"DO $$ BEGIN IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{PLAIN_ROLE}') THEN "
+            f"DROP OWNED BY {PLAIN_ROLE}; DROP ROLE {PLAIN_ROLE}; END IF; END $$"
+        ))
+        await db_session.commit()
+
+    async def test_room_isolation_survives_commit(self, db_session):
+        """After a commit the next transaction still sees only the session's room."""
+        await use_all_rooms(db_session)
+        await db_session.execute(text(
+            f"INSERT INTO {SHARED_SCHEMA}.pages (room_name, title, slug, path) VALUES "
+            "('rls_a', 'A', 'rls-a', 'rls_a'), ('rls_b', 'B', 'rls-b', 'rls_b')"
+        ))
+        await db_session.commit()
+
+        bypass = await _use_plain_role(db_session)
+
+        assert not await set_tenant_schema(db_session, "rls_a")
+        assert current_room(db_session) == "rls_a"
+        for _ in range(2):
+            result = await db_session.execute(text("SELECT slug FROM pages ORDER BY slug"))
+            assert [row[0] for row in result] == ["rls-a"]
+            await db_session.commit()
+
+        # New rows default to the session's room; another room's rows are refused.
+        await db_session.execute(text("INSERT INTO pages (title, slug, path) VALUES ('A2', 'rls-a2', 'rls_a2')"))
+        await db_session.commit()
+        with pytest.raises(Exception, match="row-level security"):
+            await db_session.execute(text(
+                "INSERT INTO pages (room_name, title, slug, path) VALUES ('rls_b', 'B2', 'rls-b2', 'rls_b2')"
+            ))
+        await db_session.rollback()
+        if bypass:
+            await db_session.execute(text("RESET ROLE"))
+            await db_session.commit()
+        assert await _shared_pages("rls_a") == ["rls-a", "rls-a2"]
+        assert await _shared_pages("rls_b") == ["rls-b"]
+
+    async def test_superuser_role_is_refused(self, db_session):
+        """Startup stops in shared mode unless RLS applies to the API's role."""
+        result = await db_session.execute(text(
+            "SELECT rolsuper OR rolbypassrls FROM pg_roles WHERE rolname = current_user"
+        ))
+        if result.scalar():
+            with pytest.raises(RuntimeError, match="row-level security"):
+                await shared_tenancy.check_app_role(db_session)
+        switched = await _use_plain_role(db_session)
+        await shared_tenancy.check_app_role(db_session)
+        if switched:
+            await db_session.execute(text("RESET ROLE"))
+        await db_session.commit()
+
+    async def _own_schema_room(self, db_session) -> int:
+        await db_session.execute(text('CREATE SCHEMA "mig_room"'))
+        for ddl in tenant_tables_ddl("mig_room"):
+            await db_session.execute(text(ddl))
+        result = await db_session.execute(text(
+            "INSERT INTO \"mig_room\".pages (title, slug, content, path) "
+            "VALUES ('Mig', 'mig-page', '<p>moved</p>', 'mig_page') RETURNING id"
+        ))
+        page_id = result.scalar()
+        await db_session.commit()
+        return page_id
+
+    async def test_migrate_room_is_idempotent(self, db_session):
+        page_id = await self._own_schema_room(db_session)
+
+        assert await shared_tenancy.migrate_room("mig_room") == {"pages": 1, "page_versions": 0, "page_derived": 0}
+        assert await _shared_pages("mig_room") == ["mig-page"]
+        assert await shared_tenancy.migrate_room("mig_room") == {}
+
+        # A schema brought back with rows that were already copied copies nothing twice.
+        await db_session.execute(text('CREATE SCHEMA "mig_room"'))
+        await db_session.execute(text('CREATE TABLE "mig_room".pages (LIKE public.pages INCLUDING ALL)'))
+        await db_session.execute(text(
+            "INSERT INTO \"mig_room\".pages (id, title, slug, content, path) "
+            "VALUES (:id, 'Mig', 'mig-page', '', 'mig_page')"
+        ), {"id": page_id})
+        await db_session.commit()
+        assert await shared_tenancy.migrate_room("mig_room") == {"pages": 0}
+        assert await _shared_pages("mig_room") == ["mig-page"]
+        exists = await db_session.execute(text("SELECT to_regnamespace('\"mig_room\"')"))
+        assert exists.scalar() is None
+
+    async def test_indexing_a_migrated_room(self, db_session):
+        """A room without its own schema is indexed into the shared tables."""
+        page_id = await self._own_schema_room(db_session)
+        await db_session.execute(text(
+            "INSERT INTO wiki_rooms (name, display_name) VALUES ('mig_room', 'Mig') ON CONFLICT DO NOTHING"
+        ))
+        await db_session.commit()
+        await shared_tenancy.migrate_room("mig_room")
+
+        async with async_session_maker() as db:
+            await indexing._process_tenant(db, "mig_room", {page_id: indexing.EVENT_CHANGED})
+            await db.commit()
+
+        async with async_session_maker() as db:
+            await use_all_rooms(db)
+            result = await db.execute(text(
+                f"SELECT room_name, plain_text FROM {SHARED_SCHEMA}.page_derived WHERE page_id = :pid"
+            ), {"pid": page_id})
+            assert tuple(result.one()) == ("mig_room", "moved")
+        exists = await db_session.execute(text("SELECT to_regnamespace('\"mig_room\"')"))
+        assert exists.scalar() is None
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Runs once, when the database volume is initialised. Creates the role the
+# API connects as with TENANCY_MODE=shared: POSTGRES_USER is a superuser, and
+# row-level security does not apply to superusers.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE "$APP_DB_USER" LOGIN PASSWORD '$APP_DB_PASSWORD' NOSUPERUSER NOBYPASSRLS;
+    ALTER DATABASE "$POSTGRES_DB" OWNER TO "$APP_DB_USER";
+    ALTER SCHEMA public OWNER TO "$APP_DB_USER";
+    CREATE EXTENSION IF NOT EXISTS ltree;
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EOSQL
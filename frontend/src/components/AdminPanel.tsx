@@ -19,6 +19,15 @@ interface RoomItem {
     public_subtitle: string;
 }
 
+interface RoomStatsItem {
+    name: string;
+    pages: number;
+    content_bytes: number;
+    versions: number;
+    recent_edits: number;
+    recent_feedback: number;
+}
+
 interface FeedbackItem {
     id: number;
     text: string;
@@ -42,8 +51,15 @@ interface UserItem {
 }
 
 const ROLES = ['Owner', 'Admin', 'Editor', 'Viewer'];
+const USERS_PAGE_SIZE = 50;
 const ROLE_COLORS: Record<string, string> = { Owner: 'gold', Admin: 'red', Editor: 'blue', Viewer: 'green' };
 
+const formatBytes = (n: number) => {
+    if (n < 1024) return `${n} Б`;
+    if (n < 1024 * 1024) return `${(n / 1024).toFixed(1)} КБ`;
+    return `${(n / 1024 / 1024).toFixed(1)} МБ`;
+};
+
 const generateSlug = (text: string) => {
     const cyrillicToLatin: Record<string, string> = {
         'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
@@ -86,7 +102,13 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
     const { token } = useAuth();
     const { refreshRooms } = useRoom();
     const [allRooms, setAllRooms] = useState<RoomItem[]>([]);
+    const [roomStats, setRoomStats] = useState<Record<string, RoomStatsItem>>({});
     const [users, setUsers] = useState<UserItem[]>([]);
+    const [usersTotal, setUsersTotal] = useState(0);
+    const [usersPage, setUsersPage] = useState(1);
+    const [usersQuery, setUsersQuery] = useState('');
+    const [usersRoomFilter, setUsersRoomFilter] = useState<string | undefined>(undefined);
+    const [usersRoleFilter, setUsersRoleFilter] = useState<string | undefined>(undefined);
     const [loadingRooms, setLoadingRooms] = useState(false);
     const [loadingUsers, setLoadingUsers] = useState(false);
     const [roomModalOpen, setRoomModalOpen] = useState(false);
@@ -103,14 +125,32 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
     const [feedbackItems, setFeedbackItems] = useState<FeedbackItem[]>([]);
     const [feedbackLoading, setFeedbackLoading] = useState(false);
     const [feedbackRoomName, setFeedbackRoomName] = useState('');
+    const [feedbackSlug, setFeedbackSlug] = useState('');
+    const [feedbackRoom, setFeedbackRoom] = useState('');
+    const [feedbackCursor, setFeedbackCursor] = useState<string | null>(null);
+    const [feedbackLoadingMore, setFeedbackLoadingMore] = useState(false);
 
     const headers: Record<string, string> = { Authorization: `Bearer ${token}`, 'Content-Type': 'application/json' };
 
+    const loadFeedbackPage = async (slug: string, cursor: string | null) => {
+        const params = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const res = await fetch(`${API_BASE_URL}/api/v1/public/${slug}/feedback${params}`, { headers });
+        if (!res.ok) return;
+        const data: { items: FeedbackItem[]; next_cursor: string | null } = await res.json();
+        setFeedbackItems(prev => cursor ? [...prev, ...data.items] : data.items);
+        setFeedbackCursor(data.next_cursor);
+    };
+
     const loadRooms = async () => {
         setLoadingRooms(true);
         try {
             const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms`, { headers });
             if (res.ok) setAllRooms(await res.json());
+            const statsRes = await fetch(`${API_BASE_URL}/api/v1/admin/room-stats`, { headers });
+            if (statsRes.ok) {
+                const items: RoomStatsItem[] = await statsRes.json();
+                setRoomStats(Object.fromEntries(items.map(i => [i.name, i])));
+            }
         } catch { }
         setLoadingRooms(false);
     };
@@ -118,8 +158,16 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
     const loadUsers = async () => {
         setLoadingUsers(true);
         try {
-            const res = await fetch(`${API_BASE_URL}/api/v1/admin/users-with-rooms`, { headers });
-            if (res.ok) setUsers(await res.json());
+            const params = new URLSearchParams({ page: String(usersPage), page_size: String(USERS_PAGE_SIZE) });
+            if (usersQuery) params.set('q', usersQuery);
+            if (usersRoomFilter) params.set('room', usersRoomFilter);
+            if (usersRoleFilter) params.set('role', usersRoleFilter);
+            const res = await fetch(`${API_BASE_URL}/api/v1/admin/users-with-rooms?${params}`, { headers });
+            if (res.ok) {
+                const data: { items: UserItem[]; total: number } = await res.json();
+                setUsers(data.items);
+                setUsersTotal(data.total);
+            }
         } catch { }
         setLoadingUsers(false);
     };
@@ -152,7 +200,8 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
         } catch { }
     };
 
-    useEffect(() => { loadRooms(); loadUsers(); loadDefaultLogo(); loadPages(); }, []);
+    useEffect(() => { loadRooms(); loadDefaultLogo(); loadPages(); }, []);
+    useEffect(() => { loadUsers(); }, [usersPage, usersQuery, usersRoomFilter, usersRoleFilter]);
 
     // ── Room actions ─────────────────────────────────
     const handleCreateRoom = async (values: { name: string; display_name: string }) => {
@@ -176,7 +225,7 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
     const handleDeleteRoom = async (name: string) => {
         try {
             const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms/${name}`, { method: 'DELETE', headers });
-            if (res.ok) { message.success('Продукт удалён'); loadRooms(); loadUsers(); refreshRooms(); }
+            if (res.ok) { message.success('Продукт удалён, данные удаляются в фоне'); loadRooms(); loadUsers(); refreshRooms(); }
             else { const err = await res.json(); message.error(err.detail || 'Ошибка'); }
         } catch { message.error('Ошибка сети'); }
     };
@@ -202,6 +251,48 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
         } catch { message.error('Ошибка сети'); }
     };
 
+    const handleExportRoom = async (roomName: string) => {
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms/${roomName}/export?format=zip`, { headers });
+            if (!res.ok) { const err = await res.json(); message.error(err.detail || 'Ошибка экспорта'); return; }
+            const url = URL.createObjectURL(await res.blob());
+            const a = document.createElement('a');
+            a.href = url;
+            a.download = `room-${roomName}.zip`;
+            a.click();
+            URL.revokeObjectURL(url);
+        } catch { message.error('Ошибка сети'); }
+    };
+
+    const handleExportFeedback = async (roomName: string) => {
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms/${roomName}/feedback/export?format=csv`, { headers });
+            if (!res.ok) { const err = await res.json(); message.error(err.detail || 'Ошибка экспорта'); return; }
+            const url = URL.createObjectURL(await res.blob());
+            const a = document.createElement('a');
+            a.href = url;
+            a.download = `feedback-${roomName}.csv`;
+            a.click();
+            URL.revokeObjectURL(url);
+        } catch { message.error('Ошибка сети'); }
+    };
+
+    const handleImportRoom = async (roomName: string, file: File) => {
+        const formData = new FormData();
+        formData.append('file', file);
+        const hide = message.loading('Импорт...', 0);
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms/${roomName}/import`, {
+                method: 'POST',
+                headers: { Authorization: `Bearer ${token}` },
+                body: formData,
+            });
+            if (res.ok) { const data = await res.json(); message.success(`Импортировано страниц: ${data.pages}`); loadRooms(); }
+            else { const err = await res.json(); message.error(err.detail || 'Ошибка импорта'); }
+        } catch { message.error('Ошибка сети'); }
+        hide();
+    };
+
     const handleUpdateRoom = async (roomName: string, displayName: string) => {
         try {
             const res = await fetch(`${API_BASE_URL}/api/v1/admin/rooms/${roomName}`, {
@@ -536,6 +627,18 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
                                 </Typography.Text>
                             ),
                         },
+                        {
+                            title: 'Размер', key: 'stats', width: 130,
+                            render: (_: any, r: RoomItem) => {
+                                const st = roomStats[r.name];
+                                if (!st) return <Typography.Text type="secondary">—</Typography.Text>;
+                                return (
+                                    <Tooltip title={`Версий: ${st.versions}. За 30 дней: правок ${st.recent_edits}, сообщений ${st.recent_feedback}`}>
+                                        <span>{st.pages} стр. · {formatBytes(st.content_bytes)}</span>
+                                    </Tooltip>
+                                );
+                            },
+                        },
                         {
                             title: 'Сообщения', key: 'feedback', width: 110, align: 'center' as const,
                             render: (_: any, r: RoomItem) => r.public_slug ? (
@@ -543,11 +646,12 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
                                     type="link"
                                     onClick={async () => {
                                         setFeedbackRoomName(r.display_name);
+                                        setFeedbackSlug(r.public_slug!);
+                                        setFeedbackRoom(r.name);
                                         setFeedbackLoading(true);
                                         setFeedbackModalOpen(true);
                                         try {
-                                            const res = await fetch(`${API_BASE_URL}/api/v1/public/${r.public_slug}/feedback`, { headers });
-                                            if (res.ok) setFeedbackItems(await res.json());
+                                            await loadFeedbackPage(r.public_slug!, null);
                                         } catch { }
                                         setFeedbackLoading(false);
                                     }}
@@ -559,11 +663,25 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
                             ),
                         },
                         {
-                            title: '', key: 'actions', width: 60, align: 'center' as const,
+                            title: '', key: 'actions', width: 150, align: 'center' as const,
                             render: (_: any, r: RoomItem) => (
-                                <Popconfirm title="Удалить продукт?" onConfirm={() => handleDeleteRoom(r.name)}>
-                                    <Button danger icon={<Icon name="delete" />} />
-                                </Popconfirm>
+                                <Space size={4}>
+                                    <Tooltip title="Экспорт (ZIP)">
+                                        <Button icon={<Icon name="download" />} onClick={() => handleExportRoom(r.name)} />
+                                    </Tooltip>
+                                    <Upload
+                                        accept=".zip,.ndjson"
+                                        showUploadList={false}
+                                        beforeUpload={(file) => { handleImportRoom(r.name, file); return false; }}
+                                    >
+                                        <Tooltip title="Импорт в пустой продукт">
+                                            <Button icon={<Icon name="upload" />} />
+                                        </Tooltip>
+                                    </Upload>
+                                    <Popconfirm title="Удалить продукт?" onConfirm={() => handleDeleteRoom(r.name)}>
+                                        <Button danger icon={<Icon name="delete" />} />
+                                    </Popconfirm>
+                                </Space>
                             ),
                         },
                     ]}
@@ -584,12 +702,45 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
                         Добавить
                     </Button>
                 </div>
+                <Space style={{ marginBottom: 16 }} wrap>
+                    <Input.Search
+                        placeholder="Поиск по почте"
+                        allowClear
+                        style={{ width: 260 }}
+                        onSearch={(value) => { setUsersPage(1); setUsersQuery(value.trim()); }}
+                    />
+                    <Select
+                        placeholder="Продукт"
+                        allowClear
+                        style={{ width: 200 }}
+                        value={usersRoomFilter}
+                        onChange={(val) => { setUsersPage(1); setUsersRoomFilter(val); }}
+                        options={[
+                            { label: 'Все продукты', value: '__all__' },
+                            ...allRooms.map(r => ({ label: r.display_name, value: r.name })),
+                        ]}
+                    />
+                    <Select
+                        placeholder="Роль"
+                        allowClear
+                        style={{ width: 140 }}
+                        value={usersRoleFilter}
+                        onChange={(val) => { setUsersPage(1); setUsersRoleFilter(val); }}
+                        options={ROLES.map(r => ({ label: r, value: r }))}
+                    />
+                </Space>
                 <Table
                     dataSource={users}
                     rowKey="id"
                     size="middle"
                     loading={loadingUsers}
-                    pagination={false}
+                    pagination={{
+                        current: usersPage,
+                        pageSize: USERS_PAGE_SIZE,
+                        total: usersTotal,
+                        showSizeChanger: false,
+                        onChange: (page) => setUsersPage(page),
+                    }}
                     columns={[
                         {
                             title: 'Почта', dataIndex: 'email', key: 'email', width: 260,
@@ -764,8 +915,28 @@ const AdminPanel: React.FC<{ onClose: () => void }> = ({ onClose }) => {
             <Modal
                 title={`Сообщения — ${feedbackRoomName}`}
                 open={feedbackModalOpen}
-                onCancel={() => { setFeedbackModalOpen(false); setFeedbackItems([]); }}
-                footer={null}
+                onCancel={() => { setFeedbackModalOpen(false); setFeedbackItems([]); setFeedbackCursor(null); }}
+                footer={feedbackItems.length > 0 ? (
+                    <Space>
+                        <Button onClick={() => handleExportFeedback(feedbackRoom)}>
+                            Экспорт CSV
+                        </Button>
+                        {feedbackCursor && (
+                            <Button
+                                loading={feedbackLoadingMore}
+                                onClick={async () => {
+                                    setFeedbackLoadingMore(true);
+                                    try {
+                                        await loadFeedbackPage(feedbackSlug, feedbackCursor);
+                                    } catch { }
+                                    setFeedbackLoadingMore(false);
+                                }}
+                            >
+                                Загрузить ещё
+                            </Button>
+                        )}
+                    </Space>
+                ) : null}
                 width={700}
             >
                 {feedbackLoading ? (
@@ -16,10 +16,12 @@ import { Highlight } from '@tiptap/extension-highlight';
 import { FontFamily } from '@tiptap/extension-font-family';
 import { message, Typography, Spin, theme, Modal, Form, Input, Select, Button } from 'antd';
 import { API_BASE_URL, tenantHeaders } from '../config';
+import { uploadFiles } from '../media';
 import Toolbar from './Toolbar';
 import Icon from './Icon';
 import { useAuth } from '../contexts/AuthContext';
 import { useRoom } from '../contexts/RoomContext';
+import { useQueryClient } from '@tanstack/react-query';
 
 /** Generate a URL-friendly slug from text, with a counter for duplicates */
 const slugify = (text: string): string =>
@@ -53,25 +55,48 @@ interface EditorProps {
     canEdit?: boolean;
 }
 
+const sha256Hex = async (file: File): Promise<string | null> => {
+    // crypto.subtle only exists in secure contexts (https, localhost)
+    if (!window.crypto?.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+};
+
+// Content-addressed upload: identical files are stored once and skipped entirely
+// when the server already has them.
+const uploadByHash = async (file: File, sha256: string, token: string | null, room: string): Promise<string> => {
+    const headers = tenantHeaders(token, room);
+    const res = await fetch(`${API_BASE_URL}/api/v1/media/cas/check`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ sha256, size: file.size, content_type: file.type || null }),
+    });
+    if (!res.ok) throw new Error('cas check failed');
+    const check = await res.json();
+    if (check.exists) return check.download_url;
+
+    const put = await fetch(check.upload_url, {
+        method: 'PUT',
+        body: file,
+        headers: { ...check.headers, 'Content-Type': file.type },
+    });
+    if (!put.ok) throw new Error('upload failed');
+    const commit = await fetch(`${API_BASE_URL}/api/v1/media/cas/commit`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ sha256 }),
+    });
+    if (!commit.ok) throw new Error('cas commit failed');
+    return (await commit.json()).download_url;
+};
+
 const uploadImageToMinIO = async (file: File, token: string | null, room: string): Promise<string | null> => {
     try {
-        const res = await fetch(`${API_BASE_URL}/api/v1/media/upload-url?filename=${encodeURIComponent(file.name)}`, {
-            method: 'POST',
-            headers: tenantHeaders(token, room),
-        });
-        const { upload_url, object_key } = await res.json();
-
-        await fetch(upload_url, {
-            method: 'PUT',
-            body: file,
-            headers: { 'Content-Type': file.type },
-        });
+        const sha256 = await sha256Hex(file);
+        if (sha256) return await uploadByHash(file, sha256, token, room);
 
-        const dlRes = await fetch(`${API_BASE_URL}/api/v1/media/download-url?object_key=${encodeURIComponent(object_key)}`, {
-            headers: tenantHeaders(token, room),
-        });
-        const { download_url } = await dlRes.json();
-        return download_url;
+        const [uploaded] = await uploadFiles([file], token, room);
+        return uploaded.download_url;
     } catch {
         return null;
     }
@@ -79,6 +104,7 @@ const uploadImageToMinIO = async (file: File, token: string | null, room: string
 
 const Editor: React.FC<EditorProps> = ({ pageId, onPageDeleted, canEdit = true }) => {
     const { token: themeToken } = theme.useToken();
+    const queryClient = useQueryClient();
     const { token } = useAuth();
     const { currentRoom } = useRoom();
 
@@ -138,7 +164,12 @@ const Editor: React.FC<EditorProps> = ({ pageId, onPageDeleted, canEdit = true }
                     content: editor?.getHTML() || page.content
                 }),
             });
-            if (res.ok) {
+            if (res.status === 202) {
+                // Large subtree: the move finishes in a background job
+                message.info('Настройки сохранены. Перемещение вложенных страниц выполняется в фоне.');
+                setSettingsOpen(false);
+                loadPage(page.id);
+            } else if (res.ok) {
                 message.success('Настройки страницы обновлены. Требуется обновление дерева.');
                 setSettingsOpen(false);
                 // The tree will be somewhat stale, but next selection or refresh will fix it,
@@ -481,6 +512,27 @@ const Editor: React.FC<EditorProps> = ({ pageId, onPageDeleted, canEdit = true }
         }
     };
 
+    const handleCopy = async () => {
+        if (!page) return;
+        try {
+            const res = await fetch(`${API_BASE_URL}/api/v1/pages/${page.id}/clone`, {
+                method: 'POST',
+                headers: tenantHeaders(token, currentRoom),
+                body: JSON.stringify({}),
+            });
+            if (res.ok) {
+                const data = await res.json();
+                message.success(`Скопировано страниц: ${data.copied}`);
+                queryClient.invalidateQueries({ queryKey: ['pagesTree'] });
+            } else {
+                const err = await res.json().catch(() => ({}));
+                message.error(err.detail || 'Ошибка копирования');
+            }
+        } catch {
+            message.error('Ошибка сети');
+        }
+    };
+
     if (loading) {
         return <div style={{ display: 'flex', justifyContent: 'center', paddingTop: 80 }}><Spin size="large" /></div>;
     }
@@ -499,6 +551,7 @@ const Editor: React.FC<EditorProps> = ({ pageId, onPageDeleted, canEdit = true }
                         onSettings={page ? openSettings : undefined}
                         onSave={page ? handleSave : undefined}
                         onDelete={page ? handleDelete : undefined}
+                        onCopy={page ? handleCopy : undefined}
                         saving={saving}
                     />
                 </div>
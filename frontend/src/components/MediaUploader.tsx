@@ -1,6 +1,9 @@
 import React, { useState } from 'react';
 import { Upload, Button, message } from 'antd';
 import Icon from './Icon';
+import { uploadFiles } from '../media';
+import { useAuth } from '../contexts/AuthContext';
+import { useRoom } from '../contexts/RoomContext';
 
 interface MediaUploaderProps {
     onUploadComplete?: (objectKey: string, downloadUrl: string) => void;
@@ -8,26 +11,13 @@ interface MediaUploaderProps {
 
 const MediaUploader: React.FC<MediaUploaderProps> = ({ onUploadComplete }) => {
     const [uploading, setUploading] = useState(false);
+    const { token } = useAuth();
+    const { currentRoom } = useRoom();
 
     const handleUpload = async (file: File) => {
         setUploading(true);
         try {
-            // Step 1: Get presigned upload URL from backend
-            const res = await fetch(`http://localhost:8000/api/v1/media/upload-url?filename=${encodeURIComponent(file.name)}`, {
-                method: 'POST',
-            });
-            const { upload_url, object_key } = await res.json();
-
-            // Step 2: Upload file directly to MinIO via presigned URL
-            await fetch(upload_url, {
-                method: 'PUT',
-                body: file,
-                headers: { 'Content-Type': file.type },
-            });
-
-            // Step 3: Get download URL
-            const dlRes = await fetch(`http://localhost:8000/api/v1/media/download-url?object_key=${encodeURIComponent(object_key)}`);
-            const { download_url } = await dlRes.json();
+            const [{ object_key, download_url }] = await uploadFiles([file], token, currentRoom);
 
             message.success('Файл загружен!');
             if (onUploadComplete) onUploadComplete(object_key, download_url);
@@ -200,6 +200,8 @@ const PublicView: React.FC<{ slug: string }> = ({ slug }) => {
                 message.success('Сообщение отправлено!');
                 form.resetFields();
                 setFeedbackOpen(false);
+            } else if (res.status === 429) {
+                message.error('Слишком много сообщений, попробуйте позже');
             } else {
                 message.error('Ошибка отправки');
             }
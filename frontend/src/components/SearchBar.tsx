@@ -11,8 +11,8 @@ interface SearchResult {
     title: string;
     slug: string;
     path: string;
-    headline: string;
-    rank: number;
+    headline?: string;
+    rank?: number;
 }
 
 interface SearchBarProps {
@@ -27,15 +27,17 @@ const SearchBar: React.FC<SearchBarProps> = ({ onSelect }) => {
     const [open, setOpen] = useState(false);
     const debounceRef = useRef<ReturnType<typeof setTimeout> | null>(null);
 
-    const doSearch = useCallback(async (value: string) => {
-        if (value.trim().length < 3) {
+    // Typing asks the in-memory suggest index; Enter runs the full-text search.
+    const doSearch = useCallback(async (value: string, suggest = false) => {
+        if (value.trim().length < (suggest ? 1 : 3)) {
             setResults([]);
             setOpen(false);
             return;
         }
         setLoading(true);
         try {
-            const res = await fetch(`${API_BASE_URL}/api/v1/search/?q=${encodeURIComponent(value)}`, {
+            const endpoint = suggest ? 'search/suggest' : 'search/';
+            const res = await fetch(`${API_BASE_URL}/api/v1/${endpoint}?q=${encodeURIComponent(value)}`, {
                 headers: tenantHeaders(token, currentRoom)
             });
             const data = await res.json();
@@ -56,7 +58,7 @@ const SearchBar: React.FC<SearchBarProps> = ({ onSelect }) => {
             return;
         }
         if (debounceRef.current) clearTimeout(debounceRef.current);
-        debounceRef.current = setTimeout(() => doSearch(value), 300);
+        debounceRef.current = setTimeout(() => doSearch(value, true), 150);
     };
 
     const content = (
@@ -77,7 +79,9 @@ const SearchBar: React.FC<SearchBarProps> = ({ onSelect }) => {
                                 <Text strong>{item.title}</Text>
                                 <br />
                                 <Text type="secondary" style={{ fontSize: 11 }}>
-                                    <span dangerouslySetInnerHTML={{ __html: item.headline }} />
+                                    {item.headline
+                                        ? <span dangerouslySetInnerHTML={{ __html: item.headline }} />
+                                        : item.slug}
                                 </Text>
                             </div>
                         </List.Item>
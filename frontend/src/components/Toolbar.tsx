@@ -2,18 +2,23 @@ import React, { useState, useEffect } from 'react';
 import { Button, Tooltip, Divider, Upload, message, theme, Popconfirm, Select } from 'antd';
 import Icon from './Icon';
 import type { Editor } from '@tiptap/react';
-import { API_BASE_URL } from '../config';
+import { uploadFiles } from '../media';
+import { useAuth } from '../contexts/AuthContext';
+import { useRoom } from '../contexts/RoomContext';
 
 interface ToolbarProps {
     editor: Editor | null;
     onSave?: () => void;
     onDelete?: () => void;
+    onCopy?: () => void;
     onSettings?: () => void;
     saving?: boolean;
 }
 
-const Toolbar: React.FC<ToolbarProps> = ({ editor, onSave, onDelete, onSettings, saving }) => {
+const Toolbar: React.FC<ToolbarProps> = ({ editor, onSave, onDelete, onCopy, onSettings, saving }) => {
     const { token } = theme.useToken();
+    const { token: authToken } = useAuth();
+    const { currentRoom } = useRoom();
 
     // Force re-render on editor state changes (selection, formatting)
     const [, setTick] = useState(0);
@@ -28,22 +33,7 @@ const Toolbar: React.FC<ToolbarProps> = ({ editor, onSave, onDelete, onSettings,
 
     const handleImageUpload = async (file: File) => {
         try {
-            // Get presigned upload URL
-            const res = await fetch(`${API_BASE_URL}/api/v1/media/upload-url?filename=${encodeURIComponent(file.name)}`, {
-                method: 'POST',
-            });
-            const { upload_url, object_key } = await res.json();
-
-            // Upload to MinIO
-            await fetch(upload_url, {
-                method: 'PUT',
-                body: file,
-                headers: { 'Content-Type': file.type },
-            });
-
-            // Get download URL
-            const dlRes = await fetch(`${API_BASE_URL}/api/v1/media/download-url?object_key=${encodeURIComponent(object_key)}`);
-            const { download_url } = await dlRes.json();
+            const [{ download_url }] = await uploadFiles([file], authToken, currentRoom);
 
             // Insert image into editor
             editor.chain().focus().setImage({ src: download_url }).run();
@@ -172,6 +162,11 @@ const Toolbar: React.FC<ToolbarProps> = ({ editor, onSave, onDelete, onSettings,
                     Настройки
                 </Button>
             )}
+            {onCopy && (
+                <Popconfirm title="Скопировать страницу вместе с дочерними?" onConfirm={onCopy} okText="Да" cancelText="Нет">
+                    <Button size="small" icon={<Icon name="content_copy" />}>Копировать</Button>
+                </Popconfirm>
+            )}
             {onSave && (
                 <Button type="primary" icon={<Icon name="save" />} size="small" loading={saving} onClick={onSave}>
                     Сохранить
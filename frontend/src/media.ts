@@ -0,0 +1,47 @@
+import { API_BASE_URL, tenantHeaders } from './config';
+
+export interface UploadedFile {
+    file: File;
+    object_key: string;
+    download_url: string;
+}
+
+// Uploads files straight to storage with presigned URLs. Upload and download
+// URLs are requested for all files at once, so a batch costs two API calls
+// no matter how many images it has.
+export const uploadFiles = async (files: File[], token: string | null, room: string): Promise<UploadedFile[]> => {
+    const headers = tenantHeaders(token, room);
+    const res = await fetch(`${API_BASE_URL}/api/v1/media/upload-urls`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify({ filenames: files.map(f => f.name) }),
+    });
+    if (!res.ok) throw new Error('upload urls failed');
+    const { uploads } = await res.json() as { uploads: { object_key: string; upload_url: string }[] };
+
+    await Promise.all(files.map(async (file, i) => {
+        const put = await fetch(uploads[i].upload_url, {
+            method: 'PUT',
+            body: file,
+            headers: { 'Content-Type': file.type },
+        });
+        if (!put.ok) throw new Error('upload failed');
+    }));
+
+    const urls = await downloadUrls(uploads.map(u => u.object_key), token, room);
+    return files.map((file, i) => ({
+        file,
+        object_key: uploads[i].object_key,
+        download_url: urls[uploads[i].object_key],
+    }));
+};
+
+export const downloadUrls = async (objectKeys: string[], token: string | null, room: string): Promise<Record<string, string>> => {
+    const res = await fetch(`${API_BASE_URL}/api/v1/media/download-urls`, {
+        method: 'POST',
+        headers: tenantHeaders(token, room),
+        body: JSON.stringify({ object_keys: objectKeys }),
+    });
+    if (!res.ok) throw new Error('download urls failed');
+    return (await res.json()).urls;
+};